@@ -1,68 +1,91 @@
 import numpy as np
 import torch
 from torch.utils import data
+from torch.utils.data.dataloader import default_collate
 import os
-from tqdm import tqdm, trange
+
+
+def load_array(file_name):
+    # memory map plain .npy files so that large feature dumps are paged in on demand,
+    # pickled object arrays cannot be mapped and are loaded as before
+    try:
+        return np.load(file_name, mmap_mode='r')
+    except ValueError:
+        return np.load(file_name, allow_pickle=True)
 
 
 class ASDataset(data.Dataset):
     def __init__(self, motion_file, image_file):
         self.pointer = 0
         self.window_length = 8
-        raw_motions = np.load(motion_file, allow_pickle=True) #motion[n,17,13]
-        raw_emb = np.load(image_file, allow_pickle=True) #img[n,1,512]
+        raw_motions = load_array(motion_file) #motion[n,17,13]
+        raw_emb = load_array(image_file) #img[n,1,512]
         max_length_motion = raw_motions.shape[0]
         max_length_emb = raw_emb.shape[0]
         assert max_length_motion == max_length_emb, "The length of motion and clip feature are not the same"
-        if max_length_motion % 16:
-            keep = max_length_motion - (max_length_motion % 16)
-            raw_motions = raw_motions[:keep, :, :]
-            raw_emb = raw_emb[:keep, :, :]
-        else:
-            keep = max_length_motion
-        data_dict = {}
-        name_list = []
-
-        for item in trange(keep-8):
-            try:
-                name_list.append(item)
-                motion = raw_motions[item, :15, :3]
-                img_emb = raw_emb[item, :, :]
-                n_motions = raw_motions[item: item + self.window_length, :15, :3]
-                # print(n_motions.shape[0])
-                n_embs = raw_emb[item: item + self.window_length, :, :]
-                data_dict[item] = {
-                    'motion': motion,
-                    'img_emb': img_emb,
-                    'n_motions': n_motions,
-                    'n_embs': n_embs,
-                    'length': 1,
-                    'm_id':item
-                    # 'length': self.window_length
-                }
-            except:
-                pass
-        self.data_dict = data_dict
-        self.name_list = name_list
+        keep = max_length_motion - (max_length_motion % 16)
+
+        # windows are strided views into the (mapped) arrays, nothing is copied until an item is read
+        self.motions = raw_motions[:keep, :15, :3]
+        self.img_embs = raw_emb[:keep]
+        self.motion_windows = self._build_windows(self.motions)
+        self.emb_windows = self._build_windows(self.img_embs)
+
+        self.num_windows = max(keep - self.window_length, 0)
+        self.name_list = list(range(self.num_windows))
         self.length_arr = max_length_motion
         # self.mean = mean
         # self.std = std
 
+    def _build_windows(self, arr):
+        if arr.shape[0] < self.window_length:
+            return np.zeros((0, self.window_length) + arr.shape[1:], dtype=arr.dtype)
+        windows = np.lib.stride_tricks.sliding_window_view(arr, self.window_length, axis=0)
+        return np.moveaxis(windows, -1, 1) #[n-7,8,...]
+
     def inv_transform(self, data):
         return data * self.std + self.mean
 
     def __len__(self):
-        return len(self.data_dict) - self.pointer
+        return self.num_windows - self.pointer
 
     def __getitem__(self, item):
-        motion = self.data_dict[item]['motion'] #[16,3]
-        img_emb = self.data_dict[item]['img_emb'] #[1,512]
-        n_motions = self.data_dict[item]['n_motions'] #[8,16,3]
-        n_embs = self.data_dict[item]['n_embs'].squeeze() #[8,512]
-        m_len = self.data_dict[item]['length']
-        m_id = self.data_dict[item]['m_id']
+        motion = np.array(self.motions[item]) #[15,3]
+        img_emb = np.array(self.img_embs[item]) #[1,512]
+        n_motions = np.array(self.motion_windows[item]) #[8,15,3]
+        n_embs = np.array(self.emb_windows[item]).squeeze() #[8,512]
+        m_len = 1
+        m_id = item
 
         # # Normalization
         # motion = (motion - self.mean) / self.std
 
         return motion, img_emb, n_motions, n_embs, m_len, m_id
+
+    def __getitems__(self, items):
+        # batched read used by the DataLoader, rows are fetched in sorted order to keep
+        # accesses to the mapped files sequential and then restored to the requested order
+        items = np.asarray(items, dtype=np.int64)
+        order = np.argsort(items, kind='stable')
+        sorted_items = items[order]
+        inv_order = np.empty_like(order)
+        inv_order[order] = np.arange(len(order))
+
+        motion = self.motions[sorted_items][inv_order] #[b,15,3]
+        img_emb = self.img_embs[sorted_items][inv_order] #[b,1,512]
+        n_motions = self.motion_windows[sorted_items][inv_order] #[b,8,15,3]
+        n_embs = self.emb_windows[sorted_items][inv_order] #[b,8,1,512]
+        if n_embs.ndim == 4 and n_embs.shape[2] == 1:
+            n_embs = n_embs[:, :, 0] #[b,8,512]
+        m_len = np.ones(len(items), dtype=np.int64)
+        m_id = items
+
+        return motion, img_emb, n_motions, n_embs, m_len, m_id
+
+    @staticmethod
+    def collate_batch(batch):
+        # collate_fn for batches produced by __getitems__, DataLoaders that predate __getitems__
+        # (torch < 2.0) pass a list of per item tuples, which use the default collate
+        if isinstance(batch, list):
+            return default_collate(batch)
+        return tuple(torch.from_numpy(np.ascontiguousarray(x)) for x in batch)
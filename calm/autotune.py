@@ -0,0 +1,236 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+import copy
+import functools
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import torch
+
+from rl_games.common.algo_observer import AlgoObserver
+
+import learning.autotune as autotune
+
+"""
+This script searches num_envs, horizon_length and minibatch_size for the highest training throughput
+under a memory ceiling. Every setting is probed with a few timed epochs of the real training loop of
+run.py, all arguments not listed below are passed on to run.py unchanged, e.g. --task, --cfg_env,
+--cfg_train, --llc_checkpoint or --render. The best setting is written as a config overlay that can
+be passed to run.py with --cfg_overlay. With --stand_in the probes run a cpu only stand-in env and
+policy instead, which requires neither Isaac Gym nor a gpu.
+
+python calm/autotune.py --num_envs_grid 512 1024 2048 --horizon_grid 4 8 --minibatch_grid 2048 4096 \
+    --max_memory_gb 20 --search bandit <run.py arguments>
+"""
+
+
+class ProbeObserver(AlgoObserver):
+    # measures the frames/s over the epochs after num_warmup from the training loop's own timer
+    def __init__(self, num_warmup):
+        super().__init__()
+        self._num_warmup = num_warmup
+        self._algo = None
+        self._warmup_time = None
+        self._last_epoch = 0
+        self._last_time = 0.0
+        return
+
+    def after_init(self, algo):
+        self._algo = algo
+        return
+
+    def after_print_stats(self, frame, epoch_num, total_time):
+        if epoch_num == self._num_warmup:
+            self._warmup_time = total_time
+        self._last_epoch = epoch_num
+        self._last_time = total_time
+        return
+
+    def get_steps_per_sec(self):
+        assert(self._warmup_time is not None and self._last_epoch > self._num_warmup), 'probe did not finish'
+        frames = (self._last_epoch - self._num_warmup) * self._algo.curr_frames
+        return frames / (self._last_time - self._warmup_time)
+
+
+def train_probe(run_argv, num_warmup, setting, num_epochs):
+    sys.argv = [sys.argv[0]] + run_argv
+    import run
+    from utils.config import get_args, set_np_formatting
+
+    set_np_formatting()
+    args = get_args()
+    if 'num_envs' in setting:
+        args.num_envs = setting['num_envs']
+    if 'horizon_length' in setting:
+        args.horizon_length = setting['horizon_length']
+    if 'minibatch_size' in setting:
+        args.minibatch_size = setting['minibatch_size']
+    # the training loop stops after max_epochs + 1 epochs
+    args.max_iterations = num_warmup + num_epochs - 1
+    args.track = False
+    args.output_path = tempfile.mkdtemp(prefix='autotune_')
+
+    try:
+        cfg, cfg_train = run.prepare_cfg(args)
+        cfg_train['params']['config']['save_frequency'] = 0
+
+        actor_learner_config = cfg_train['params']['config'].get('actor_learner', None) or {}
+        if actor_learner_config.get('num_actors', 0) > 0:
+            cfg_train['params']['config']['actor_init_fn'] = functools.partial(run.init_actor_process, args, cfg,
+                                                                                        copy.deepcopy(cfg_train))
+        run.args = args
+        run.cfg = cfg
+        run.cfg_train = cfg_train
+
+        observer = ProbeObserver(num_warmup)
+        runner = run.build_alg_runner(observer)
+        runner.load(cfg_train)
+        runner.reset()
+        runner.run(vars(args))
+    finally:
+        shutil.rmtree(args.output_path, ignore_errors=True)
+
+    return observer.get_steps_per_sec()
+
+
+def stand_in_probe(stand_in_args, num_warmup, setting, num_epochs):
+    from benchmarks.actor_learner import StandInActor, StandInPolicy, ppo_update
+
+    args = copy.copy(stand_in_args)
+    args.num_envs = setting['num_envs']
+    args.horizon_length = setting['horizon_length']
+    args.minibatch_size = setting['minibatch_size']
+    args.actor_threads = args.threads
+
+    torch.manual_seed(0)
+    actor = StandInActor(args, 0)
+    policy = StandInPolicy(args.obs_size, args.num_actions, args.units)
+    optimizer = torch.optim.Adam(policy.parameters(), 1e-4)
+
+    frames = 0
+    for epoch in range(num_warmup + num_epochs):
+        if epoch == num_warmup:
+            start = time.perf_counter()
+            frames = 0
+        actor.set_weights({'model': policy.state_dict()})
+        batch_dict, _ = actor.play_rollout()
+        frames += batch_dict.pop('played_frames')
+        ppo_update(policy, optimizer, batch_dict, args.mini_epochs, args.minibatch_size)
+    return frames / (time.perf_counter() - start)
+
+
+def build_overlay(best, search, stand_in):
+    setting = best['setting']
+    overlay = {'cfg_env': {}, 'cfg_train': {}}
+    if 'num_envs' in setting:
+        overlay['cfg_env'] = {'env': {'numEnvs': setting['num_envs']}}
+
+    train_config = {k: setting[k] for k in ['horizon_length', 'minibatch_size'] if k in setting}
+    if len(train_config) > 0:
+        overlay['cfg_train'] = {'params': {'config': train_config}}
+
+    overlay['autotune'] = {
+        'steps_per_sec': float(best['steps_per_sec']),
+        'peak_memory_gb': float(best['peak_memory'] / 1024 ** 3),
+        'search': search,
+        'stand_in': stand_in
+    }
+    return overlay
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_envs_grid", type=int, nargs="+", default=[512, 1024, 2048])
+    parser.add_argument("--horizon_grid", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--minibatch_grid", type=int, nargs="+", default=[2048, 4096, 8192])
+    parser.add_argument("--search", type=str, default="grid", choices=["grid", "bandit"])
+    parser.add_argument("--num_trials", type=int, default=0, help="Probe a random subset of the grid, 0 probes all")
+    parser.add_argument("--eta", type=int, default=2, help="Bandit search keeps the best 1/eta settings per round")
+    parser.add_argument("--num_epochs", type=int, default=3, help="Timed epochs per probe (first bandit round)")
+    parser.add_argument("--num_warmup", type=int, default=1, help="Untimed epochs at the start of every probe")
+    parser.add_argument("--max_memory_gb", type=float, default=0.0, help="Memory ceiling, 0 disables")
+    parser.add_argument("--timeout", type=float, default=0.0, help="Seconds before a probe is stopped, 0 disables")
+    parser.add_argument("--device", type=str, default="cuda:0", help="Device whose memory is measured")
+    parser.add_argument("--output", type=str, default="output/autotune.yaml")
+    parser.add_argument("--stand_in", action="store_true", default=False)
+    parser.add_argument("--obs_size", type=int, default=256)
+    parser.add_argument("--num_actions", type=int, default=28)
+    parser.add_argument("--units", type=int, default=512)
+    parser.add_argument("--sim_iters", type=int, default=4)
+    parser.add_argument("--mini_epochs", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=1)
+    args, run_argv = parser.parse_known_args()
+    assert(args.num_warmup >= 1)
+
+    if args.stand_in:
+        device = 'cpu'
+        probe_fn = functools.partial(stand_in_probe, args, args.num_warmup)
+    else:
+        device = args.device
+        probe_fn = functools.partial(train_probe, run_argv, args.num_warmup)
+
+    space = {
+        'num_envs': args.num_envs_grid,
+        'horizon_length': args.horizon_grid,
+        'minibatch_size': args.minibatch_grid
+    }
+    max_memory = args.max_memory_gb * 1024 ** 3 if args.max_memory_gb > 0 else None
+    timeout = args.timeout if args.timeout > 0 else None
+    tuner = autotune.Autotuner(probe_fn, space, device, max_memory=max_memory, num_epochs=args.num_epochs,
+                               search=args.search, num_trials=args.num_trials, eta=args.eta, timeout=timeout)
+    best = tuner.run()
+
+    from benchmarks.bench_utils import print_results
+    rows = []
+    for r in tuner.get_results():
+        name = ", ".join(["{}={}".format(k, v) for k, v in r['setting'].items()])
+        peak_memory = r['peak_memory'] / 1024 ** 3 if r['peak_memory'] is not None else None
+        steps_per_sec = r['steps_per_sec'] if r['error'] is None else None
+        rows.append((name, [steps_per_sec, peak_memory, r['num_epochs']]))
+    print_results("autotune ({})".format("stand-in" if args.stand_in else "train"),
+                  ["steps/s", "peak mem GB", "epochs"], rows)
+
+    if best is None:
+        print("No setting finished within the memory limit")
+        return
+
+    output_dir = os.path.dirname(args.output)
+    if output_dir != '':
+        os.makedirs(output_dir, exist_ok=True)
+    autotune.write_overlay(args.output, build_overlay(best, args.search, args.stand_in))
+    print("Best setting {} with {:.1f} steps/s, overlay written to {}".format(best['setting'], best['steps_per_sec'],
+                                                                             args.output))
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+import time
+
+import torch
+
+import learning.actor_learner as actor_learner
+
+from benchmarks.bench_utils import print_results
+
+
+class StandInVecEnv:
+    # vectorized env with linear dynamics, sim_iters extra matmuls per step stand in for the simulation cost
+    def __init__(self, num_envs, obs_size, num_actions, sim_iters, seed):
+        g = torch.Generator().manual_seed(seed)
+        self._num_envs = num_envs
+        self._sim_iters = sim_iters
+        self._a = torch.randn(obs_size, obs_size, generator=g) / obs_size ** 0.5
+        self._b = torch.randn(num_actions, obs_size, generator=g) / num_actions ** 0.5
+        self._obs = torch.randn(num_envs, obs_size, generator=g)
+        self._steps = torch.zeros(num_envs, dtype=torch.long)
+        return
+
+    def reset(self):
+        return self._obs
+
+    def step(self, actions):
+        state = self._obs
+        for _ in range(self._sim_iters):
+            state = torch.tanh(state @ self._a)
+        self._obs = 0.9 * state + 0.1 * torch.tanh(actions @ self._b)
+        rewards = -self._obs.pow(2).mean(dim=-1, keepdim=True)
+
+        self._steps += 1
+        dones = self._steps >= 100
+        self._steps[dones] = 0
+        self._obs[dones] = 0.0
+        return self._obs, rewards, dones
+
+
+class StandInPolicy(torch.nn.Module):
+    def __init__(self, obs_size, num_actions, units):
+        super().__init__()
+        self.mlp = torch.nn.Sequential(torch.nn.Linear(obs_size, units), torch.nn.ELU(),
+                                       torch.nn.Linear(units, units), torch.nn.ELU())
+        self.mu = torch.nn.Linear(units, num_actions)
+        self.value = torch.nn.Linear(units, 1)
+        self.logstd = torch.nn.Parameter(torch.full((num_actions,), -1.0))
+        return
+
+    def forward(self, obs):
+        x = self.mlp(obs)
+        return self.mu(x), self.logstd.exp().expand(obs.shape[0], -1), self.value(x)
+
+
+class StandInActor:
+    # plays rollouts of the stand-in policy in the batch_dict layout of CommonAgent.play_steps
+    def __init__(self, args, actor_id):
+        torch.set_num_threads(args.actor_threads)
+        self._horizon_length = args.horizon_length
+        self._env = StandInVecEnv(args.num_envs, args.obs_size, args.num_actions, args.sim_iters, seed=actor_id)
+        self._policy = StandInPolicy(args.obs_size, args.num_actions, args.units)
+        self._obs = self._env.reset()
+        return
+
+    def set_weights(self, weights):
+        self._policy.load_state_dict(weights['model'])
+        return
+
+    def get_weights(self):
+        return {'model': self._policy.state_dict()}
+
+    def play_rollout(self):
+        keys = ['obses', 'actions', 'neglogpacs', 'values', 'mus', 'sigmas', 'rewards', 'dones']
+        data = {k: [] for k in keys}
+        with torch.no_grad():
+            for _ in range(self._horizon_length):
+                mu, sigma, value = self._policy(self._obs)
+                distr = torch.distributions.Normal(mu, sigma)
+                actions = distr.sample()
+                obs, rewards, dones = self._env.step(actions)
+                for k, v in zip(keys, [self._obs, actions, -distr.log_prob(actions).sum(dim=-1), value, mu, sigma,
+                                       rewards, dones]):
+                    data[k].append(v.clone())
+                self._obs = obs
+
+        batch_dict = {k: torch.cat(v, dim=0) for k, v in data.items()}
+        batch_dict['played_frames'] = self._horizon_length * self._obs.shape[0]
+        return batch_dict, {}
+
+
+class StandInActorFn:
+    def __init__(self, args):
+        self._args = args
+        return
+
+    def __call__(self, actor_id):
+        return StandInActor(self._args, actor_id)
+
+
+def ppo_update(policy, optimizer, batch_dict, mini_epochs, minibatch_size, e_clip=0.2):
+    n = batch_dict['obses'].shape[0]
+    for _ in range(mini_epochs):
+        perm = torch.randperm(n)
+        for start in range(0, n, minibatch_size):
+            idx = perm[start:start + minibatch_size]
+            mu, sigma, _ = policy(batch_dict['obses'][idx])
+            logp = torch.distributions.Normal(mu, sigma).log_prob(batch_dict['actions'][idx]).sum(dim=-1)
+            ratio = torch.exp(logp + batch_dict['neglogpacs'][idx])
+            adv = batch_dict['rewards'][idx, 0]
+            loss = -torch.min(ratio * adv, torch.clamp(ratio, 1.0 - e_clip, 1.0 + e_clip) * adv).mean()
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+    return
+
+
+def run_sync(args):
+    actor = StandInActor(args, 0)
+    policy = StandInPolicy(args.obs_size, args.num_actions, args.units)
+    optimizer = torch.optim.Adam(policy.parameters(), 1e-4)
+
+    start = time.perf_counter()
+    frames = 0
+    for _ in range(args.num_epochs):
+        actor.set_weights({'model': policy.state_dict()})
+        batch_dict, _ = actor.play_rollout()
+        frames += batch_dict.pop('played_frames')
+        ppo_update(policy, optimizer, batch_dict, args.mini_epochs, args.minibatch_size)
+    elapsed = time.perf_counter() - start
+    return frames / elapsed, 0.0, 0
+
+
+def run_actor_learner(args, num_actors):
+    policy = StandInPolicy(args.obs_size, args.num_actions, args.units)
+    optimizer = torch.optim.Adam(policy.parameters(), 1e-4)
+    learner = actor_learner.ActorLearner(StandInActorFn(args), num_actors, {'model': policy.state_dict()}, 'cpu',
+                                         num_slots=args.num_slots, max_policy_lag=args.max_policy_lag)
+    try:
+        # the first rollout includes process start up and is not timed
+        batch_dict, _ = learner.get_rollout()
+
+        start = time.perf_counter()
+        frames = 0
+        lags = []
+        for _ in range(args.num_epochs):
+            batch_dict, info = learner.get_rollout()
+            frames += batch_dict.pop('played_frames')
+            lags.append(info['policy_lag'])
+            ppo_update(policy, optimizer, batch_dict, args.mini_epochs, args.minibatch_size)
+            learner.publish_weights({'model': policy.state_dict()})
+        elapsed = time.perf_counter() - start
+        num_dropped = learner.get_num_dropped()
+    finally:
+        learner.close()
+    return frames / elapsed, sum(lags) / len(lags), num_dropped
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_envs", type=int, default=512)
+    parser.add_argument("--obs_size", type=int, default=256)
+    parser.add_argument("--num_actions", type=int, default=28)
+    parser.add_argument("--units", type=int, default=512)
+    parser.add_argument("--horizon_length", type=int, default=16)
+    parser.add_argument("--sim_iters", type=int, default=4)
+    parser.add_argument("--mini_epochs", type=int, default=2)
+    parser.add_argument("--minibatch_size", type=int, default=2048)
+    parser.add_argument("--num_epochs", type=int, default=20)
+    parser.add_argument("--num_actors", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--num_slots", type=int, default=2)
+    parser.add_argument("--max_policy_lag", type=int, default=2)
+    parser.add_argument("--actor_threads", type=int, default=2)
+    parser.add_argument("--learner_threads", type=int, default=2)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    torch.set_num_threads(args.learner_threads)
+
+    rows = [("sync", list(run_sync(args)))]
+    for num_actors in args.num_actors:
+        rows.append(("actor_learner x{}".format(num_actors), list(run_actor_learner(args, num_actors))))
+    print_results("stand-in env (cpu)", ["frames/s", "mean lag", "dropped"], rows)
+    return
+
+if __name__ == '__main__':
+    main()
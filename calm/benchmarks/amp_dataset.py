@@ -0,0 +1,95 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+
+import torch
+
+from learning.amp_datasets import AMPDataset
+
+from benchmarks.bench_utils import benchmark, print_results
+
+
+def build_values_dict(batch_size, num_obs, num_actions, device):
+    # same keys as CommonAgent.prepare_dataset
+    values_dict = {
+        "old_values": torch.randn(batch_size, 1, device=device),
+        "old_logp_actions": torch.randn(batch_size, device=device),
+        "advantages": torch.randn(batch_size, device=device),
+        "returns": torch.randn(batch_size, 1, device=device),
+        "actions": torch.randn(batch_size, num_actions, device=device),
+        "obs": torch.randn(batch_size, num_obs, device=device),
+        "rnn_states": None,
+        "rnn_masks": None,
+        "mu": torch.randn(batch_size, num_actions, device=device),
+        "sigma": torch.randn(batch_size, num_actions, device=device),
+    }
+    return values_dict
+
+
+def run_epoch(dataset, values_dict, mini_epochs):
+    dataset.update_values_dict(dict(values_dict))
+    for _ in range(mini_epochs):
+        for i in range(len(dataset)):
+            input_dict = dataset[i]
+    if input_dict["obs"].is_cuda:
+        torch.cuda.synchronize(input_dict["obs"].device)
+    return
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--device", type=str, default="cuda:0" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--num_envs", type=int, default=1024)
+    parser.add_argument("--num_obs", type=int, default=253)
+    parser.add_argument("--num_actions", type=int, default=64)
+    parser.add_argument("--mini_epochs", type=int, default=6)
+    parser.add_argument("--num_iters", type=int, default=20)
+    args = parser.parse_args()
+
+    # horizon and minibatch sizes of spec_anyskill.yaml, including the commented alternatives
+    settings = [(4, 2048), (32, 2048), (32, 16384)]
+
+    for horizon_length, minibatch_size in settings:
+        batch_size = horizon_length * args.num_envs
+        minibatch_size = min(minibatch_size, batch_size)
+        values_dict = build_values_dict(batch_size, args.num_obs, args.num_actions, args.device)
+
+        rows = []
+        for name, packed in [("gather", False), ("packed", True)]:
+            dataset = AMPDataset(batch_size, minibatch_size, False, False, args.device, 1, packed=packed)
+            epoch_ms = benchmark(run_epoch, dataset, values_dict, args.mini_epochs, num_iters=args.num_iters)
+            num_samples = batch_size * args.mini_epochs
+            rows.append((name, [epoch_ms, num_samples / epoch_ms / 1000.0]))
+
+        title = "horizon={} batch={} minibatch={} ({})".format(horizon_length, batch_size, minibatch_size, args.device)
+        print_results(title, ["epoch (ms)", "samples (M/s)"], rows)
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import time
+
+import torch
+
+_compiled_kernels = {}
+
+
+def benchmark(fn, *args, num_iters=100, num_warmup=10):
+    # returns the mean wall time of fn(*args) in milliseconds
+    for _ in range(num_warmup):
+        fn(*args)
+    _sync(args)
+
+    start = time.perf_counter()
+    for _ in range(num_iters):
+        fn(*args)
+    _sync(args)
+    elapsed = time.perf_counter() - start
+    return 1000.0 * elapsed / num_iters
+
+
+def compile_kernel(module, name):
+    # torch.compile variant of the TorchScript kernel module.<name>, built from its eager function
+    # module._<name>. Falls back to the TorchScript kernel on torch < 2.0
+    key = (module.__name__, name)
+    if key not in _compiled_kernels:
+        if hasattr(torch, "compile"):
+            _compiled_kernels[key] = torch.compile(getattr(module, "_" + name), dynamic=True)
+        else:
+            _compiled_kernels[key] = getattr(module, name)
+    return _compiled_kernels[key]
+
+
+def print_results(title, columns, rows):
+    # rows: list of (name, [values]) with one value per column
+    name_width = max([len(r[0]) for r in rows] + [len(title)])
+    header = title.ljust(name_width) + "".join(["{:>16}".format(c) for c in columns])
+    print(header)
+    print("-" * len(header))
+    for name, values in rows:
+        line = name.ljust(name_width)
+        for v in values:
+            if v is None:
+                line += "{:>16}".format("-")
+            else:
+                line += "{:>16.4f}".format(v)
+        print(line)
+    print()
+    return
+
+
+def _sync(args):
+    for a in args:
+        if isinstance(a, torch.Tensor) and a.is_cuda:
+            torch.cuda.synchronize(a.device)
+            break
+    return
@@ -0,0 +1,157 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+
+import torch
+import yaml
+
+import learning.calm_models as calm_models
+import learning.calm_network_builder as calm_network_builder
+from rl_games.algos_torch.models import ModelA2CContinuousLogStd
+
+from benchmarks.bench_utils import benchmark, print_results
+
+
+def build_model(config_params, obs_size, num_actions, amp_obs_size, num_amp_obs_steps, device):
+    network_builder = calm_network_builder.CALMBuilder()
+    network_builder.load(config_params['network'])
+    net_config = {
+        'actions_num': num_actions,
+        'input_shape': (obs_size,),
+        'num_seqs': 1,
+        'value_size': 1,
+        'amp_input_shape': (amp_obs_size,),
+        'amp_obs_steps': num_amp_obs_steps,
+        'calm_latent_shape': (config_params['config']['latent_dim'],),
+    }
+    model = calm_models.ModelCALMContinuous(network_builder).build(net_config)
+    return model.to(device)
+
+
+def separate_forward(model, batch_dict):
+    # one call per observation group, as CALMAgent.calc_gradients evaluated the networks before
+    net = model.a2c_network
+    result = ModelA2CContinuousLogStd.Network.forward(model, batch_dict)
+    result['disc_agent_logit'] = net.eval_disc(batch_dict['amp_obs'])
+    result['disc_agent_replay_logit'] = net.eval_disc(batch_dict['amp_obs_replay'])
+    result['disc_demo_logit'] = net.eval_disc(batch_dict['amp_obs_demo'])
+    result['conditional_disc_agent_logit'] = net.eval_conditional_disc(batch_dict['amp_obs'], batch_dict['batched_calm_latents'])
+    result['conditional_disc_demo_logit'] = net.eval_conditional_disc(batch_dict['amp_obs_demo'], batch_dict['calm_latents_demo'])
+    result['conditional_disc_agent_replay_logit'] = net.eval_conditional_disc(batch_dict['amp_obs_replay'],
+                                                                               batch_dict['calm_latents_replay'])
+    result['conditional_disc_neg_demo_logit'] = net.eval_conditional_disc(batch_dict['amp_obs_demo'],
+                                                                           batch_dict['batched_calm_latents'])
+    return result
+
+
+def train_step(model, forward_fn, batch_dict):
+    # bce and demo gradient penalties of the disc and conditional disc losses plus the policy outputs
+    res_dict = forward_fn(model, batch_dict)
+    bce = torch.nn.BCEWithLogitsLoss()
+    amp_obs_demo = batch_dict['amp_obs_demo']
+    calm_latents_demo = batch_dict['calm_latents_demo']
+
+    loss = res_dict['mus'].square().mean() + res_dict['values'].square().mean()
+    for prefix, demo_inputs in [('disc', [amp_obs_demo]), ('conditional_disc', [amp_obs_demo, calm_latents_demo])]:
+        agent_logit = torch.cat([res_dict[prefix + '_agent_logit'], res_dict[prefix + '_agent_replay_logit']], dim=0)
+        demo_logit = res_dict[prefix + '_demo_logit']
+        loss = loss + 0.5 * (bce(agent_logit, torch.zeros_like(agent_logit)) + bce(demo_logit, torch.ones_like(demo_logit)))
+
+        demo_grads = torch.autograd.grad(demo_logit, demo_inputs, grad_outputs=torch.ones_like(demo_logit),
+                                         create_graph=True, retain_graph=True)
+        for g in demo_grads:
+            loss = loss + 5.0 * torch.mean(torch.sum(torch.square(g), dim=-1))
+    loss = loss + res_dict['conditional_disc_neg_demo_logit'].mean()
+
+    for param in model.parameters():
+        param.grad = None
+    loss.backward()
+    return loss.detach()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--device", type=str, default="cuda:0" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--config", type=str, default="data/cfg/train/rlg/calm_humanoid.yaml")
+    parser.add_argument("--obs_size", type=int, default=253)
+    parser.add_argument("--num_actions", type=int, default=31)
+    parser.add_argument("--num_amp_obs_steps", type=int, default=10)
+    parser.add_argument("--num_amp_obs_per_step", type=int, default=125)
+    parser.add_argument("--minibatch_size", type=int, default=4096)
+    parser.add_argument("--amp_minibatch_size", type=int, nargs="+", default=[256, 1024])
+    parser.add_argument("--num_iters", type=int, default=10)
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config_params = yaml.load(f, Loader=yaml.SafeLoader)['params']
+    latent_dim = config_params['config']['latent_dim']
+    amp_obs_size = args.num_amp_obs_steps * args.num_amp_obs_per_step
+
+    torch.manual_seed(0)
+    model = build_model(config_params, args.obs_size, args.num_actions, amp_obs_size, args.num_amp_obs_steps,
+                        args.device)
+    model.train()
+
+    for amp_minibatch_size in args.amp_minibatch_size:
+        def rand(n, size, scale=1.0):
+            return scale * torch.randn(n, size, device=args.device)
+
+        latents = torch.nn.functional.normalize(rand(args.minibatch_size, latent_dim), dim=-1)
+        batch_dict = {
+            'is_train': True,
+            'eval_disc': True,
+            'prev_actions': rand(args.minibatch_size, args.num_actions),
+            'obs': rand(args.minibatch_size, args.obs_size),
+            'calm_latents': latents,
+            'amp_obs': rand(amp_minibatch_size, amp_obs_size),
+            'amp_obs_replay': rand(amp_minibatch_size, amp_obs_size),
+            'amp_obs_demo': rand(amp_minibatch_size, amp_obs_size, 0.5).requires_grad_(True),
+            'batched_calm_latents': latents[0:amp_minibatch_size],
+            'calm_latents_replay': torch.nn.functional.normalize(rand(amp_minibatch_size, latent_dim), dim=-1),
+            'calm_latents_demo': torch.nn.functional.normalize(rand(amp_minibatch_size, latent_dim), dim=-1).requires_grad_(True),
+        }
+
+        ref_loss = train_step(model, separate_forward, batch_dict)
+        ref_grads = [p.grad.clone() for p in model.parameters() if p.grad is not None]
+
+        rows = []
+        for name, forward_fn in [('separate', separate_forward), ('concatenated', type(model).forward)]:
+            loss = train_step(model, forward_fn, batch_dict)
+            grads = [p.grad for p in model.parameters() if p.grad is not None]
+            loss_err = (loss - ref_loss).abs().item()
+            grad_err = max([((g - r).abs().max() / r.abs().max().clamp_min(1e-12)).item() for g, r in zip(grads, ref_grads)])
+            step_ms = benchmark(train_step, model, forward_fn, batch_dict, num_iters=args.num_iters, num_warmup=2)
+            rows.append((name, [step_ms, loss_err, grad_err]))
+
+        title = "amp_minibatch={} ({})".format(amp_minibatch_size, args.device)
+        print_results(title, ["step (ms)", "loss abs err", "grad rel err"], rows)
+    return
+
+if __name__ == '__main__':
+    main()
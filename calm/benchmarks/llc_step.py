@@ -0,0 +1,126 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+import os
+import tempfile
+import types
+
+import numpy as np
+import torch
+import yaml
+
+import learning.calm_models as calm_models
+import learning.calm_network_builder as calm_network_builder
+import learning.llc_inference as llc_inference
+
+from benchmarks.bench_utils import benchmark, print_results
+
+
+def build_checkpoint(config_params, obs_size, num_actions, amp_obs_size, num_amp_obs_steps, file_name):
+    # randomly initialized CALM model and normalizers in the checkpoint layout of CALMAgent
+    network_builder = calm_network_builder.CALMBuilder()
+    network_builder.load(config_params['network'])
+    net_config = {
+        'actions_num': num_actions,
+        'input_shape': (obs_size,),
+        'num_seqs': 1,
+        'value_size': 1,
+        'amp_input_shape': (amp_obs_size,),
+        'amp_obs_steps': num_amp_obs_steps,
+        'calm_latent_shape': (config_params['config']['latent_dim'],),
+    }
+    model = calm_models.ModelCALMContinuous(network_builder).build(net_config)
+
+    num_amp_obs_per_step = amp_obs_size // num_amp_obs_steps
+    state = {
+        'model': model.state_dict(),
+        'running_mean_std': {
+            'running_mean': torch.randn(obs_size, dtype=torch.float64),
+            'running_var': torch.rand(obs_size, dtype=torch.float64) + 0.1,
+            'count': torch.ones((), dtype=torch.float64),
+        },
+        'amp_input_mean_std': {
+            'running_mean': torch.randn(num_amp_obs_per_step, dtype=torch.float64),
+            'running_var': torch.rand(num_amp_obs_per_step, dtype=torch.float64) + 0.1,
+            'count': torch.ones((), dtype=torch.float64),
+        },
+    }
+    torch.save(state, file_name)
+    return
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--device", type=str, default="cuda:0" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--llc_config", type=str, default="data/cfg/train/rlg/calm_humanoid.yaml")
+    parser.add_argument("--num_envs", type=int, nargs="+", default=[256, 1024, 4096])
+    parser.add_argument("--obs_size", type=int, default=253)
+    parser.add_argument("--num_actions", type=int, default=31)
+    parser.add_argument("--num_amp_obs_steps", type=int, default=10)
+    parser.add_argument("--num_amp_obs_per_step", type=int, default=125)
+    parser.add_argument("--num_iters", type=int, default=50)
+    parser.add_argument("--compile", action="store_true", help="also time the torch.compile step")
+    args = parser.parse_args()
+
+    with open(args.llc_config, 'r') as f:
+        config_params = yaml.load(f, Loader=yaml.SafeLoader)['params']
+    latent_dim = config_params['config']['latent_dim']
+    amp_obs_size = args.num_amp_obs_steps * args.num_amp_obs_per_step
+    action_space = types.SimpleNamespace(shape=(args.num_actions,),
+                                         low=-np.ones(args.num_actions, dtype=np.float32),
+                                         high=np.ones(args.num_actions, dtype=np.float32))
+
+    torch.manual_seed(0)
+    modes = ['eager', 'script'] + (['compile'] if args.compile else [])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        checkpoint_file = os.path.join(tmp_dir, 'llc.pth')
+        build_checkpoint(config_params, args.obs_size, args.num_actions, amp_obs_size, args.num_amp_obs_steps,
+                         checkpoint_file)
+        llcs = {}
+        for mode in modes:
+            llcs[mode] = llc_inference.LLCInference(config_params, args.obs_size, action_space, amp_obs_size,
+                                                    args.num_amp_obs_steps, args.device, step_mode=mode)
+            llcs[mode].restore(checkpoint_file)
+
+    for num_envs in args.num_envs:
+        obs = 3.0 * torch.randn(num_envs, args.obs_size, device=args.device)
+        latents = torch.randn(num_envs, latent_dim, device=args.device)
+        ref_action = llcs['eager'].compute_action(obs, latents)
+
+        rows = []
+        for mode in modes:
+            llc = llcs[mode]
+            max_err = (llc.compute_action(obs, latents) - ref_action).abs().max().item()
+            step_ms = benchmark(llc.compute_action, obs, latents, num_iters=args.num_iters)
+            rows.append((mode, [step_ms, max_err]))
+        print_results("num_envs={} ({})".format(num_envs, args.device), ["step (ms)", "max abs err"], rows)
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import argparse
+import copy
+
+import torch
+from torch import nn
+
+import learning.mixed_precision as mixed_precision
+
+from benchmarks.bench_utils import benchmark, print_results
+
+
+def build_disc(input_size, units):
+    layers = []
+    for u in units:
+        layers += [nn.Linear(input_size, u), nn.ReLU()]
+        input_size = u
+    layers.append(nn.Linear(input_size, 1))
+    return nn.Sequential(*layers)
+
+
+def disc_step(disc, optimizer, scaler, agent_obs, demo_obs, args, dtype):
+    # same structure as AMPAgent._disc_loss: bce on agent/demo logits plus the demo gradient penalty
+    demo_obs = demo_obs.clone().requires_grad_(True)
+    with mixed_precision.autocast(args.device, dtype != torch.float32, dtype if dtype != torch.float32 else torch.float16):
+        agent_logit = disc(agent_obs)
+        demo_logit = disc(demo_obs)
+        bce = nn.BCEWithLogitsLoss()
+        disc_loss = 0.5 * (bce(agent_logit, torch.zeros_like(agent_logit)) + bce(demo_logit, torch.ones_like(demo_logit)))
+
+        demo_grad = mixed_precision.penalty_grads(demo_logit, demo_obs, scaler)[0]
+        grad_penalty = torch.mean(torch.sum(torch.square(demo_grad), dim=-1))
+        loss = disc_loss + args.grad_penalty * grad_penalty
+
+    optimizer.zero_grad(set_to_none=True)
+    scaler.scale(loss).backward()
+    scaler.unscale_(optimizer)
+    nn.utils.clip_grad_norm_(disc.parameters(), 1.0)
+    scaler.step(optimizer)
+    scaler.update()
+    return disc_loss.detach(), grad_penalty.detach()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--device", type=str, default="cuda:0" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--amp_obs_size", type=int, default=1300)
+    parser.add_argument("--minibatch_size", type=int, default=1024)
+    parser.add_argument("--grad_penalty", type=float, default=5.0)
+    parser.add_argument("--num_iters", type=int, default=20)
+    parser.add_argument("--num_train_steps", type=int, default=200)
+    args = parser.parse_args()
+
+    # discriminator sizes of calm_humanoid.yaml
+    torch.manual_seed(0)
+    disc0 = build_disc(args.amp_obs_size, [1024, 1024, 512]).to(args.device)
+    agent_obs = torch.randn(args.minibatch_size, args.amp_obs_size, device=args.device)
+    demo_obs = torch.randn(args.minibatch_size, args.amp_obs_size, device=args.device) + 0.5
+
+    dtypes = [("fp32", torch.float32), ("bf16", torch.bfloat16)]
+    if torch.device(args.device).type == 'cuda':
+        dtypes.append(("fp16", torch.float16))
+
+    rows = []
+    ref_penalty = None
+    for name, dtype in dtypes:
+        disc = copy.deepcopy(disc0)
+        optimizer = torch.optim.Adam(disc.parameters(), lr=1e-4)
+        scaler = torch.cuda.amp.GradScaler(enabled=(dtype == torch.float16))
+
+        # penalty of the initial weights, compared against fp32
+        eval_disc = copy.deepcopy(disc)
+        _, penalty = disc_step(eval_disc, torch.optim.SGD(eval_disc.parameters(), lr=0.0), scaler,
+                               agent_obs, demo_obs, args, dtype)
+        if ref_penalty is None:
+            ref_penalty = penalty
+        penalty_err = ((penalty - ref_penalty).abs() / ref_penalty.abs()).item()
+
+        step_ms = benchmark(disc_step, eval_disc, torch.optim.SGD(eval_disc.parameters(), lr=0.0), scaler,
+                            agent_obs, demo_obs, args, dtype, num_iters=args.num_iters)
+
+        # short training run on the same data to compare learning curves
+        for _ in range(args.num_train_steps):
+            disc_loss, penalty = disc_step(disc, optimizer, scaler, agent_obs, demo_obs, args, dtype)
+        rows.append((name, [step_ms, penalty_err, disc_loss.item(), penalty.item()]))
+
+    title = "minibatch={} ({})".format(args.minibatch_size, args.device)
+    print_results(title, ["step (ms)", "penalty rel err", "final loss", "final penalty"], rows)
+    return
+
+if __name__ == '__main__':
+    main()
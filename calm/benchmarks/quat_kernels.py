@@ -0,0 +1,105 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+
+import torch
+
+from isaacgym import torch_utils as gym_torch_utils
+from utils import torch_utils
+from utils import quat_kernels
+
+from benchmarks.bench_utils import benchmark, compile_kernel, print_results
+
+
+def _rand_quat(n, device):
+    q = torch.randn(n, 4, device=device)
+    return q / torch.norm(q, dim=-1, keepdim=True)
+
+
+def _heading_rotate_ref(q, v):
+    heading_rot = torch_utils.calc_heading_quat_inv(q)
+    heading_rot = heading_rot.unsqueeze(-2).repeat((1, v.shape[1], 1))
+    flat_v = v.reshape(-1, 3)
+    return gym_torch_utils.quat_rotate(heading_rot.reshape(-1, 4), flat_v).reshape(v.shape)
+
+
+def build_cases(n, num_bodies, device):
+    q0 = _rand_quat(n, device)
+    q1 = _rand_quat(n, device)
+    t = torch.rand(n, 1, device=device)
+    v = torch.randn(n, 3, device=device)
+    body_v = torch.randn(n, num_bodies, 3, device=device)
+    exp_map = torch.randn(n, 3, device=device)
+
+    # name -> (reference, kernel name, args, kernel args)
+    cases = {
+        "quat_mul": (gym_torch_utils.quat_mul, "quat_mul", (q0, q1), (q0, q1)),
+        "quat_rotate": (gym_torch_utils.quat_rotate, "quat_rotate", (q0, v), (q0, v)),
+        "slerp": (torch_utils.slerp, "slerp", (q0, q1, t), (q0, q1, t)),
+        "nlerp (vs slerp)": (torch_utils.slerp, "nlerp", (q0, q1, t), (q0, q1, t)),
+        "quat_to_exp_map": (torch_utils.quat_to_exp_map, "quat_to_exp_map", (q0,), (q0,)),
+        "exp_map_to_quat": (torch_utils.exp_map_to_quat, "exp_map_to_quat", (exp_map,), (exp_map,)),
+        "quat_to_tan_norm": (torch_utils.quat_to_tan_norm, "quat_to_tan_norm", (q0,), (q0,)),
+        "calc_heading_quat_inv": (torch_utils.calc_heading_quat_inv, "calc_heading_quat_inv", (q0,), (q0,)),
+        "heading_rotate_inv": (_heading_rotate_ref, "heading_rotate_inv", (q0, body_v),
+                               (q0.unsqueeze(-2), body_v)),
+    }
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--device", type=str, default="cuda:0" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4096, 65536, 1048576])
+    parser.add_argument("--num_bodies", type=int, default=15)
+    parser.add_argument("--num_iters", type=int, default=100)
+    parser.add_argument("--compile", action="store_true", default=False)
+    args = parser.parse_args()
+
+    columns = ["current (ms)", "kernel (ms)", "speedup"]
+    if args.compile:
+        columns += ["compiled (ms)"]
+
+    for n in args.sizes:
+        rows = []
+        cases = build_cases(n, args.num_bodies, args.device)
+        for name, (ref_fn, kernel_name, ref_args, kernel_args) in cases.items():
+            ref_ms = benchmark(ref_fn, *ref_args, num_iters=args.num_iters)
+            kernel_ms = benchmark(getattr(quat_kernels, kernel_name), *kernel_args, num_iters=args.num_iters)
+            values = [ref_ms, kernel_ms, ref_ms / kernel_ms]
+            if args.compile:
+                compiled_fn = compile_kernel(quat_kernels, kernel_name)
+                values.append(benchmark(compiled_fn, *kernel_args, num_iters=args.num_iters))
+            rows.append((name, values))
+        print_results("n={} ({})".format(n, args.device), columns, rows)
+
+    return
+
+if __name__ == '__main__':
+    main()
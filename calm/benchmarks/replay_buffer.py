@@ -0,0 +1,111 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+
+import torch
+
+from learning.replay_buffer import ReplayBuffer
+
+from benchmarks.bench_utils import benchmark, print_results
+
+
+class PerKeyReplayBuffer:
+    # previous layout with one tensor per key, kept here as the baseline
+    def __init__(self, buffer_size, device):
+        self._head = 0
+        self._total_count = 0
+        self._buffer_size = buffer_size
+        self._device = device
+        self._data_buf = None
+        self._sample_idx = torch.randperm(buffer_size)
+        self._sample_head = 0
+        return
+
+    def store(self, data_dict):
+        if self._data_buf is None:
+            self._data_buf = {k: torch.zeros((self._buffer_size,) + v.shape[1:], device=self._device)
+                              for k, v in data_dict.items()}
+
+        n = next(iter(data_dict.values())).shape[0]
+        for key, curr_buf in self._data_buf.items():
+            store_n = min(n, self._buffer_size - self._head)
+            curr_buf[self._head:(self._head + store_n)] = data_dict[key][:store_n]
+            remainder = n - store_n
+            if remainder > 0:
+                curr_buf[0:remainder] = data_dict[key][store_n:]
+
+        self._head = (self._head + n) % self._buffer_size
+        self._total_count += n
+        return
+
+    def sample(self, n):
+        idx = torch.arange(self._sample_head, self._sample_head + n) % self._buffer_size
+        rand_idx = self._sample_idx[idx]
+        if self._total_count < self._buffer_size:
+            rand_idx = rand_idx % self._head
+
+        samples = {k: v[rand_idx] for k, v in self._data_buf.items()}
+        self._sample_head += n
+        if self._sample_head >= self._buffer_size:
+            self._sample_idx[:] = torch.randperm(self._buffer_size)
+            self._sample_head = 0
+        return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--device", type=str, default="cuda:0" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--buffer_size", type=int, default=50000)
+    parser.add_argument("--batch_size", type=int, default=32768)
+    parser.add_argument("--amp_obs_size", type=int, default=130)
+    parser.add_argument("--num_amp_obs_steps", type=int, default=10)
+    parser.add_argument("--num_enc_obs_steps", type=int, default=60)
+    parser.add_argument("--num_iters", type=int, default=50)
+    args = parser.parse_args()
+
+    # same keys and shapes as the CALM amp replay buffer
+    n = min(args.batch_size, args.buffer_size)
+    data = {
+        "amp_obs": torch.randn(n, args.num_amp_obs_steps * args.amp_obs_size, device=args.device),
+        "enc_amp_obs": torch.randn(n, args.num_enc_obs_steps * args.amp_obs_size, device=args.device),
+    }
+
+    rows = []
+    for name, buf in [("per-key", PerKeyReplayBuffer(args.buffer_size, args.device)),
+                      ("packed", ReplayBuffer(args.buffer_size, args.device))]:
+        store_ms = benchmark(buf.store, data, num_iters=args.num_iters)
+        sample_ms = benchmark(buf.sample, n, num_iters=args.num_iters)
+        rows.append((name, [store_ms, sample_ms, n / store_ms / 1000.0, n / sample_ms / 1000.0]))
+
+    title = "buffer={} n={} ({})".format(args.buffer_size, n, args.device)
+    print_results(title, ["store (ms)", "sample (ms)", "store (M/s)", "sample (M/s)"], rows)
+    return
+
+if __name__ == '__main__':
+    main()
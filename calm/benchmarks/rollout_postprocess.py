@@ -0,0 +1,150 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import argparse
+
+import torch
+
+import learning.rollout_postprocess as rollout_postprocess
+
+from benchmarks.bench_utils import benchmark, compile_kernel, print_results
+
+
+def _swap_and_flatten01(arr):
+    s = arr.size()
+    return arr.transpose(0, 1).reshape(s[0] * s[1], *s[2:])
+
+
+def returns_loop(rollout, weights, gamma, tau):
+    # previous per-agent reward mixing and GAE, kept here as the baseline
+    horizon_length = rollout['rewards'].shape[0]
+    mb_fdones = rollout['dones'].float()
+    mb_values = rollout['values']
+    mb_next_values = rollout['next_values']
+    mb_rewards = weights[0] * rollout['rewards'] + weights[1] * rollout['disc_rewards'] \
+                 + weights[2] * rollout['conditional_disc_rewards']
+
+    lastgaelam = 0
+    mb_advs = torch.zeros_like(mb_rewards)
+    for t in reversed(range(horizon_length)):
+        not_done = 1.0 - mb_fdones[t]
+        not_done = not_done.unsqueeze(1)
+        delta = mb_rewards[t] + gamma * mb_next_values[t] - mb_values[t]
+        lastgaelam = delta + gamma * tau * not_done * lastgaelam
+        mb_advs[t] = lastgaelam
+    mb_returns = mb_advs + mb_values
+    return mb_returns
+
+
+def postprocess_loop(rollout, weights, gamma, tau):
+    mb_returns = returns_loop(rollout, weights, gamma, tau)
+    batch_dict = {k: _swap_and_flatten01(v) for k, v in rollout.items()}
+    batch_dict['returns'] = _swap_and_flatten01(mb_returns)
+    return batch_dict
+
+
+def returns_fused(rollout, weights, gamma, tau, kernels):
+    combine_rewards, compute_returns, swap_and_flatten01 = kernels
+    mb_fdones = rollout['dones'].float()
+    mb_rewards = combine_rewards([rollout['rewards'], rollout['disc_rewards'], rollout['conditional_disc_rewards']],
+                                 weights)
+    mb_advs, mb_returns = compute_returns(mb_fdones, rollout['values'], mb_rewards, rollout['next_values'],
+                                          gamma, tau)
+    return mb_returns
+
+
+def postprocess_fused(rollout, weights, gamma, tau, kernels):
+    swap_and_flatten01 = kernels[2]
+    mb_returns = returns_fused(rollout, weights, gamma, tau, kernels)
+    batch_dict = {k: swap_and_flatten01(v) for k, v in rollout.items()}
+    batch_dict['returns'] = swap_and_flatten01(mb_returns)
+    return batch_dict
+
+
+def build_rollout(horizon_length, num_envs, args):
+    # experience keys of the CALM agent
+    shape = (horizon_length, num_envs)
+    rollout = {
+        'obses': torch.randn(shape + (args.num_obs,), device=args.device),
+        'actions': torch.randn(shape + (args.num_actions,), device=args.device),
+        'mus': torch.randn(shape + (args.num_actions,), device=args.device),
+        'sigmas': torch.randn(shape + (args.num_actions,), device=args.device),
+        'neglogpacs': torch.randn(shape, device=args.device),
+        'values': torch.randn(shape + (1,), device=args.device),
+        'next_values': torch.randn(shape + (1,), device=args.device),
+        'rewards': torch.randn(shape + (1,), device=args.device),
+        'disc_rewards': torch.randn(shape + (1,), device=args.device),
+        'conditional_disc_rewards': torch.randn(shape + (1,), device=args.device),
+        'dones': torch.rand(shape, device=args.device) < 0.02,
+        'amp_obs': torch.randn(shape + (args.num_amp_obs,), device=args.device),
+        'calm_latents': torch.randn(shape + (64,), device=args.device),
+        'rand_action_mask': torch.ones(shape, device=args.device),
+    }
+    return rollout
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--device", type=str, default="cuda:0" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--num_envs", type=int, default=1024)
+    parser.add_argument("--num_obs", type=int, default=253)
+    parser.add_argument("--num_actions", type=int, default=31)
+    parser.add_argument("--num_amp_obs", type=int, default=1300)
+    parser.add_argument("--num_iters", type=int, default=20)
+    parser.add_argument("--compile", action="store_true")
+    args = parser.parse_args()
+
+    gamma, tau = 0.99, 0.95
+    weights = [0.0, 1.0, 1.0]
+    script_kernels = (rollout_postprocess.combine_rewards, rollout_postprocess.compute_returns,
+                      rollout_postprocess.swap_and_flatten01)
+    variants = [("loop", returns_loop, postprocess_loop, ()),
+                ("fused (script)", returns_fused, postprocess_fused, (script_kernels,))]
+    if args.compile:
+        compiled_kernels = tuple(compile_kernel(rollout_postprocess, name) for name in
+                                 ["combine_rewards", "compute_returns", "swap_and_flatten01"])
+        variants.append(("fused (compile)", returns_fused, postprocess_fused, (compiled_kernels,)))
+
+    rows = []
+    for horizon_length in [4, 8, 16, 32, 64]:
+        rollout = build_rollout(horizon_length, args.num_envs, args)
+        ref = returns_loop(rollout, weights, gamma, tau)
+        for name, returns_fn, postprocess_fn, extra_args in variants:
+            max_err = (returns_fn(rollout, weights, gamma, tau, *extra_args) - ref).abs().max().item()
+            # the values tensor is passed along so that benchmark() can synchronize on its device
+            returns_ms = benchmark(lambda r, *_: returns_fn(r, weights, gamma, tau, *extra_args),
+                                   rollout, rollout['values'], num_iters=args.num_iters)
+            total_ms = benchmark(lambda r, *_: postprocess_fn(r, weights, gamma, tau, *extra_args),
+                                 rollout, rollout['values'], num_iters=args.num_iters)
+            rows.append(("H={} {}".format(horizon_length, name), [returns_ms, total_ms, max_err]))
+
+    title = "num_envs={} ({})".format(args.num_envs, args.device)
+    print_results(title, ["returns (ms)", "total (ms)", "max err"], rows)
+    return
+
+if __name__ == '__main__':
+    main()
@@ -35,6 +35,7 @@ from isaacgym import gymapi
 from isaacgym.torch_utils import *
 
 from utils import torch_utils
+from utils import quat_kernels
 
 from env.tasks.base_task import BaseTask
 
@@ -619,14 +620,14 @@ def dof_to_obs(pose, dof_obs_size, dof_offsets):
 
         # assume this is a spherical joint
         if dof_size == 3:
-            joint_pose_q = torch_utils.exp_map_to_quat(joint_pose)
+            joint_pose_q = quat_kernels.exp_map_to_quat(joint_pose)
         elif dof_size == 1:
             axis = torch.tensor([0.0, 1.0, 0.0], dtype=joint_pose.dtype, device=pose.device)
             joint_pose_q = quat_from_angle_axis(joint_pose[..., 0], axis)
         else:
             assert False, "Unsupported joint type"
 
-        joint_dof_obs = torch_utils.quat_to_tan_norm(joint_pose_q)
+        joint_dof_obs = quat_kernels.quat_to_tan_norm(joint_pose_q)
         dof_obs[:, (j * joint_obs_size):((j + 1) * joint_obs_size)] = joint_dof_obs
 
     assert((num_joints * joint_obs_size) == dof_obs_size)
@@ -638,32 +639,25 @@ def compute_humanoid_observations(root_pos, root_rot, root_vel, root_ang_vel, do
                                   local_root_obs, root_height_obs, dof_obs_size, dof_offsets):
     # type: (Tensor, Tensor, Tensor, Tensor, Tensor, Tensor, Tensor, bool, bool, int, List[int]) -> Tensor
     root_h = root_pos[:, 2:3]
-    heading_rot = torch_utils.calc_heading_quat_inv(root_rot)
 
     if local_root_obs:
-        root_rot_obs = quat_mul(heading_rot, root_rot)
+        heading_rot = quat_kernels.calc_heading_quat_inv(root_rot)
+        root_rot_obs = quat_kernels.quat_mul(heading_rot, root_rot)
     else:
         root_rot_obs = root_rot
-    root_rot_obs = torch_utils.quat_to_tan_norm(root_rot_obs)
+    root_rot_obs = quat_kernels.quat_to_tan_norm(root_rot_obs)
     
     if not root_height_obs:
         root_h_obs = torch.zeros_like(root_h)
     else:
         root_h_obs = root_h
     
-    local_root_vel = quat_rotate(heading_rot, root_vel)
-    local_root_ang_vel = quat_rotate(heading_rot, root_ang_vel)
+    local_root_vel = quat_kernels.heading_rotate_inv(root_rot, root_vel)
+    local_root_ang_vel = quat_kernels.heading_rotate_inv(root_rot, root_ang_vel)
 
-    root_pos_expand = root_pos.unsqueeze(-2)
-    local_key_body_pos = key_body_pos - root_pos_expand
-    
-    heading_rot_expand = heading_rot.unsqueeze(-2)
-    heading_rot_expand = heading_rot_expand.repeat((1, local_key_body_pos.shape[1], 1))
-    flat_end_pos = local_key_body_pos.view(local_key_body_pos.shape[0] * local_key_body_pos.shape[1], local_key_body_pos.shape[2])
-    flat_heading_rot = heading_rot_expand.view(heading_rot_expand.shape[0] * heading_rot_expand.shape[1], 
-                                               heading_rot_expand.shape[2])
-    local_end_pos = quat_rotate(flat_heading_rot, flat_end_pos)
-    flat_local_key_pos = local_end_pos.view(local_key_body_pos.shape[0], local_key_body_pos.shape[1] * local_key_body_pos.shape[2])
+    local_key_body_pos = key_body_pos - root_pos.unsqueeze(-2)
+    local_end_pos = quat_kernels.heading_rotate_inv(root_rot.unsqueeze(-2), local_key_body_pos)
+    flat_local_key_pos = local_end_pos.reshape(local_end_pos.shape[0], local_end_pos.shape[1] * local_end_pos.shape[2])
 
     dof_obs = dof_to_obs(dof_pos, dof_obs_size, dof_offsets)
 
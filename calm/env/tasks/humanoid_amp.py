@@ -34,7 +34,7 @@ from env.tasks.humanoid import Humanoid, dof_to_obs
 from utils.motion_lib import MotionLib
 from isaacgym.torch_utils import *
 
-from utils import torch_utils
+from utils import quat_kernels
 
 
 class HumanoidAMP(Humanoid):
@@ -90,13 +90,13 @@ class HumanoidAMP(Humanoid):
     def get_num_enc_amp_obs(self):
         return self._num_amp_obs_enc_steps * self._num_amp_obs_per_step
 
-    def fetch_amp_obs_demo(self, num_samples):
-        motion_ids = self._motion_lib.sample_motions(num_samples)
+    def fetch_amp_obs_demo(self, num_samples, generator=None):
+        motion_ids = self._motion_lib.sample_motions(num_samples, generator=generator)
 
         # since negative times are added to these values in build_amp_obs_demo,
         # we shift them into the range [0 + truncate_time, end of clip]
         truncate_time = self.dt * (self._num_amp_obs_steps - 1)
-        motion_times0 = self._motion_lib.sample_time(motion_ids, truncate_time=truncate_time)
+        motion_times0 = self._motion_lib.sample_time(motion_ids, truncate_time=truncate_time, generator=generator)
         motion_times0 += truncate_time
 
         amp_obs_demo_flat = self.build_amp_obs_demo(motion_ids, motion_times0, self._num_amp_obs_steps).to(self.device).view(-1, self.get_num_amp_obs())
@@ -122,20 +122,20 @@ class HumanoidAMP(Humanoid):
 
         return motion_ids, enc_motion_times, enc_amp_obs_demo_flat
 
-    def fetch_amp_obs_demo_enc_pair(self, num_samples):
-        motion_ids = self._motion_lib.sample_motions(num_samples)
+    def fetch_amp_obs_demo_enc_pair(self, num_samples, generator=None):
+        motion_ids = self._motion_lib.sample_motions(num_samples, generator=generator)
 
         # since negative times are added to these values in build_amp_obs_demo,
         # we shift them into the range [0 + truncate_time, end of clip]
         enc_window_size = self.dt * (self._num_amp_obs_enc_steps - 1)  #encode_steps == 60
 
-        enc_motion_times = self._motion_lib.sample_time(motion_ids, truncate_time=enc_window_size)
+        enc_motion_times = self._motion_lib.sample_time(motion_ids, truncate_time=enc_window_size, generator=generator)
         # make sure not to add more than motion clip length, negative amp_obs will show zero index amp_obs instead
         enc_motion_times += torch.clip(self._motion_lib._motion_lengths[motion_ids], max=enc_window_size)
 
         # sub-window-size is for the amp_obs contained within the enc-amp-obs. make sure we sample only within the valid portion of the motion
         sub_window_size = torch.clip(self._motion_lib._motion_lengths[motion_ids], max=enc_window_size) - self.dt * self._num_amp_obs_steps
-        motion_times = enc_motion_times - torch.rand(enc_motion_times.shape, device=self.device) * sub_window_size
+        motion_times = enc_motion_times - torch.rand(enc_motion_times.shape, device=self.device, generator=generator) * sub_window_size
 
         enc_amp_obs_demo = self.build_amp_obs_demo(motion_ids, enc_motion_times, self._num_amp_obs_enc_steps).view(-1, self._num_amp_obs_enc_steps, self._num_amp_obs_per_step)
         amp_obs_demo = self.build_amp_obs_demo(motion_ids, motion_times, self._num_amp_obs_steps).view(-1, self._num_amp_obs_steps, self._num_amp_obs_per_step)
@@ -145,18 +145,18 @@ class HumanoidAMP(Humanoid):
 
         return motion_ids, enc_motion_times, enc_amp_obs_demo_flat, motion_times, amp_obs_demo_flat
 
-    def fetch_amp_obs_demo_pair(self, num_samples):
-        motion_ids = self._motion_lib.sample_motions(num_samples)
+    def fetch_amp_obs_demo_pair(self, num_samples, generator=None):
+        motion_ids = self._motion_lib.sample_motions(num_samples, generator=generator)
         cat_motion_ids = torch.cat((motion_ids, motion_ids), dim=0)
 
         # since negative times are added to these values in build_amp_obs_demo,
         # we shift them into the range [0 + truncate_time, end of clip]
         enc_window_size = self.dt * (self._num_amp_obs_enc_steps - 1)
 
-        motion_times0 = self._motion_lib.sample_time(motion_ids, truncate_time=enc_window_size)
+        motion_times0 = self._motion_lib.sample_time(motion_ids, truncate_time=enc_window_size, generator=generator)
         motion_times0 += torch.clip(self._motion_lib._motion_lengths[motion_ids], max=enc_window_size)
 
-        motion_times1 = motion_times0 + torch.rand(motion_times0.shape, device=self._motion_lib._device) * 0.5
+        motion_times1 = motion_times0 + torch.rand(motion_times0.shape, device=self._motion_lib._device, generator=generator) * 0.5
         motion_times1 = torch.min(motion_times1, self._motion_lib._motion_lengths[motion_ids])
 
         motion_times = torch.cat((motion_times0, motion_times1), dim=0)
@@ -380,32 +380,25 @@ def build_amp_observations(root_pos, root_rot, root_vel, root_ang_vel, dof_pos,
                            local_root_obs, root_height_obs, dof_obs_size, dof_offsets):
     # type: (Tensor, Tensor, Tensor, Tensor, Tensor, Tensor, Tensor, bool, bool, int, List[int]) -> Tensor
     root_h = root_pos[:, 2:3]
-    heading_rot = torch_utils.calc_heading_quat_inv(root_rot)
 
     if local_root_obs:
-        root_rot_obs = quat_mul(heading_rot, root_rot)
+        heading_rot = quat_kernels.calc_heading_quat_inv(root_rot)
+        root_rot_obs = quat_kernels.quat_mul(heading_rot, root_rot)
     else:
         root_rot_obs = root_rot
-    root_rot_obs = torch_utils.quat_to_tan_norm(root_rot_obs)
+    root_rot_obs = quat_kernels.quat_to_tan_norm(root_rot_obs)
     
     if not root_height_obs:
         root_h_obs = torch.zeros_like(root_h)
     else:
         root_h_obs = root_h
     
-    local_root_vel = quat_rotate(heading_rot, root_vel)
-    local_root_ang_vel = quat_rotate(heading_rot, root_ang_vel)
+    local_root_vel = quat_kernels.heading_rotate_inv(root_rot, root_vel)
+    local_root_ang_vel = quat_kernels.heading_rotate_inv(root_rot, root_ang_vel)
 
-    root_pos_expand = root_pos.unsqueeze(-2)
-    local_key_body_pos = key_body_pos - root_pos_expand
-    
-    heading_rot_expand = heading_rot.unsqueeze(-2)
-    heading_rot_expand = heading_rot_expand.repeat((1, local_key_body_pos.shape[1], 1))
-    flat_end_pos = local_key_body_pos.view(local_key_body_pos.shape[0] * local_key_body_pos.shape[1], local_key_body_pos.shape[2])
-    flat_heading_rot = heading_rot_expand.view(heading_rot_expand.shape[0] * heading_rot_expand.shape[1], 
-                                               heading_rot_expand.shape[2])
-    local_end_pos = quat_rotate(flat_heading_rot, flat_end_pos)
-    flat_local_key_pos = local_end_pos.view(local_key_body_pos.shape[0], local_key_body_pos.shape[1] * local_key_body_pos.shape[2])
+    local_key_body_pos = key_body_pos - root_pos.unsqueeze(-2)
+    local_end_pos = quat_kernels.heading_rotate_inv(root_rot.unsqueeze(-2), local_key_body_pos)
+    flat_local_key_pos = local_end_pos.reshape(local_end_pos.shape[0], local_end_pos.shape[1] * local_end_pos.shape[2])
     
     dof_obs = dof_to_obs(dof_pos, dof_obs_size, dof_offsets)
     obs = torch.cat((root_h_obs, root_rot_obs, local_root_vel, local_root_ang_vel, dof_obs, dof_vel, flat_local_key_pos), dim=-1)
@@ -64,14 +64,14 @@ class VecTaskPythonWrapper(VecTaskPython):
     def enc_amp_observation_space(self):
         return self._enc_amp_obs_space
 
-    def fetch_amp_obs_demo(self, num_samples):
-        return self.task.fetch_amp_obs_demo(num_samples)
+    def fetch_amp_obs_demo(self, num_samples, generator=None):
+        return self.task.fetch_amp_obs_demo(num_samples, generator=generator)
 
-    def fetch_amp_obs_demo_pair(self, num_samples):
-        return self.task.fetch_amp_obs_demo_pair(num_samples)
+    def fetch_amp_obs_demo_pair(self, num_samples, generator=None):
+        return self.task.fetch_amp_obs_demo_pair(num_samples, generator=generator)
 
-    def fetch_amp_obs_demo_enc_pair(self, num_samples):
-        return self.task.fetch_amp_obs_demo_enc_pair(num_samples)
+    def fetch_amp_obs_demo_enc_pair(self, num_samples, generator=None):
+        return self.task.fetch_amp_obs_demo_enc_pair(num_samples, generator=generator)
 
     def fetch_amp_obs_demo_per_id(self, num_samples, motion_ids):
         return self.task.fetch_amp_obs_demo_per_id(num_samples, motion_ids)
@@ -0,0 +1,231 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import queue
+import traceback
+
+import torch
+import torch.multiprocessing as mp
+
+from rl_games.common.algo_observer import DefaultAlgoObserver
+
+
+class ActorLearner:
+    # Runs rollouts in separate actor processes while the calling (learner) process trains on them.
+    # actor_fn(actor_id) is called once in every actor process and must return an object providing
+    # set_weights(weights) and play_rollout() -> (batch_dict, info). Each actor owns num_slots rollout
+    # buffers in shared memory (cuda tensors are shared over ipc), which are allocated from its first
+    # rollout and handed to the learner once; afterwards only slot ids are exchanged.
+    # Weights are published into a shared copy with a version counter and pulled by the actors before
+    # each rollout. A rollout is tagged with the weights version it was played with and is dropped if
+    # the learner has moved on by more than max_policy_lag updates when it is consumed, the remaining
+    # lag is corrected by the PPO ratio clipping against the stored behaviour log probs.
+    def __init__(self, actor_fn, num_actors, weights, device, num_slots=2, max_policy_lag=1):
+        ctx = mp.get_context('spawn')
+        self._device = device
+        self._max_policy_lag = max_policy_lag
+        self._version = 0
+        self._num_dropped = 0
+
+        self._shared_weights = _share_tree(weights)
+        self._shared_version = ctx.Value('l', 0, lock=False)
+        self._weights_lock = ctx.Lock()
+        self._stop_event = ctx.Event()
+        self._msg_queue = ctx.Queue()
+        self._free_queues = []
+        self._slots = dict()
+        self._processes = []
+
+        for actor_id in range(num_actors):
+            free_queue = ctx.Queue()
+            for slot_id in range(num_slots):
+                free_queue.put(slot_id)
+            self._free_queues.append(free_queue)
+
+            p = ctx.Process(target=_actor_main, daemon=True,
+                            args=(actor_id, actor_fn, self._shared_weights, self._shared_version, self._weights_lock,
+                                  self._msg_queue, free_queue, num_slots, self._stop_event))
+            p.start()
+            self._processes.append(p)
+        return
+
+    def get_version(self):
+        return self._version
+
+    def get_num_dropped(self):
+        return self._num_dropped
+
+    def publish_weights(self, weights):
+        with self._weights_lock:
+            _copy_tree(self._shared_weights, weights)
+            self._shared_version.value += 1
+        self._version += 1
+        return
+
+    def get_rollout(self):
+        # blocks until a rollout within the lag bound is available, the tensors are copied to the
+        # learner device so the slot can be refilled right away
+        while True:
+            msg = self._get_msg()
+            if msg[0] == 'error':
+                _, actor_id, error = msg
+                self.close()
+                raise RuntimeError("rollout actor {:d} failed:\n{:s}".format(actor_id, error))
+            elif msg[0] == 'slots':
+                _, actor_id, slots = msg
+                self._slots[actor_id] = slots
+                continue
+
+            _, actor_id, slot_id, version, info = msg
+            lag = self._version - version
+            if lag > self._max_policy_lag:
+                self._num_dropped += 1
+                self._free_queues[actor_id].put(slot_id)
+                continue
+
+            slot = self._slots[actor_id][slot_id]
+            batch_dict = {k: v.to(self._device, copy=True) for k, v in slot.items()}
+            self._free_queues[actor_id].put(slot_id)
+
+            batch_dict.update(info.pop('extras'))
+            info['actor_id'] = actor_id
+            info['policy_lag'] = lag
+            return batch_dict, info
+
+    def close(self):
+        self._stop_event.set()
+        for p in self._processes:
+            p.join(timeout=10)
+            if p.is_alive():
+                p.terminate()
+        self._processes = []
+        self._slots = dict()
+        return
+
+    def _get_msg(self):
+        while True:
+            try:
+                return self._msg_queue.get(timeout=1.0)
+            except queue.Empty:
+                for actor_id, p in enumerate(self._processes):
+                    if not p.is_alive():
+                        self.close()
+                        raise RuntimeError("rollout actor {:d} exited with code {}".format(actor_id, p.exitcode))
+        return
+
+
+class AgentActor:
+    # actor_fn for the rl_games agents in this repo: every actor process builds its own copy of the agent
+    # class, including its vectorized env, and plays rollouts with the agent's play_rollout().
+    # init_fn(actor_id) is called first to restore process-global state the env creation depends on.
+    def __init__(self, agent_cls, base_name, config, init_fn=None):
+        # the learner's observer holds a reference to the learner agent and is not sent to the actors
+        config = dict(config)
+        config['features'] = {'observer': DefaultAlgoObserver()}
+        config['actor_learner'] = None
+        config['actor_init_fn'] = None
+
+        self._agent_cls = agent_cls
+        self._base_name = base_name
+        self._config = config
+        self._init_fn = init_fn
+        return
+
+    def __call__(self, actor_id):
+        if self._init_fn is not None:
+            self._init_fn(actor_id)
+        return self._agent_cls(self._base_name, self._config)
+
+
+def _actor_main(actor_id, actor_fn, shared_weights, shared_version, weights_lock, msg_queue, free_queue,
+                num_slots, stop_event):
+    try:
+        actor = actor_fn(actor_id)
+        version = -1
+        slots = None
+
+        while not stop_event.is_set():
+            try:
+                slot_id = free_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            if shared_version.value != version:
+                with weights_lock:
+                    version = shared_version.value
+                    actor.set_weights(shared_weights)
+
+            batch_dict, info = actor.play_rollout()
+            tensors = {k: v for k, v in batch_dict.items() if isinstance(v, torch.Tensor)}
+            info = dict(info)
+            info['extras'] = {k: v for k, v in batch_dict.items() if not isinstance(v, torch.Tensor)}
+
+            if slots is None:
+                slots = [{k: _alloc_shared(v) for k, v in tensors.items()} for _ in range(num_slots)]
+                msg_queue.put(('slots', actor_id, slots))
+
+            slot = slots[slot_id]
+            for k, v in tensors.items():
+                slot[k].copy_(v)
+            if any(v.is_cuda for v in tensors.values()):
+                torch.cuda.synchronize()
+
+            msg_queue.put(('rollout', actor_id, slot_id, version, info))
+    except Exception:
+        msg_queue.put(('error', actor_id, traceback.format_exc()))
+    return
+
+
+def _alloc_shared(x):
+    buf = torch.empty_like(x, memory_format=torch.contiguous_format)
+    if not buf.is_cuda:
+        buf.share_memory_()
+    return buf
+
+
+def _share_tree(x):
+    if isinstance(x, torch.Tensor):
+        return x.detach().to('cpu', copy=True).share_memory_()
+    elif isinstance(x, dict):
+        return type(x)((k, _share_tree(v)) for k, v in x.items())
+    elif isinstance(x, (list, tuple)):
+        return type(x)(_share_tree(v) for v in x)
+    return x
+
+
+def _copy_tree(dst, src):
+    # only tensor leaves are updated, other leaves keep the values they were shared with
+    if isinstance(dst, torch.Tensor):
+        dst.copy_(src)
+    elif isinstance(dst, dict):
+        for k, v in dst.items():
+            _copy_tree(v, src[k])
+    elif isinstance(dst, (list, tuple)):
+        for d, s in zip(dst, src):
+            _copy_tree(d, s)
+    return
@@ -28,7 +28,6 @@
 
 from rl_games.algos_torch.running_mean_std import RunningMeanStd
 from rl_games.algos_torch import torch_ext
-from rl_games.common import a2c_common
 
 from isaacgym.torch_utils import *
 
@@ -38,7 +37,10 @@ import torch
 from torch import nn
 
 import learning.replay_buffer as replay_buffer
+import learning.demo_prefetcher as demo_prefetcher
+import learning.mixed_precision as mixed_precision
 import learning.common_agent as common_agent
+import learning.rollout_postprocess as rollout_postprocess
 
 
 class AMPAgent(common_agent.CommonAgent):
@@ -81,6 +83,22 @@ class AMPAgent(common_agent.CommonAgent):
         
         return
 
+    def _get_resume_state(self):
+        state = super()._get_resume_state()
+        state['amp_replay_buffer'] = self._amp_replay_buffer.state_dict()
+        state['amp_obs_demo_buffer'] = self._amp_obs_demo_buffer.state_dict()
+        if self._amp_demo_prefetcher is not None:
+            state['amp_demo_prefetcher'] = self._amp_demo_prefetcher.state_dict()
+        return state
+
+    def _set_resume_state(self, state):
+        super()._set_resume_state(state)
+        self._amp_replay_buffer.load_state_dict(state['amp_replay_buffer'])
+        self._amp_obs_demo_buffer.load_state_dict(state['amp_obs_demo_buffer'])
+        if self._amp_demo_prefetcher is not None and 'amp_demo_prefetcher' in state:
+            self._amp_demo_prefetcher.load_state_dict(state['amp_demo_prefetcher'])
+        return
+
     def play_steps(self):
         self.set_eval()
 
@@ -98,6 +116,7 @@ class AMPAgent(common_agent.CommonAgent):
                 res_dict = self.get_masked_action_values(self.obs, masks)
             else:
                 res_dict = self.get_action_values(self.obs, self._rand_action_probs)
+            self._resolve_next_values(res_dict['values'], [self.obs['obs']])
 
             for k in update_list:
                 self.experience_buffer.update_data(k, n, res_dict[k]) 
@@ -108,16 +127,13 @@ class AMPAgent(common_agent.CommonAgent):
             self.obs, rewards, self.dones, infos = self.env_step(res_dict['actions'])
             shaped_rewards = self.rewards_shaper(rewards)
             self.experience_buffer.update_data('rewards', n, shaped_rewards)
-            self.experience_buffer.update_data('next_obses', n, self.obs['obs'])
             self.experience_buffer.update_data('dones', n, self.dones)
             self.experience_buffer.update_data('amp_obs', n, infos['amp_obs'])
             self.experience_buffer.update_data('rand_action_mask', n, res_dict['rand_action_mask'])
 
             terminated = infos['terminate'].float()
             terminated = terminated.unsqueeze(-1)
-            next_vals = self._eval_critic(self.obs)
-            next_vals *= (1.0 - terminated)
-            self.experience_buffer.update_data('next_values', n, next_vals)
+            self._store_next_values(n, terminated, [self.obs['obs']])
 
             self.current_rewards += rewards
             self.current_lengths += 1
@@ -138,24 +154,15 @@ class AMPAgent(common_agent.CommonAgent):
                 
             done_indices = done_indices[:, 0]
 
-        mb_fdones = self.experience_buffer.tensor_dict['dones'].float()
-        mb_values = self.experience_buffer.tensor_dict['values']
-        mb_next_values = self.experience_buffer.tensor_dict['next_values']
+        self._resolve_next_values()
+        self._store_last_obs()
 
         mb_rewards = self.experience_buffer.tensor_dict['rewards']
-        mb_amp_obs = self.experience_buffer.tensor_dict['amp_obs']
+        mb_amp_obs = self.experience_buffer.tensor_dict['amp_obs'].float()
         amp_rewards = self._calc_amp_rewards(mb_amp_obs)
         mb_rewards = self._combine_rewards(mb_rewards, amp_rewards)
 
-        mb_advs = self.discount_values(mb_fdones, mb_values, mb_rewards, mb_next_values)
-        mb_returns = mb_advs + mb_values
-
-        batch_dict = self.experience_buffer.get_transformed_list(a2c_common.swap_and_flatten01, self.tensor_list)
-        batch_dict['returns'] = a2c_common.swap_and_flatten01(mb_returns)
-        batch_dict['played_frames'] = self.batch_size
-
-        for k, v in amp_rewards.items():
-            batch_dict[k] = a2c_common.swap_and_flatten01(v)
+        batch_dict = self._postprocess_rollout(mb_rewards, amp_rewards)
 
         return batch_dict
     
@@ -193,9 +200,9 @@ class AMPAgent(common_agent.CommonAgent):
 
     def prepare_dataset(self, batch_dict):
         super().prepare_dataset(batch_dict)
-        self.dataset.values_dict['amp_obs'] = batch_dict['amp_obs']
+        self.dataset.values_dict['amp_obs'] = batch_dict.get('amp_obs', None)
         self.dataset.values_dict['amp_obs_demo'] = batch_dict['amp_obs_demo']
-        self.dataset.values_dict['amp_obs_replay'] = batch_dict['amp_obs_replay']
+        self.dataset.values_dict['amp_obs_replay'] = batch_dict.get('amp_obs_replay', None)
         
         rand_action_mask = batch_dict['rand_action_mask']
         self.dataset.values_dict['rand_action_mask'] = rand_action_mask
@@ -247,7 +254,7 @@ class AMPAgent(common_agent.CommonAgent):
                 if self.schedule_type == 'legacy':  
                     if self.multi_gpu:
                         curr_train_info['kl'] = self.hvd.average_value(curr_train_info['kl'], 'ep_kls')
-                    self.last_lr, self.entropy_coef = self.scheduler.update(self.last_lr, self.entropy_coef, self.epoch_num, 0, curr_train_info['kl'].item())
+                    self.last_lr, self.entropy_coef = self.scheduler.update(self.last_lr, self.entropy_coef, self.epoch_num, 0, self._get_scheduler_kl(curr_train_info['kl']))
                     self.update_lr(self.last_lr)
 
                 if train_info is None:
@@ -263,13 +270,13 @@ class AMPAgent(common_agent.CommonAgent):
             if self.schedule_type == 'standard':
                 if self.multi_gpu:
                     av_kls = self.hvd.average_value(av_kls, 'ep_kls')
-                self.last_lr, self.entropy_coef = self.scheduler.update(self.last_lr, self.entropy_coef, self.epoch_num, 0, av_kls.item())
+                self.last_lr, self.entropy_coef = self.scheduler.update(self.last_lr, self.entropy_coef, self.epoch_num, 0, self._get_scheduler_kl(av_kls))
                 self.update_lr(self.last_lr)
 
         if self.schedule_type == 'standard_epoch':
             if self.multi_gpu:
                 av_kls = self.hvd.average_value(torch_ext.mean_list(kls), 'ep_kls')
-            self.last_lr, self.entropy_coef = self.scheduler.update(self.last_lr, self.entropy_coef, self.epoch_num, 0, av_kls.item())
+            self.last_lr, self.entropy_coef = self.scheduler.update(self.last_lr, self.entropy_coef, self.epoch_num, 0, self._get_scheduler_kl(av_kls))
             self.update_lr(self.last_lr)
 
         update_time_end = time.time()
@@ -331,7 +338,7 @@ class AMPAgent(common_agent.CommonAgent):
             batch_dict['rnn_states'] = input_dict['rnn_states']
             batch_dict['seq_length'] = self.seq_len
 
-        with torch.cuda.amp.autocast(enabled=self.mixed_precision):
+        with self._autocast():
             res_dict = self.model(batch_dict)
             action_log_probs = res_dict['prev_neglogp']
             values = res_dict['values']
@@ -438,6 +445,10 @@ class AMPAgent(common_agent.CommonAgent):
         self._disc_weight_decay = config['disc_weight_decay']
         self._disc_reward_scale = config['disc_reward_scale']
         self._normalize_amp_input = config.get('normalize_amp_input', True)
+
+        self._amp_demo_prefetch = config.get('amp_demo_prefetch', False)
+        self._amp_demo_prefetch_depth = int(config.get('amp_demo_prefetch_depth', 2))
+        self._amp_demo_prefetcher = None
         return
 
     def _build_net_config(self):
@@ -462,8 +473,34 @@ class AMPAgent(common_agent.CommonAgent):
     def _init_train(self):
         super()._init_train()
         self._init_amp_demo_buf()
+        self._build_demo_prefetchers()
         return
 
+    def _close_train(self):
+        super()._close_train()
+        if self._amp_demo_prefetcher is not None:
+            self._amp_demo_prefetcher.close()
+        self._amp_replay_buffer.close()
+        self._amp_obs_demo_buffer.close()
+        return
+
+    def _build_demo_prefetchers(self):
+        if self._amp_demo_prefetch:
+            self._amp_demo_prefetcher = demo_prefetcher.DemoPrefetcher(lambda generator: self._fetch_amp_obs_demo(self._amp_batch_size, generator),
+                                                                       self.ppo_device, self._build_demo_generator(1),
+                                                                       depth=self._amp_demo_prefetch_depth)
+        return
+
+    def _build_demo_generator(self, seed_offset):
+        generator = torch.Generator(device=self.vec_env.env.task.device)
+        generator.manual_seed((torch.initial_seed() + seed_offset) % (2 ** 63))
+        return generator
+
+    def _next_amp_demo_batch(self):
+        if self._amp_demo_prefetcher is not None:
+            return self._amp_demo_prefetcher.get()
+        return self._fetch_amp_obs_demo(self._amp_batch_size)
+
     def _disc_loss(self, disc_agent_logit, disc_demo_logit, obs_demo):
         # prediction loss
         disc_loss_agent = self._disc_loss_neg(disc_agent_logit)
@@ -476,8 +513,7 @@ class AMPAgent(common_agent.CommonAgent):
         disc_loss += self._disc_logit_reg * disc_logit_loss
 
         # grad penalty
-        disc_demo_grad = torch.autograd.grad(disc_demo_logit, obs_demo, grad_outputs=torch.ones_like(disc_demo_logit),
-                                             create_graph=True, retain_graph=True, only_inputs=True)
+        disc_demo_grad = mixed_precision.penalty_grads(disc_demo_logit, obs_demo, self.scaler)
         disc_demo_grad = disc_demo_grad[0]
         disc_demo_grad = torch.sum(torch.square(disc_demo_grad), dim=-1)
         disc_grad_penalty = torch.mean(disc_demo_grad)
@@ -520,8 +556,8 @@ class AMPAgent(common_agent.CommonAgent):
         demo_acc = torch.mean(demo_acc.float())
         return agent_acc, demo_acc
 
-    def _fetch_amp_obs_demo(self, num_samples):
-        amp_obs_demo = self.vec_env.env.fetch_amp_obs_demo(num_samples)
+    def _fetch_amp_obs_demo(self, num_samples, generator=None):
+        amp_obs_demo = self.vec_env.env.fetch_amp_obs_demo(num_samples, generator=generator)
         return amp_obs_demo
 
     def _build_amp_buffers(self):
@@ -535,7 +571,14 @@ class AMPAgent(common_agent.CommonAgent):
 
         self._amp_replay_keep_prob = self.config['amp_replay_keep_prob']
         replay_buffer_size = int(self.config['amp_replay_buffer_size'])
-        self._amp_replay_buffer = replay_buffer.ReplayBuffer(replay_buffer_size, self.ppo_device)
+        replay_buffer_storage = self.config.get('amp_replay_buffer_storage', 'device')
+        # without a configured path the mmap storage uses a temporary file, deleted in _close_train
+        replay_buffer_mmap_path = self.config.get('amp_replay_buffer_mmap_path', None)
+        replay_buffer_prefetch = self.config.get('amp_replay_buffer_prefetch', False)
+        self._amp_replay_buffer = replay_buffer.ReplayBuffer(replay_buffer_size, self.ppo_device,
+                                                             storage=replay_buffer_storage,
+                                                             mmap_path=replay_buffer_mmap_path,
+                                                             prefetch=replay_buffer_prefetch)
         
         self._build_rand_action_probs()
         
@@ -553,7 +596,7 @@ class AMPAgent(common_agent.CommonAgent):
         return
     
     def _update_amp_demos(self):
-        new_amp_obs_demo = self._fetch_amp_obs_demo(self._amp_batch_size)
+        new_amp_obs_demo = self._next_amp_demo_batch()
         self._amp_obs_demo_buffer.store({'amp_obs': new_amp_obs_demo})
         return
 
@@ -561,15 +604,16 @@ class AMPAgent(common_agent.CommonAgent):
         if self._normalize_amp_input:
             shape = amp_obs.shape
             amp_obs = amp_obs.view(-1, self.vec_env.env.amp_observation_space.shape[0] // self.vec_env.env.task._num_amp_obs_steps)
-            amp_obs = self._amp_input_mean_std(amp_obs)
+            with mixed_precision.no_autocast(self.ppo_device):
+                amp_obs = self._amp_input_mean_std(amp_obs.float())
             amp_obs = amp_obs.view(shape)
         return amp_obs
 
     def _combine_rewards(self, task_rewards, amp_rewards):
         disc_r = amp_rewards['disc_rewards']
         
-        combined_rewards = self._task_reward_w * task_rewards + \
-                         + self._disc_reward_w * disc_r
+        combined_rewards = rollout_postprocess.combine_rewards([task_rewards, disc_r],
+                                                               [float(self._task_reward_w), float(self._disc_reward_w)])
         return combined_rewards
 
     def _eval_disc(self, amp_obs):
@@ -629,18 +673,18 @@ class AMPAgent(common_agent.CommonAgent):
         super()._log_train_info(train_info, frame)
 
         if self._disc_reward_w > 0:
-            self.writer.add_scalar('losses/disc_loss', torch_ext.mean_list(train_info['disc_loss']).item(), frame)
+            self._metrics.add_scalar('losses/disc_loss', torch_ext.mean_list(train_info['disc_loss']))
 
-            self.writer.add_scalar('info/disc_agent_acc', torch_ext.mean_list(train_info['disc_agent_acc']).item(), frame)
-            self.writer.add_scalar('info/disc_demo_acc', torch_ext.mean_list(train_info['disc_demo_acc']).item(), frame)
-            self.writer.add_scalar('info/disc_agent_logit', torch_ext.mean_list(train_info['disc_agent_logit']).item(), frame)
-            self.writer.add_scalar('info/disc_demo_logit', torch_ext.mean_list(train_info['disc_demo_logit']).item(), frame)
-            self.writer.add_scalar('info/disc_grad_penalty', torch_ext.mean_list(train_info['disc_grad_penalty']).item(), frame)
-            self.writer.add_scalar('info/disc_logit_loss', torch_ext.mean_list(train_info['disc_logit_loss']).item(), frame)
+            self._metrics.add_scalar('info/disc_agent_acc', torch_ext.mean_list(train_info['disc_agent_acc']))
+            self._metrics.add_scalar('info/disc_demo_acc', torch_ext.mean_list(train_info['disc_demo_acc']))
+            self._metrics.add_scalar('info/disc_agent_logit', torch_ext.mean_list(train_info['disc_agent_logit']))
+            self._metrics.add_scalar('info/disc_demo_logit', torch_ext.mean_list(train_info['disc_demo_logit']))
+            self._metrics.add_scalar('info/disc_grad_penalty', torch_ext.mean_list(train_info['disc_grad_penalty']))
+            self._metrics.add_scalar('info/disc_logit_loss', torch_ext.mean_list(train_info['disc_logit_loss']))
 
             disc_reward_std, disc_reward_mean = torch.std_mean(train_info['disc_rewards'])
-            self.writer.add_scalar('info/disc_reward_mean', disc_reward_mean.item(), frame)
-            self.writer.add_scalar('info/disc_reward_std', disc_reward_std.item(), frame)
+            self._metrics.add_scalar('info/disc_reward_mean', disc_reward_mean)
+            self._metrics.add_scalar('info/disc_reward_std', disc_reward_std)
         return
 
     def _amp_debug(self, info):
@@ -26,16 +26,40 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import numpy as np
 import torch
 from rl_games.common import datasets
 
 
+def _upcast(x):
+    # experience keys may be stored in reduced precision, the losses are always computed in float32
+    if x.dtype == torch.float16 or x.dtype == torch.bfloat16:
+        x = x.float()
+    return x
+
+
 class AMPDataset(datasets.PPODataset):
-    def __init__(self, batch_size, minibatch_size, is_discrete, is_rnn, device, seq_len):
+    def __init__(self, batch_size, minibatch_size, is_discrete, is_rnn, device, seq_len, packed=False):
         super().__init__(batch_size, minibatch_size, is_discrete, is_rnn, device, seq_len)
         self._idx_buf = torch.randperm(batch_size)
+
+        # in packed mode all batch sized values are shuffled once per mini-epoch into
+        # one buffer per dtype, and minibatches are views of contiguous row ranges.
+        # The shuffled buffers are refilled at the start of the next mini-epoch, so packed
+        # minibatches are only valid until then and have to be cloned to be kept longer
+        self._packed = packed
+        self._packed_dirty = True
+        self._packed_layout = None
+        self._packed_bufs = None
+        self._packed_perm_bufs = None
+        self._packed_cols = None
         return
     
+    def update_values_dict(self, values_dict):
+        super().update_values_dict(values_dict)
+        self._packed_dirty = True
+        return
+
     def update_mu_sigma(self, mu, sigma):	  
         raise NotImplementedError()
         return
@@ -43,12 +67,16 @@ class AMPDataset(datasets.PPODataset):
     def _get_item(self, idx):
         start = idx * self.minibatch_size
         end = (idx + 1) * self.minibatch_size
-        sample_idx = self._idx_buf[start:end]
 
-        input_dict = {}
-        for k,v in self.values_dict.items():
-            if k not in self.special_names and v is not None:
-                input_dict[k] = v[sample_idx]
+        if self._packed:
+            input_dict = self._get_packed_item(idx, start, end)
+        else:
+            sample_idx = self._idx_buf[start:end]
+
+            input_dict = {}
+            for k,v in self.values_dict.items():
+                if k not in self.special_names and v is not None:
+                    input_dict[k] = _upcast(v[sample_idx])
                 
         if end >= self.batch_size:
             self._shuffle_idx_buf()
@@ -58,3 +86,55 @@ class AMPDataset(datasets.PPODataset):
     def _shuffle_idx_buf(self):
         self._idx_buf[:] = torch.randperm(self.batch_size)
         return
+
+    def _get_packed_item(self, idx, start, end):
+        if self._packed_dirty or idx == 0:
+            if self._packed_dirty:
+                self._pack_values()
+
+            perm = self._idx_buf.to(self.device)
+            for dtype, buf in self._packed_bufs.items():
+                torch.index_select(buf, 0, perm, out=self._packed_perm_bufs[dtype])
+
+        n = end - start
+        input_dict = {}
+        for k,v in self.values_dict.items():
+            if k in self.special_names or v is None:
+                continue
+
+            if k in self._packed_cols:
+                dtype, col_start, col_end, shape = self._packed_cols[k]
+                rows = self._packed_perm_bufs[dtype][start:end, col_start:col_end]
+                input_dict[k] = _upcast(rows.view((n,) + shape))
+            else:
+                input_dict[k] = _upcast(v[self._idx_buf[start:end]])
+
+        return input_dict
+
+    def _pack_values(self):
+        layout = []
+        for k,v in self.values_dict.items():
+            if k not in self.special_names and v is not None \
+                and v.dim() > 0 and v.shape[0] == self.batch_size:
+                layout.append((k, v.dtype, tuple(v.shape[1:])))
+        layout = tuple(layout)
+
+        if layout != self._packed_layout:
+            widths = {}
+            self._packed_cols = {}
+            for k, dtype, shape in layout:
+                col_start = widths.get(dtype, 0)
+                col_end = col_start + max(int(np.prod(shape)), 1)
+                self._packed_cols[k] = (dtype, col_start, col_end, shape)
+                widths[dtype] = col_end
+
+            self._packed_bufs = {dtype: torch.empty((self.batch_size, w), dtype=dtype, device=self.device)
+                                 for dtype, w in widths.items()}
+            self._packed_perm_bufs = {dtype: torch.empty_like(buf) for dtype, buf in self._packed_bufs.items()}
+            self._packed_layout = layout
+
+        for k, (dtype, col_start, col_end, shape) in self._packed_cols.items():
+            self._packed_bufs[dtype][:, col_start:col_end] = self.values_dict[k].reshape(self.batch_size, -1)
+
+        self._packed_dirty = False
+        return
@@ -26,6 +26,8 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import torch
+
 from rl_games.algos_torch.models import ModelA2CContinuousLogStd
 
 
@@ -52,15 +54,18 @@ class ModelAMPContinuous(ModelA2CContinuousLogStd):
 
             if is_train and eval_disc:
                 amp_obs = input_dict['amp_obs']
-                disc_agent_logit = self.a2c_network.eval_disc(amp_obs)
-                result["disc_agent_logit"] = disc_agent_logit
-
                 amp_obs_replay = input_dict['amp_obs_replay']
-                disc_agent_replay_logit = self.a2c_network.eval_disc(amp_obs_replay)
-                result["disc_agent_replay_logit"] = disc_agent_replay_logit
-
                 amp_demo_obs = input_dict['amp_obs_demo']
+
+                # agent and replay obs share one discriminator pass. The demo obs get their own pass, since the
+                # gradient penalty would otherwise backpropagate twice through all concatenated rows.
+                disc_agent_cat_logit = self.a2c_network.eval_disc(torch.cat([amp_obs, amp_obs_replay], dim=0))
+                disc_agent_logit, disc_agent_replay_logit = \
+                    torch.split(disc_agent_cat_logit, [amp_obs.shape[0], amp_obs_replay.shape[0]], dim=0)
                 disc_demo_logit = self.a2c_network.eval_disc(amp_demo_obs)
+
+                result["disc_agent_logit"] = disc_agent_logit
+                result["disc_agent_replay_logit"] = disc_agent_replay_logit
                 result["disc_demo_logit"] = disc_demo_logit
 
             return result
@@ -0,0 +1,190 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from collections import deque
+
+import torch
+
+
+class RowTable:
+    # Append-only table of fixed size rows, addressed by the running id returned from append().
+    # Rows are appended in groups (e.g. one per step) and a row stays valid while its group is one
+    # of the last `lifetime` groups. The table grows from the host side row counts, so appending
+    # never waits on the device.
+    def __init__(self, row_shape, lifetime, device, capacity=1, dtype=torch.float32):
+        self._row_shape = tuple(row_shape)
+        self._lifetime = lifetime
+        self._device = device
+        self._rows = torch.zeros((max(capacity, 1),) + self._row_shape, dtype=dtype, device=device)
+        self._count = 0
+        self._group_sizes = deque()
+        self._live_count = 0
+        return
+
+    def get_capacity(self):
+        return self._rows.shape[0]
+
+    def append(self, rows):
+        n = rows.shape[0]
+        self._group_sizes.append(n)
+        self._live_count += n
+        if len(self._group_sizes) > self._lifetime:
+            self._live_count -= self._group_sizes.popleft()
+
+        if self._live_count > self.get_capacity():
+            self._grow(max(self._live_count, 2 * self.get_capacity()), self._live_count - n)
+
+        ids = self._count + torch.arange(n, dtype=torch.long, device=self._device)
+        if n > 0:
+            self._rows[ids % self.get_capacity()] = rows.to(self._rows.dtype)
+        self._count += n
+        return ids
+
+    def get(self, ids):
+        return self._rows[ids % self.get_capacity()]
+
+    def state_dict(self):
+        state = {
+            'rows': self._rows,
+            'count': self._count,
+            'group_sizes': list(self._group_sizes)
+        }
+        return state
+
+    def load_state_dict(self, state):
+        self._rows = state['rows'].to(self._device, self._rows.dtype).clone()
+        self._count = state['count']
+        self._group_sizes = deque(state['group_sizes'])
+        self._live_count = sum(self._group_sizes)
+        return
+
+    def _grow(self, capacity, num_kept):
+        ids = torch.arange(self._count - num_kept, self._count, dtype=torch.long, device=self._device)
+        rows = torch.zeros((capacity,) + self._row_shape, dtype=self._rows.dtype, device=self._device)
+        rows[ids % capacity] = self._rows[ids % self.get_capacity()]
+        self._rows = rows
+        return
+
+
+class AMPObsRing:
+    # Per-env ring of AMP observation frames. The amp_obs window of a step holds the newest frame first,
+    # followed by the env's history, so consecutive windows of an env share all but one frame. Every
+    # push writes one frame per env at the same ring position, and a window is referenced by the
+    # absolute position of its newest frame. The history of a window at an episode start is re-initialized
+    # by the env, those T - 1 frames are kept in a side table, and every position records the start of
+    # its episode, so windows within T - 1 steps of a reset take their older frames from the side table.
+    # A window stays valid until capacity - T further pushes, the ring is allocated up front.
+    def __init__(self, num_envs, num_steps, frame_size, capacity, device, dtype=torch.float32):
+        assert(capacity >= num_steps)
+        self._num_envs = num_envs
+        self._num_steps = num_steps
+        self._frame_size = frame_size
+        self._capacity = capacity
+        self._device = device
+
+        self._frames = torch.zeros((num_envs, capacity, frame_size), dtype=dtype, device=device)
+        self._episode_starts = torch.zeros((num_envs, capacity), dtype=torch.long, device=device)
+        self._episode_rows = torch.zeros((num_envs, capacity), dtype=torch.long, device=device)
+        self._curr_episode_starts = torch.zeros(num_envs, dtype=torch.long, device=device)
+        self._curr_episode_rows = torch.zeros(num_envs, dtype=torch.long, device=device)
+        self._reset_table = RowTable((num_steps - 1, frame_size), capacity, device,
+                                     capacity=2 * num_envs, dtype=dtype)
+
+        self._head = 0
+        self._env_ids = torch.arange(num_envs, dtype=torch.long, device=device)
+        self._step_offsets = torch.arange(num_steps, dtype=torch.long, device=device)
+        return
+
+    def get_capacity(self):
+        return self._capacity
+
+    def get_head(self):
+        return self._head
+
+    def push(self, amp_obs, reset_env_ids):
+        # stores the windows of one step for all envs and returns their positions, reset_env_ids are
+        # the envs whose history was re-initialized since the previous push
+        window = amp_obs.view(self._num_envs, self._num_steps, self._frame_size)
+        reset_env_ids = torch.as_tensor(reset_env_ids, dtype=torch.long, device=self._device)
+        if self._head == 0:
+            reset_env_ids = self._env_ids
+
+        pos = self._head
+        slot = pos % self._capacity
+
+        reset_rows = self._reset_table.append(window[reset_env_ids, 1:])
+        if reset_env_ids.shape[0] > 0:
+            self._curr_episode_starts[reset_env_ids] = pos
+            self._curr_episode_rows[reset_env_ids] = reset_rows
+
+        self._frames[:, slot] = window[:, 0].to(self._frames.dtype)
+        self._episode_starts[:, slot] = self._curr_episode_starts
+        self._episode_rows[:, slot] = self._curr_episode_rows
+
+        self._head += 1
+        return torch.full((self._num_envs,), pos, dtype=torch.long, device=self._device)
+
+    def is_episode_start(self, env_ids, heads):
+        return self._episode_starts[env_ids, heads % self._capacity] == heads
+
+    def get_windows(self, env_ids, heads):
+        slots = heads % self._capacity
+        pos = (heads.unsqueeze(-1) - self._step_offsets) % self._capacity
+        windows = self._frames[env_ids.unsqueeze(-1), pos]
+
+        if self._num_steps > 1:
+            episode_steps = (heads - self._episode_starts[env_ids, slots]).unsqueeze(-1)
+            hist_ids = torch.clamp(self._step_offsets - episode_steps - 1, 0, self._num_steps - 2)
+            reset_hist = self._reset_table.get(self._episode_rows[env_ids, slots])
+            hist = reset_hist[torch.arange(env_ids.shape[0], device=self._device).unsqueeze(-1), hist_ids]
+            windows = torch.where((self._step_offsets > episode_steps).unsqueeze(-1), hist, windows)
+
+        windows = windows.view(env_ids.shape[0], self._num_steps * self._frame_size).float()
+        return windows
+
+    def state_dict(self):
+        state = {
+            'frames': self._frames,
+            'episode_starts': self._episode_starts,
+            'episode_rows': self._episode_rows,
+            'curr_episode_starts': self._curr_episode_starts,
+            'curr_episode_rows': self._curr_episode_rows,
+            'reset_table': self._reset_table.state_dict(),
+            'head': self._head
+        }
+        return state
+
+    def load_state_dict(self, state):
+        self._frames.copy_(state['frames'])
+        self._episode_starts.copy_(state['episode_starts'])
+        self._episode_rows.copy_(state['episode_rows'])
+        self._curr_episode_starts.copy_(state['curr_episode_starts'])
+        self._curr_episode_rows.copy_(state['curr_episode_rows'])
+        self._reset_table.load_state_dict(state['reset_table'])
+        self._head = state['head']
+        return
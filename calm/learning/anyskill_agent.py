@@ -1,19 +1,13 @@
-import copy
-from gym import spaces
 import numpy as np
 import os
 import yaml
-import wandb
-
-from rl_games.common import a2c_common
 
 import torch
-from torch.nn.functional import cosine_similarity
 
 import learning.common_agent as common_agent
-import learning.calm_agent as calm_agent
-import learning.calm_models as calm_models
-import learning.calm_network_builder as calm_network_builder
+import learning.latent_index as latent_index
+import learning.llc_inference as llc_inference
+import learning.reward_terms as reward_terms
 from utils import anyskill
 
 
@@ -29,6 +23,9 @@ class AnyskillAgent(common_agent.CommonAgent):
         self._task_size = self.vec_env.env.task.get_task_obs_size()
         
         self._llc_steps = config['llc_steps']
+        self._llc_step_mode = config.get('llc_step_mode', 'eager')
+        self._latent_index_stride = config.get('latent_index_stride', 0.5)
+        self._latent_index_dir = config.get('latent_index_dir', 'output/latent_index')
         llc_checkpoint = config['llc_checkpoint']
         assert(llc_checkpoint != "")
         self._build_llc(llc_config_params, llc_checkpoint)
@@ -40,15 +37,16 @@ class AnyskillAgent(common_agent.CommonAgent):
         self.mlip_encoder = anyskill.FeatureExtractor()
         self.text_file = config['text_file']
         self.RENDER = config['render']
+        self._reward_graph = self._build_reward_graph(config)
 
         return
 
     def env_step(self, actions):
         actions = self.preprocess_actions(actions)
         obs = self.obs['obs']
-        self._llc_actions = torch.zeros([self._llc_steps, 1024, 28], device=self.device, dtype=torch.float32)
-        rewards = 0.0
-        disc_rewards = 0.0
+        self._llc_actions = torch.zeros([self._llc_steps, self.num_actors, 28], device=self.device, dtype=torch.float32)
+        rewards = torch.zeros([self.num_actors], device=self.device, dtype=torch.float32)
+        disc_rewards = torch.zeros([self.num_actors], device=self.device, dtype=torch.float32)
         done_count = 0.0
         terminate_count = 0.0
         for t in range(self._llc_steps): #low-level controller sample 5
@@ -58,25 +56,22 @@ class AnyskillAgent(common_agent.CommonAgent):
             obs[..., self.obs_shape[0] - self._task_size:] = self._text_latents
             self.obs['obs'] = obs
 
-            if self.RENDER:
-                images = self.vec_env.env.task.render_img()
-                image_features = self.mlip_encoder.encode_images(images)
-            else:
-                state_embeds = infos['state_embeds'][:, :15, :3]
-                image_features = self.anyskill.get_motion_embedding(state_embeds)
-
-            image_features_norm = image_features / image_features.norm(dim=-1, keepdim=True)
-            anyskill_rewards, similarity = self.vec_env.env.task.compute_anyskill_reward(image_features_norm, self._text_latents,
-                                                                             self._latent_text_idx)
-            curr_rewards = anyskill_rewards + aux_rewards
+            anyskill_out = self._reward_graph.compute('anyskill', infos)
+            if anyskill_out is not None:
+                anyskill_rewards, similarity = anyskill_out
+                rewards += anyskill_rewards
+
+            curr_aux_rewards = self._reward_graph.compute('aux', aux_rewards)
+            if curr_aux_rewards is not None:
+                rewards += self._aux_reward_w * curr_aux_rewards
+
             self._llc_actions[t] = llc_actions
-            rewards += curr_rewards
             done_count += curr_dones
             terminate_count += infos['terminate']
             
-            amp_obs = infos['amp_obs']
-            curr_disc_reward = self._calc_disc_reward(amp_obs)
-            disc_rewards += curr_disc_reward
+            curr_disc_reward = self._reward_graph.compute('disc', infos['amp_obs'])
+            if curr_disc_reward is not None:
+                disc_rewards += curr_disc_reward
 
         rewards /= self._llc_steps
         disc_rewards /= self._llc_steps
@@ -88,9 +83,10 @@ class AnyskillAgent(common_agent.CommonAgent):
         infos['terminate'] = terminate
         infos['disc_rewards'] = disc_rewards
 
-        wandb.log({"similarity": similarity.mean().item()})
-        wandb.log({"reward/anyskill_reward": anyskill_rewards.mean().item()})
-        wandb.log({"reward/aux_reward": aux_rewards.mean().item()})
+        if anyskill_out is not None:
+            self._metrics.add_scalar("similarity", similarity)
+            self._metrics.add_scalar("reward/anyskill_reward", anyskill_rewards)
+        self._metrics.add_scalar("reward/aux_reward", aux_rewards)
 
 
         if self.is_tensor_obses:
@@ -102,11 +98,6 @@ class AnyskillAgent(common_agent.CommonAgent):
                 rewards = np.expand_dims(rewards, axis=1)
             return self.obs_to_tensors(obs), torch.from_numpy(rewards).to(self.ppo_device).float(), torch.from_numpy(dones).to(self.ppo_device), infos, self._llc_actions
 
-    def cast_obs(self, obs):
-        obs = super().cast_obs(obs)
-        self._llc_agent.is_tensor_obses = self.is_tensor_obses
-        return obs
-
     def preprocess_actions(self, actions):
         clamped_actions = torch.clamp(actions, -1.0, 1.0)
         if not self.is_tensor_obses:
@@ -162,6 +153,7 @@ class AnyskillAgent(common_agent.CommonAgent):
             self.experience_buffer.update_data('obses', n, self.obs['obs'])
 
             res_dict = self.get_action_values(self.obs)
+            self._resolve_next_values(res_dict['values'], [self.obs['obs']])
 
             for k in update_list:
                 self.experience_buffer.update_data(k, n, res_dict[k]) 
@@ -174,19 +166,18 @@ class AnyskillAgent(common_agent.CommonAgent):
             shaped_rewards = self.rewards_shaper(rewards)
             # self.experience_buffer.update_data('text_latents', n, self._text_latents)
             self.experience_buffer.update_data('rewards', n, shaped_rewards)
-            self.experience_buffer.update_data('next_obses', n, self.obs['obs'])
             self.experience_buffer.update_data('dones', n, self.dones)
 
-            self.experience_buffer.update_data('disc_rewards', n, infos['disc_rewards'])
+            if self._reward_graph.is_active('disc'):
+                self.experience_buffer.update_data('disc_rewards', n, infos['disc_rewards'])
 
-            style_rewards = self._calc_style_reward(res_dict['actions'])
-            self.experience_buffer.update_data('style_rewards', n, style_rewards)
+            style_rewards = self._reward_graph.compute('style', res_dict['actions'])
+            if style_rewards is not None:
+                self.experience_buffer.update_data('style_rewards', n, style_rewards)
 
             terminated = infos['terminate'].float()
             terminated = terminated.unsqueeze(-1)
-            next_vals = self._eval_critic(self.obs)
-            next_vals *= (1.0 - terminated)
-            self.experience_buffer.update_data('next_values', n, next_vals)
+            self._store_next_values(n, terminated, [self.obs['obs']])
 
             self.current_rewards += rewards
             self.current_lengths += 1
@@ -204,9 +195,8 @@ class AnyskillAgent(common_agent.CommonAgent):
 
             done_indices = done_indices[:, 0]
 
-        mb_fdones = self.experience_buffer.tensor_dict['dones'].float()
-        mb_values = self.experience_buffer.tensor_dict['values']
-        mb_next_values = self.experience_buffer.tensor_dict['next_values']
+        self._resolve_next_values()
+        self._store_last_obs()
 
         mb_rewards = self.experience_buffer.tensor_dict['rewards']
         mb_disc_rewards = self.experience_buffer.tensor_dict['disc_rewards']
@@ -215,12 +205,7 @@ class AnyskillAgent(common_agent.CommonAgent):
 
         mb_rewards = self._combine_rewards(mb_rewards, mb_disc_rewards, mb_style_rewards)
 
-        mb_advs = self.discount_values(mb_fdones, mb_values, mb_rewards, mb_next_values)
-        mb_returns = mb_advs + mb_values
-
-        batch_dict = self.experience_buffer.get_transformed_list(a2c_common.swap_and_flatten01, self.tensor_list)
-        batch_dict['returns'] = a2c_common.swap_and_flatten01(mb_returns)
-        batch_dict['played_frames'] = self.batch_size
+        batch_dict = self._postprocess_rollout(mb_rewards)
 
         return batch_dict
     
@@ -230,8 +215,20 @@ class AnyskillAgent(common_agent.CommonAgent):
         self._task_reward_w = config['task_reward_w']
         self._disc_reward_w = config['disc_reward_w']
         self._style_reward_w = config['style_reward_w']
+        self._aux_reward_w = config.get('aux_reward_w', 1.0)
         return
 
+    def _build_reward_graph(self, config):
+        # aux is weighted into the task reward, anyskill, disc and style are combined in _combine_rewards
+        terms = [
+            reward_terms.RewardTerm('anyskill', self._task_reward_w, self._calc_anyskill_reward),
+            reward_terms.RewardTerm('aux', self._task_reward_w * self._aux_reward_w, lambda aux_rewards: aux_rewards),
+            reward_terms.RewardTerm('disc', self._disc_reward_w, self._calc_disc_reward),
+            reward_terms.RewardTerm('style', self._style_reward_w, self._calc_style_reward)
+        ]
+        reward_graph = reward_terms.RewardGraph(terms, logged=config.get('logged_reward_terms', []))
+        return reward_graph
+
     def _get_mean_rewards(self):
         rewards = super()._get_mean_rewards()
         rewards *= self._llc_steps
@@ -276,73 +273,42 @@ class AnyskillAgent(common_agent.CommonAgent):
 
         return
 
-    def _get_motion_encoding(self):
-        all_encoded_demo_amp_obs = []
-        for motion_id in range(self.vec_env.env.task._motion_lib._motion_weights.shape[0]):
-            motion_amp_obs = self.vec_env.env.task.fetch_amp_obs_demo_per_id(32, motion_id)[-1].view(32, self.vec_env.env.task._num_amp_obs_enc_steps, self.vec_env.env.task._num_amp_obs_per_step)
-
-            preproc_amp_obs = self._llc_agent._preproc_amp_obs(motion_amp_obs)
-            encoded_demo_amp_obs = self._llc_agent.model.a2c_network.eval_enc(preproc_amp_obs)
-            all_encoded_demo_amp_obs.append(encoded_demo_amp_obs)
-        all_encoded_demo_amp_obs = torch.stack(all_encoded_demo_amp_obs, dim=0)
-
-        return all_encoded_demo_amp_obs
+    def _get_resume_state(self):
+        state = super()._get_resume_state()
+        state['text_latents'] = self._text_latents
+        state['latent_text_idx'] = self._latent_text_idx
+        state['latent_reset_steps'] = self._latent_reset_steps
+        return state
+
+    def _set_resume_state(self, state):
+        super()._set_resume_state(state)
+        self._text_latents.copy_(state['text_latents'])
+        self._latent_text_idx.copy_(state['latent_text_idx'])
+        self._latent_reset_steps.copy_(state['latent_reset_steps'])
+        return
 
     def _build_llc(self, config_params, checkpoint_file):
-        network_params = config_params['network']
-
-        network_builder = calm_network_builder.CALMBuilder()
-
-        network_builder.load(network_params)
-
-        network = calm_models.ModelCALMContinuous(network_builder)
-
-        llc_agent_config = self._build_llc_agent_config(config_params, network)
-
-        self._llc_agent = calm_agent.CALMAgent('llc', llc_agent_config)
+        obs_size = self.env_info['observation_space'].shape[0] - self._task_size
+        amp_obs_size = self.env_info['amp_observation_space'].shape[0]
+        num_amp_obs_steps = self.vec_env.env.task._num_amp_obs_steps
 
+        self._llc_agent = llc_inference.LLCInference(config_params, obs_size, self.env_info['action_space'],
+                                                     amp_obs_size, num_amp_obs_steps, self.ppo_device,
+                                                     step_mode=self._llc_step_mode)
         self._llc_agent.restore(checkpoint_file)
         print("Loaded LLC checkpoint from {:s}".format(checkpoint_file))
-        self._llc_agent.set_eval()
 
-        # enc_amp_obs = self._llc_agent._fetch_amp_obs_demo(128)
-        # if len(enc_amp_obs) == 2:
-        #     enc_amp_obs = enc_amp_obs[0]
-        #
-        # preproc_enc_amp_obs = self._llc_agent._preproc_amp_obs(enc_amp_obs)
-        # self.encoded_motion = self._llc_agent.model.a2c_network.eval_enc(amp_obs=preproc_enc_amp_obs).unsqueeze(0)
-        self.encoded_motion = self._get_motion_encoding()
+        self._latent_index = latent_index.LatentIndex.load_or_build(self.vec_env.env.task, self._llc_agent.eval_enc,
+                                                                    checkpoint_file, self._latent_index_stride,
+                                                                    cache_dir=self._latent_index_dir)
 
         return
 
-    def _build_llc_agent_config(self, config_params, network):
-        llc_env_info = copy.deepcopy(self.env_info)
-        obs_space = llc_env_info['observation_space']
-        obs_size = obs_space.shape[0]
-        obs_size -= self._task_size
-        llc_env_info['observation_space'] = spaces.Box(obs_space.low[:obs_size], obs_space.high[:obs_size])
-
-        config = config_params['config']
-        config['network'] = network
-        config['num_actors'] = self.num_actors
-        config['features'] = {'observer': self.algo_observer}
-        config['env_info'] = llc_env_info
-        config['minibatch_size'] = 1
-        config['amp_batch_size'] = 32
-        config['amp_minibatch_size'] = 1
-        config['enable_eps_greedy'] = False
-        config['vec_env'] = self.vec_env
-
-        return config
-
     def _compute_llc_action(self, obs, actions):
         llc_obs = self._extract_llc_obs(obs)
-        processed_obs = self._llc_agent._preproc_obs(llc_obs)
-
-        z = torch.nn.functional.normalize(actions, dim=-1)
-        mu, _ = self._llc_agent.model.a2c_network.eval_actor(processed_obs, z)
-        llc_action = mu
-        llc_action = self._llc_agent.preprocess_actions(llc_action)
+        llc_action = self._llc_agent.compute_action(llc_obs, actions)
+        if not self.is_tensor_obses:
+            llc_action = llc_action.cpu().numpy()
 
         return llc_action
 
@@ -351,18 +317,36 @@ class AnyskillAgent(common_agent.CommonAgent):
         llc_obs = obs[..., :obs_size - self._task_size]
         return llc_obs
 
+    def _calc_anyskill_reward(self, infos):
+        if self.RENDER:
+            images = self.vec_env.env.task.render_img()
+            image_features = self.mlip_encoder.encode_images(images)
+        else:
+            state_embeds = infos['state_embeds'][:, :15, :3]
+            image_features = self.anyskill.get_motion_embedding(state_embeds)
+
+        image_features_norm = image_features / image_features.norm(dim=-1, keepdim=True)
+        anyskill_rewards, similarity = self.vec_env.env.task.compute_anyskill_reward(image_features_norm, self._text_latents,
+                                                                                     self._latent_text_idx)
+        return anyskill_rewards, similarity
+
     def _calc_disc_reward(self, amp_obs):
-        disc_reward = self._llc_agent._calc_disc_rewards(amp_obs)
+        disc_reward = self._llc_agent.calc_disc_rewards(amp_obs)
         return disc_reward
 
     def _calc_style_reward(self, action):
         z = torch.nn.functional.normalize(action, dim=-1)
-        style_reward = torch.max((cosine_similarity(z.unsqueeze(1), self.encoded_motion, dim=-1) + 1) / 2, dim=1)[0]
+        max_sim, _ = self._latent_index.max_cosine(z)
+        style_reward = (max_sim + 1) / 2
         return style_reward.unsqueeze(-1)
 
     def _combine_rewards(self, task_rewards, disc_rewards, style_rewards):
-        combined_rewards = self._task_reward_w * task_rewards + \
-                         + self._disc_reward_w * disc_rewards + self._style_reward_w * style_rewards
+        # the stored task rewards already contain the aux term, so they are weighted with the anyskill weight
+        combined_rewards = self._reward_graph.combine({
+            'anyskill': task_rewards,
+            'disc': disc_rewards if self._reward_graph.is_active('disc') else None,
+            'style': style_rewards if self._reward_graph.is_active('style') else None
+        })
 
         return combined_rewards
 
@@ -375,13 +359,15 @@ class AnyskillAgent(common_agent.CommonAgent):
     def _log_train_info(self, train_info, frame):
         super()._log_train_info(train_info, frame)
 
-        disc_reward_std, disc_reward_mean = torch.std_mean(train_info['disc_rewards'])
-        self.writer.add_scalar('info/disc_reward_mean', disc_reward_mean.item(), frame)
-        self.writer.add_scalar('info/disc_reward_std', disc_reward_std.item(), frame)
+        if self._reward_graph.is_active('disc'):
+            disc_reward_std, disc_reward_mean = torch.std_mean(train_info['disc_rewards'])
+            self._metrics.add_scalar('info/disc_reward_mean', disc_reward_mean)
+            self._metrics.add_scalar('info/disc_reward_std', disc_reward_std)
 
-        style_reward_std, style_reward_mean = torch.std_mean(train_info['style_rewards'])
-        self.writer.add_scalar('info/style_reward_mean', style_reward_mean.item(), frame)
-        self.writer.add_scalar('info/style_reward_std', style_reward_std.item(), frame)
+        if self._reward_graph.is_active('style'):
+            style_reward_std, style_reward_mean = torch.std_mean(train_info['style_rewards'])
+            self._metrics.add_scalar('info/style_reward_mean', style_reward_mean)
+            self._metrics.add_scalar('info/style_reward_std', style_reward_std)
         return
 
 
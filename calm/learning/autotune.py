@@ -0,0 +1,243 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import itertools
+import math
+import queue
+import random
+import resource
+import threading
+import time
+import traceback
+
+import torch
+import torch.multiprocessing as mp
+import yaml
+
+
+class Autotuner:
+    # Searches training settings (e.g. num_envs, horizon_length, minibatch_size) for the highest
+    # throughput under a memory ceiling. probe_fn(setting, num_epochs) runs num_epochs timed epochs of
+    # a training loop with the given setting and returns its steps/sec. Every probe runs in a fresh
+    # spawned process, so that simulator state, allocator caches and out of memory errors do not leak
+    # between probes and the peak memory of each probe can be measured on its own.
+    #
+    # search='grid' probes every setting once with num_epochs. search='bandit' runs successive halving:
+    # all settings (or num_trials random ones) are probed with num_epochs, the best 1/eta are kept and
+    # probed again with eta times the epochs until one setting remains.
+    def __init__(self, probe_fn, space, device, max_memory=None, num_epochs=3, search='grid', num_trials=0,
+                 eta=2, timeout=None, seed=0):
+        assert(search in ['grid', 'bandit'])
+        assert(eta >= 2)
+        self._probe_fn = probe_fn
+        self._device = device
+        self._max_memory = max_memory
+        self._num_epochs = num_epochs
+        self._search = search
+        self._eta = eta
+        self._timeout = timeout
+        self._results = []
+
+        self._settings = [s for s in build_grid(space) if is_valid_setting(s)]
+        if num_trials > 0 and num_trials < len(self._settings):
+            self._settings = random.Random(seed).sample(self._settings, num_trials)
+        assert(len(self._settings) > 0), 'no valid settings in the search space'
+        return
+
+    def get_results(self):
+        return self._results
+
+    def run(self):
+        if self._search == 'grid':
+            self._run_grid()
+        else:
+            self._run_bandit()
+        return self.get_best()
+
+    def get_best(self):
+        # results of the last round that every remaining setting was probed in
+        if len(self._results) == 0:
+            return None
+        last_round = max([r['round'] for r in self._results])
+        candidates = [r for r in self._results if r['round'] == last_round and r['ok']]
+        if len(candidates) == 0:
+            candidates = [r for r in self._results if r['ok']]
+        if len(candidates) == 0:
+            return None
+        return max(candidates, key=lambda r: r['steps_per_sec'])
+
+    def _run_grid(self):
+        for setting in self._settings:
+            self._probe(setting, self._num_epochs, 0)
+        return
+
+    def _run_bandit(self):
+        settings = self._settings
+        num_epochs = self._num_epochs
+        round_id = 0
+        while True:
+            round_results = [self._probe(s, num_epochs, round_id) for s in settings]
+            round_results = [r for r in round_results if r['ok']]
+            if len(round_results) <= 1:
+                break
+
+            round_results.sort(key=lambda r: r['steps_per_sec'], reverse=True)
+            num_keep = max(1, int(math.ceil(len(round_results) / self._eta)))
+            settings = [r['setting'] for r in round_results[:num_keep]]
+            num_epochs *= self._eta
+            round_id += 1
+        return
+
+    def _probe(self, setting, num_epochs, round_id):
+        result = run_probe(self._probe_fn, setting, num_epochs, self._device, timeout=self._timeout)
+        result['round'] = round_id
+        result['num_epochs'] = num_epochs
+        result['within_memory'] = (result['peak_memory'] is None or self._max_memory is None
+                                   or result['peak_memory'] <= self._max_memory)
+        result['ok'] = result['error'] is None and result['within_memory']
+        self._results.append(result)
+        print(format_result(result))
+        return result
+
+
+def build_grid(space):
+    # space: {name: [values]} -> list of {name: value} settings over the cartesian product
+    names = list(space.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*[space[n] for n in names])]
+
+
+def is_valid_setting(setting):
+    # the rollout batch has to split into whole minibatches
+    num_envs = setting.get('num_envs', None)
+    horizon_length = setting.get('horizon_length', None)
+    minibatch_size = setting.get('minibatch_size', None)
+    if num_envs is None or horizon_length is None or minibatch_size is None:
+        return True
+    batch_size = num_envs * horizon_length
+    return minibatch_size <= batch_size and batch_size % minibatch_size == 0
+
+
+def run_probe(probe_fn, setting, num_epochs, device, timeout=None):
+    ctx = mp.get_context('spawn')
+    result_queue = ctx.Queue()
+    p = ctx.Process(target=_probe_main, args=(probe_fn, setting, num_epochs, device, result_queue))
+    start = time.perf_counter()
+    p.start()
+
+    result = None
+    while result is None:
+        try:
+            result = result_queue.get(timeout=1.0)
+        except queue.Empty:
+            if not p.is_alive():
+                try:
+                    result = result_queue.get(timeout=1.0)
+                except queue.Empty:
+                    result = _failed_result(setting, "probe exited with code {}".format(p.exitcode))
+            elif timeout is not None and time.perf_counter() - start > timeout:
+                p.terminate()
+                result = _failed_result(setting, "probe timed out after {:.0f}s".format(timeout))
+
+    p.join()
+    return result
+
+
+def get_memory_usage(device):
+    # device wide memory in use for cuda devices, which includes memory allocated outside of torch
+    # (simulation, rendering), and the peak resident set size of the process otherwise
+    if torch.device(device).type == 'cuda':
+        free, total = torch.cuda.mem_get_info(device)
+        return total - free
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def write_overlay(path, overlay):
+    with open(path, 'w') as f:
+        yaml.safe_dump(overlay, f, default_flow_style=False, sort_keys=False)
+    return
+
+
+def format_result(result):
+    setting = ", ".join(["{}={}".format(k, v) for k, v in result['setting'].items()])
+    if result['error'] is not None:
+        return "[{}] failed: {}".format(setting, result['error'].splitlines()[-1])
+
+    line = "[{}] epochs={:d} steps/s={:.1f} peak_mem={:.2f}GB".format(setting, result['num_epochs'],
+                                                                    result['steps_per_sec'],
+                                                                    result['peak_memory'] / 1024 ** 3)
+    if not result['within_memory']:
+        line += " (over memory limit)"
+    return line
+
+
+class _PeakMemorySampler:
+    def __init__(self, device, interval=0.05):
+        self._device = device
+        self._interval = interval
+        self._peak = get_memory_usage(device)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+        self._peak = max(self._peak, get_memory_usage(self._device))
+        return self._peak
+
+    def _run(self):
+        while not self._stop_event.wait(self._interval):
+            self._peak = max(self._peak, get_memory_usage(self._device))
+        return
+
+
+def _probe_main(probe_fn, setting, num_epochs, device, result_queue):
+    sampler = _PeakMemorySampler(device)
+    try:
+        steps_per_sec = probe_fn(setting, num_epochs)
+        result = {
+            'setting': setting,
+            'steps_per_sec': steps_per_sec,
+            'peak_memory': sampler.stop(),
+            'error': None
+        }
+    except Exception:
+        sampler.stop()
+        result = _failed_result(setting, traceback.format_exc())
+    result_queue.put(result)
+    return
+
+
+def _failed_result(setting, error):
+    return {
+        'setting': setting,
+        'steps_per_sec': 0.0,
+        'peak_memory': None,
+        'error': error
+    }
@@ -27,13 +27,16 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 from learning import amp_agent 
+from learning import amp_obs_ring
+from learning import rollout_postprocess
+from learning import demo_prefetcher
+from learning import mixed_precision
 
 import torch
 
 import numpy as np
 from isaacgym.torch_utils import *
 from rl_games.algos_torch import torch_ext
-from rl_games.common import a2c_common
 
 import time
 
@@ -51,12 +54,51 @@ class CALMAgent(amp_agent.AMPAgent):
         
         batch_shape = self.experience_buffer.obs_base_shape
         self.experience_buffer.tensor_dict['calm_latents'] = torch.zeros(batch_shape + (self._latent_dim,), dtype=torch.float32, device=self.ppo_device)
-        self.experience_buffer.tensor_dict['enc_amp_obs'] = torch.zeros(batch_shape + self._enc_amp_observation_space.shape, dtype=torch.float32, device=self.ppo_device)
+        # encoder windows stay constant between latent resets, so the experience buffer only keeps
+        # an index per step into a table of the distinct windows seen during the rollout
+        self.experience_buffer.tensor_dict['enc_amp_obs_ids'] = torch.zeros(batch_shape, dtype=torch.long, device=self.ppo_device)
         
         self._calm_latents = torch.zeros((batch_shape[-1], self._latent_dim), dtype=torch.float32, device=self.ppo_device) #(1024,64)
         self._enc_amp_obs = torch.zeros((batch_shape[-1], self._enc_amp_observation_space.shape[-1]), dtype=torch.float32, device=self.ppo_device)
+        self._enc_amp_obs_ids = torch.arange(batch_shape[-1], dtype=torch.long, device=self.ppo_device)
+        self._enc_amp_obs_table = self._enc_amp_obs
+        self._enc_amp_obs_table_rows = None
+        self._enc_amp_obs_table_size = 0
         
-        self.tensor_list += ['calm_latents', 'enc_amp_obs']
+        self.tensor_list += ['calm_latents', 'enc_amp_obs_ids']
+
+        # amp_obs windows are kept as frames in a per-env ring, the experience buffer stores the ring
+        # position of each step's window
+        del self.experience_buffer.tensor_dict['amp_obs']
+        self.tensor_list.remove('amp_obs')
+        self.experience_buffer.tensor_dict['amp_obs_heads'] = torch.zeros(batch_shape, dtype=torch.long, device=self.ppo_device)
+        self.tensor_list += ['amp_obs_heads']
+
+        amp_obs_dtype = getattr(torch, self._experience_storage_dtypes.get('amp_obs', 'float32'))
+        self._experience_storage_dtypes = {k: v for k, v in self._experience_storage_dtypes.items() if k != 'amp_obs'}
+        num_amp_obs_steps = self.vec_env.env.task._num_amp_obs_steps
+        amp_obs_frame_size = self._amp_observation_space.shape[0] // num_amp_obs_steps
+        self._amp_obs_ring = amp_obs_ring.AMPObsRing(batch_shape[-1], num_amp_obs_steps, amp_obs_frame_size,
+                                                     self.horizon_length + num_amp_obs_steps, self.ppo_device,
+                                                     dtype=amp_obs_dtype)
+        self._amp_obs_env_ids = torch.arange(batch_shape[-1], dtype=torch.long, device=self.ppo_device)
+        self._amp_obs_batch_env_ids = self._amp_obs_env_ids.repeat_interleave(self.horizon_length)
+
+        # the replay keeps whole rollout trajectories of a few envs as frames in a second ring, one lane
+        # per kept env, and only stores the (lane, position, encoder window row) ids of each sample.
+        # Every store writes num_lanes * horizon samples, so the replay evicts a sample after a fixed
+        # number of stores and both tables are sized to outlive it.
+        replay_buffer_size = self._amp_replay_buffer.get_buffer_size()
+        num_replay_lanes = int(round(batch_shape[-1] * self._amp_replay_keep_prob))
+        num_replay_lanes = min(max(num_replay_lanes, 1), max(replay_buffer_size // self.horizon_length, 1))
+        replay_lifetime = int(np.ceil(replay_buffer_size / (num_replay_lanes * self.horizon_length))) + 2
+        self._amp_replay_ring = amp_obs_ring.AMPObsRing(num_replay_lanes, num_amp_obs_steps, amp_obs_frame_size,
+                                                        replay_lifetime * self.horizon_length + num_amp_obs_steps,
+                                                        self.ppo_device, dtype=amp_obs_dtype)
+        self._enc_amp_obs_replay_table = amp_obs_ring.RowTable(self._enc_amp_observation_space.shape, replay_lifetime,
+                                                               self.ppo_device, capacity=2 * num_replay_lanes)
+        self._amp_replay_lane_ids = torch.arange(num_replay_lanes, dtype=torch.long, device=self.ppo_device)
+        self._amp_replay_batch_lane_ids = self._amp_replay_lane_ids.repeat_interleave(self.horizon_length)
 
         self._latent_reset_steps = torch.zeros(batch_shape[-1], dtype=torch.int32, device=self.ppo_device)
         num_envs = self.vec_env.env.task.num_envs
@@ -65,6 +107,28 @@ class CALMAgent(amp_agent.AMPAgent):
 
         return
 
+    def _get_resume_state(self):
+        state = super()._get_resume_state()
+        state['calm_latents'] = self._calm_latents
+        state['enc_amp_obs'] = self._enc_amp_obs
+        state['latent_reset_steps'] = self._latent_reset_steps
+        state['amp_replay_ring'] = self._amp_replay_ring.state_dict()
+        state['enc_amp_obs_replay_table'] = self._enc_amp_obs_replay_table.state_dict()
+        if self._enc_reg_demo_prefetcher is not None:
+            state['enc_reg_demo_prefetcher'] = self._enc_reg_demo_prefetcher.state_dict()
+        return state
+
+    def _set_resume_state(self, state):
+        super()._set_resume_state(state)
+        self._calm_latents.copy_(state['calm_latents'])
+        self._enc_amp_obs.copy_(state['enc_amp_obs'])
+        self._latent_reset_steps.copy_(state['latent_reset_steps'])
+        self._amp_replay_ring.load_state_dict(state['amp_replay_ring'])
+        self._enc_amp_obs_replay_table.load_state_dict(state['enc_amp_obs_replay_table'])
+        if self._enc_reg_demo_prefetcher is not None and 'enc_reg_demo_prefetcher' in state:
+            self._enc_reg_demo_prefetcher.load_state_dict(state['enc_reg_demo_prefetcher'])
+        return
+
     def play_steps(self):
         self.set_eval()
         
@@ -72,6 +136,8 @@ class CALMAgent(amp_agent.AMPAgent):
         done_indices = []
         update_list = self.update_list
 
+        self._begin_enc_amp_obs_table()
+
         for n in range(self.horizon_length):
             self.obs = self.env_reset(done_indices)
             self.experience_buffer.update_data('obses', n, self.obs['obs'])
@@ -83,6 +149,7 @@ class CALMAgent(amp_agent.AMPAgent):
                 res_dict = self.get_masked_action_values(self.obs, self._calm_latents, masks)
             else:
                 res_dict = self.get_action_values(self.obs, self._calm_latents, self._rand_action_probs)
+            self._resolve_next_values(res_dict['values'], [self.obs['obs'], self._calm_latents])
 
             for k in update_list:
                 self.experience_buffer.update_data(k, n, res_dict[k]) 
@@ -93,18 +160,15 @@ class CALMAgent(amp_agent.AMPAgent):
             self.obs, rewards, self.dones, infos = self.env_step(res_dict['actions'])
             shaped_rewards = self.rewards_shaper(rewards)
             self.experience_buffer.update_data('rewards', n, shaped_rewards)
-            self.experience_buffer.update_data('next_obses', n, self.obs['obs'])
             self.experience_buffer.update_data('dones', n, self.dones)
-            self.experience_buffer.update_data('amp_obs', n, infos['amp_obs'])
+            self.experience_buffer.update_data('amp_obs_heads', n, self._amp_obs_ring.push(infos['amp_obs'], done_indices))
             self.experience_buffer.update_data('calm_latents', n, self._calm_latents)
-            self.experience_buffer.update_data('enc_amp_obs', n, self._enc_amp_obs)
+            self.experience_buffer.update_data('enc_amp_obs_ids', n, self._enc_amp_obs_ids)
             self.experience_buffer.update_data('rand_action_mask', n, res_dict['rand_action_mask'])
 
             terminated = infos['terminate'].float()
             terminated = terminated.unsqueeze(-1)
-            next_vals = self._eval_critic(self.obs, self._calm_latents)
-            next_vals *= (1.0 - terminated)
-            self.experience_buffer.update_data('next_values', n, next_vals)
+            self._store_next_values(n, terminated, [self.obs['obs'], self._calm_latents])
 
             self.current_rewards += rewards
             self.current_lengths += 1
@@ -125,25 +189,16 @@ class CALMAgent(amp_agent.AMPAgent):
 
             done_indices = done_indices[:, 0]
 
-        mb_fdones = self.experience_buffer.tensor_dict['dones'].float()
-        mb_values = self.experience_buffer.tensor_dict['values']
-        mb_next_values = self.experience_buffer.tensor_dict['next_values']
-        
+        self._resolve_next_values()
+        self._store_last_obs()
+
+        self._end_enc_amp_obs_table()
+
         mb_rewards = self.experience_buffer.tensor_dict['rewards']
-        mb_amp_obs = self.experience_buffer.tensor_dict['amp_obs']
-        mb_calm_latents = self.experience_buffer.tensor_dict['calm_latents']
-        amp_rewards = self._calc_amp_rewards(mb_amp_obs, mb_calm_latents)
+        amp_rewards = self._calc_rollout_amp_rewards()
         mb_rewards = self._combine_rewards(mb_rewards, amp_rewards)
-        
-        mb_advs = self.discount_values(mb_fdones, mb_values, mb_rewards, mb_next_values)
-        mb_returns = mb_advs + mb_values
-
-        batch_dict = self.experience_buffer.get_transformed_list(a2c_common.swap_and_flatten01, self.tensor_list)
-        batch_dict['returns'] = a2c_common.swap_and_flatten01(mb_returns)
-        batch_dict['played_frames'] = self.batch_size
 
-        for k, v in amp_rewards.items():
-            batch_dict[k] = a2c_common.swap_and_flatten01(v)
+        batch_dict = self._postprocess_rollout(mb_rewards, amp_rewards)
 
         return batch_dict
 
@@ -183,8 +238,12 @@ class CALMAgent(amp_agent.AMPAgent):
     def prepare_dataset(self, batch_dict):
         super().prepare_dataset(batch_dict)
 
-        self.dataset.values_dict['enc_amp_obs'] = batch_dict['enc_amp_obs']
-        self.dataset.values_dict['enc_amp_obs_replay'] = batch_dict['enc_amp_obs_replay']
+        self.dataset.values_dict['amp_obs_heads'] = batch_dict['amp_obs_heads']
+        self.dataset.values_dict['amp_obs_env_ids'] = self._amp_obs_batch_env_ids
+        self.dataset.values_dict['amp_obs_replay_lanes'] = batch_dict.get('amp_obs_replay_lanes', None)
+        self.dataset.values_dict['amp_obs_replay_heads'] = batch_dict['amp_obs_replay_heads']
+        self.dataset.values_dict['enc_amp_obs_ids'] = batch_dict['enc_amp_obs_ids']
+        self.dataset.values_dict['enc_amp_obs_replay_ids'] = batch_dict['enc_amp_obs_replay_ids']
         self.dataset.values_dict['enc_amp_obs_demo'] = batch_dict['enc_amp_obs_demo']
 
         return
@@ -203,18 +262,19 @@ class CALMAgent(amp_agent.AMPAgent):
         rnn_masks = batch_dict.get('rnn_masks', None)
 
         self._update_amp_demos()
-        num_obs_samples = batch_dict['amp_obs'].shape[0]
+        num_obs_samples = batch_dict['amp_obs_heads'].shape[0]
         samples = self._amp_obs_demo_buffer.sample(num_obs_samples)
         batch_dict['amp_obs_demo'] = samples['amp_obs']
         batch_dict['enc_amp_obs_demo'] = samples['enc_amp_obs']
 
         if self._amp_replay_buffer.get_total_count() == 0:
-            batch_dict['amp_obs_replay'] = batch_dict['amp_obs']
-            batch_dict['enc_amp_obs_replay'] = batch_dict['enc_amp_obs']
+            batch_dict['amp_obs_replay_heads'] = batch_dict['amp_obs_heads']
+            batch_dict['enc_amp_obs_replay_ids'] = batch_dict['enc_amp_obs_ids']
         else:
             samples = self._amp_replay_buffer.sample(num_obs_samples)
-            batch_dict['amp_obs_replay'] = samples['amp_obs']
-            batch_dict['enc_amp_obs_replay'] = samples['enc_amp_obs']
+            batch_dict['amp_obs_replay_lanes'] = samples['amp_obs_lanes']
+            batch_dict['amp_obs_replay_heads'] = samples['amp_obs_heads']
+            batch_dict['enc_amp_obs_replay_ids'] = samples['enc_amp_obs_ids']
 
         self.set_train()
 
@@ -241,7 +301,7 @@ class CALMAgent(amp_agent.AMPAgent):
                         curr_train_info['kl'] = self.hvd.average_value(curr_train_info['kl'], 'ep_kls')
                     self.last_lr, self.entropy_coef = self.scheduler.update(self.last_lr, self.entropy_coef,
                                                                             self.epoch_num, 0,
-                                                                            curr_train_info['kl'].item())
+                                                                            self._get_scheduler_kl(curr_train_info['kl']))
                     self.update_lr(self.last_lr)
 
                 if train_info is None:
@@ -258,14 +318,14 @@ class CALMAgent(amp_agent.AMPAgent):
                 if self.multi_gpu:
                     av_kls = self.hvd.average_value(av_kls, 'ep_kls')
                 self.last_lr, self.entropy_coef = self.scheduler.update(self.last_lr, self.entropy_coef, self.epoch_num,
-                                                                        0, av_kls.item())
+                                                                        0, self._get_scheduler_kl(av_kls))
                 self.update_lr(self.last_lr)
 
         if self.schedule_type == 'standard_epoch':
             if self.multi_gpu:
                 av_kls = self.hvd.average_value(torch_ext.mean_list(kls), 'ep_kls')
             self.last_lr, self.entropy_coef = self.scheduler.update(self.last_lr, self.entropy_coef, self.epoch_num, 0,
-                                                                    av_kls.item())
+                                                                    self._get_scheduler_kl(av_kls))
             self.update_lr(self.last_lr)
 
         update_time_end = time.time()
@@ -273,7 +333,7 @@ class CALMAgent(amp_agent.AMPAgent):
         update_time = update_time_end - update_time_start
         total_time = update_time_end - play_time_start
 
-        self._store_replay_amp_obs(batch_dict['amp_obs'], batch_dict['enc_amp_obs'])
+        self._store_replay_amp_obs(batch_dict['amp_obs_heads'], batch_dict['enc_amp_obs_ids'])
 
         train_info['play_time'] = play_time
         train_info['update_time'] = update_time
@@ -295,23 +355,39 @@ class CALMAgent(amp_agent.AMPAgent):
         obs_batch = input_dict['obs']
         obs_batch = self._preproc_obs(obs_batch)
 
-        enc_amp_obs = self._preproc_amp_obs(input_dict['enc_amp_obs'])
+        enc_amp_obs = self._enc_amp_obs_table[input_dict['enc_amp_obs_ids']]
+        enc_amp_obs = self._preproc_amp_obs(enc_amp_obs)
 
         mb_enc_amp_obs_demo = input_dict['enc_amp_obs_demo'][0:self._amp_minibatch_size]
         mb_enc_amp_obs_demo = self._preproc_amp_obs(mb_enc_amp_obs_demo)
 
-        mb_amp_obs = input_dict['amp_obs'][0:self._amp_minibatch_size]
+        mb_amp_obs_env_ids = input_dict['amp_obs_env_ids'][0:self._amp_minibatch_size]
+        mb_amp_obs = self._amp_obs_ring.get_windows(mb_amp_obs_env_ids, input_dict['amp_obs_heads'][0:self._amp_minibatch_size])
         mb_amp_obs = self._preproc_amp_obs(mb_amp_obs)
 
-        mb_amp_obs_replay = input_dict['amp_obs_replay'][0:self._amp_minibatch_size]
+        mb_amp_obs_replay_heads = input_dict['amp_obs_replay_heads'][0:self._amp_minibatch_size]
+        mb_enc_amp_obs_replay_ids = input_dict['enc_amp_obs_replay_ids'][0:self._amp_minibatch_size]
+        if 'amp_obs_replay_lanes' in input_dict:
+            mb_amp_obs_replay_lanes = input_dict['amp_obs_replay_lanes'][0:self._amp_minibatch_size]
+            mb_amp_obs_replay = self._amp_replay_ring.get_windows(mb_amp_obs_replay_lanes, mb_amp_obs_replay_heads)
+            mb_enc_amp_obs_replay = self._enc_amp_obs_replay_table.get(mb_enc_amp_obs_replay_ids)
+        else:
+            mb_amp_obs_replay = self._amp_obs_ring.get_windows(mb_amp_obs_env_ids, mb_amp_obs_replay_heads)
+            mb_enc_amp_obs_replay = self._enc_amp_obs_table[mb_enc_amp_obs_replay_ids]
         mb_amp_obs_replay = self._preproc_amp_obs(mb_amp_obs_replay)
 
         mb_amp_obs_demo = input_dict['amp_obs_demo'][0:self._amp_minibatch_size]
         mb_amp_obs_demo = self._preproc_amp_obs(mb_amp_obs_demo)
         mb_amp_obs_demo.requires_grad_(True)
 
+        mb_enc_amp_obs_replay = self._preproc_amp_obs(mb_enc_amp_obs_replay)
+
+        # The demo and replay windows share one encoder pass without gradients. They are not merged
+        # into the agent pass below, backpropagating through their rows would only add wasted work.
         with torch.no_grad():
-            mb_calm_latents_demo = self._eval_enc(mb_enc_amp_obs_demo)
+            enc_obs = [mb_enc_amp_obs_demo, mb_enc_amp_obs_replay]
+            enc_output = self._eval_enc(torch.cat([x.reshape(x.shape[0], -1) for x in enc_obs], dim=0))
+            mb_calm_latents_demo, mb_calm_latents_replay = torch.split(enc_output, [x.shape[0] for x in enc_obs], dim=0)
         mb_calm_latents_demo.requires_grad_(True)
 
         # Update relevant latents with output from enc to drive Gradients backward from policy to the encoder.
@@ -320,11 +396,6 @@ class CALMAgent(amp_agent.AMPAgent):
 
         mb_calm_latents = calm_latents[0:self._amp_minibatch_size] #4096->1024
 
-        mb_enc_amp_obs_replay = input_dict['enc_amp_obs_replay'][0:self._amp_minibatch_size]
-        mb_enc_amp_obs_replay = self._preproc_amp_obs(mb_enc_amp_obs_replay)
-        with torch.no_grad():
-            mb_calm_latents_replay = self._eval_enc(mb_enc_amp_obs_replay)
-
         rand_action_mask = input_dict['rand_action_mask']
         rand_action_sum = torch.sum(rand_action_mask)
 
@@ -359,7 +430,7 @@ class CALMAgent(amp_agent.AMPAgent):
             batch_dict['rnn_states'] = input_dict['rnn_states']
             batch_dict['seq_length'] = self.seq_len
 
-        with torch.cuda.amp.autocast(enabled=self.mixed_precision):
+        with self._autocast():
             res_dict = self.model(batch_dict)
 
             action_log_probs = res_dict['prev_neglogp']
@@ -480,9 +551,7 @@ class CALMAgent(amp_agent.AMPAgent):
         disc_loss += self._conditional_disc_logit_reg * disc_logit_loss
 
         # grad penalty (bp for meaningful latent code)
-        disc_demo_grad = torch.autograd.grad(disc_demo_logit, (obs_hrl, calm_latents),
-                                             grad_outputs=torch.ones_like(disc_demo_logit),
-                                             create_graph=True, retain_graph=True, only_inputs=True)
+        disc_demo_grad = mixed_precision.penalty_grads(disc_demo_logit, (obs_hrl, calm_latents), self.scaler)
         disc_demo_grad = disc_demo_grad[0]
         disc_demo_grad = torch.sum(torch.square(disc_demo_grad), dim=-1)
         disc_grad_penalty = torch.mean(disc_demo_grad)
@@ -508,8 +577,18 @@ class CALMAgent(amp_agent.AMPAgent):
         }
         return disc_info
 
+    def _fetch_enc_reg_demos(self, generator=None):
+        enc_amp_obs_demo, _ = self._fetch_amp_obs_demo(self._amp_minibatch_size, generator)
+        _, _, similar_enc_amp_obs_demo0, _, similar_enc_amp_obs_demo1 = self.vec_env.env.task.fetch_amp_obs_demo_pair(self._amp_minibatch_size,
+                                                                                                                      generator=generator)
+        return enc_amp_obs_demo, similar_enc_amp_obs_demo0, similar_enc_amp_obs_demo1
+
     def _enc_reg_loss(self):
-        enc_amp_obs_demo, _ = self._fetch_amp_obs_demo(self._amp_minibatch_size)
+        if self._enc_reg_demo_prefetcher is not None:
+            enc_amp_obs_demo, similar_enc_amp_obs_demo0, similar_enc_amp_obs_demo1 = self._enc_reg_demo_prefetcher.get()
+        else:
+            enc_amp_obs_demo, similar_enc_amp_obs_demo0, similar_enc_amp_obs_demo1 = self._fetch_enc_reg_demos()
+
         proc_enc_amp_obs_demo = self._preproc_amp_obs(enc_amp_obs_demo)
 
         amp_obs_encoding = self._eval_enc(proc_enc_amp_obs_demo)
@@ -517,8 +596,6 @@ class CALMAgent(amp_agent.AMPAgent):
         # Loss for uniform distribution over the sphere
         uniform_l = uniform_loss(amp_obs_encoding)
 
-        _, _, similar_enc_amp_obs_demo0, _, similar_enc_amp_obs_demo1 = self.vec_env.env.task.fetch_amp_obs_demo_pair(self._amp_minibatch_size)
-
         proc_similar_enc_amp_obs_demo0 = self._preproc_amp_obs(similar_enc_amp_obs_demo0)
         proc_similar_enc_amp_obs_demo1 = self._preproc_amp_obs(similar_enc_amp_obs_demo1)
 
@@ -569,6 +646,7 @@ class CALMAgent(amp_agent.AMPAgent):
         self._negative_disc_samples = config.get('negative_disc_samples', False)
 
         self._enc_reg_coeff = config.get('enc_regularization_coeff', 0)
+        self._enc_reg_demo_prefetcher = None
 
         self._enc_amp_observation_space = self.env_info['enc_amp_observation_space']
 
@@ -589,6 +667,11 @@ class CALMAgent(amp_agent.AMPAgent):
         self._calm_latents[env_ids] = z
         self._enc_amp_obs[env_ids] = enc_amp_obs_demo
 
+        if self._enc_amp_obs_table_rows is not None:
+            self._enc_amp_obs_table_rows.append(enc_amp_obs_demo)
+            self._enc_amp_obs_ids[env_ids] = self._enc_amp_obs_table_size + torch.arange(n, dtype=torch.long, device=self.ppo_device)
+            self._enc_amp_obs_table_size += n
+
         # # output
         # np.save("./output/calm_latent.npy", self._calm_latents.data.cpu().numpy())
 
@@ -597,6 +680,18 @@ class CALMAgent(amp_agent.AMPAgent):
 
         return
 
+    def _begin_enc_amp_obs_table(self):
+        num_envs = self._enc_amp_obs.shape[0]
+        self._enc_amp_obs_table_rows = [self._enc_amp_obs.clone()]
+        self._enc_amp_obs_table_size = num_envs
+        self._enc_amp_obs_ids[:] = torch.arange(num_envs, dtype=torch.long, device=self.ppo_device)
+        return
+
+    def _end_enc_amp_obs_table(self):
+        self._enc_amp_obs_table = torch.cat(self._enc_amp_obs_table_rows, dim=0)
+        self._enc_amp_obs_table_rows = None
+        return
+
     def _sample_latents(self, n):
         enc_amp_obs_demo, _ = self._fetch_amp_obs_demo(n)
         with torch.no_grad():
@@ -638,6 +733,9 @@ class CALMAgent(amp_agent.AMPAgent):
             value = self.value_mean_std(value, True)
         return value
 
+    def _eval_next_values(self, critic_inputs):
+        return self._eval_critic({'obs': critic_inputs[0]}, critic_inputs[1])
+
     def _calc_amp_rewards(self, amp_obs, calm_latents):
         cdisc_r = self._calc_conditional_disc_rewards(amp_obs, calm_latents)
         if self._disc_reward_w <= 0:
@@ -666,9 +764,9 @@ class CALMAgent(amp_agent.AMPAgent):
     def _combine_rewards(self, task_rewards, amp_rewards):
         disc_r = amp_rewards['disc_rewards']
         conditional_disc_r = amp_rewards['conditional_disc_rewards']
-        combined_rewards = self._task_reward_w * task_rewards \
-                         + self._disc_reward_w * disc_r \
-                         + self._conditional_disc_reward_w * conditional_disc_r
+        combined_rewards = rollout_postprocess.combine_rewards([task_rewards, disc_r, conditional_disc_r],
+                                                               [float(self._task_reward_w), float(self._disc_reward_w),
+                                                                float(self._conditional_disc_reward_w)])
         return combined_rewards
 
     def _record_train_batch_info(self, batch_dict, train_info):
@@ -676,43 +774,77 @@ class CALMAgent(amp_agent.AMPAgent):
         train_info['conditional_disc_rewards'] = batch_dict['conditional_disc_rewards']
         return
 
-    def _store_replay_amp_obs(self, amp_obs, enc_amp_obs):
-        if amp_obs.shape[0] > 0:
-            buf_size = self._amp_replay_buffer.get_buffer_size()
-            buf_total_count = self._amp_replay_buffer.get_total_count()
-            if (buf_total_count > buf_size):
-                keep_probs = to_torch(np.array([self._amp_replay_keep_prob] * amp_obs.shape[0]), device=self.ppo_device)
-                keep_mask = torch.bernoulli(keep_probs) == 1.0
-                amp_obs = amp_obs[keep_mask]
-                enc_amp_obs = enc_amp_obs[keep_mask]
-
-            if (amp_obs.shape[0] > buf_size):
-                rand_idx = torch.randperm(amp_obs.shape[0])
-                rand_idx = rand_idx[:buf_size]
-                amp_obs = amp_obs[rand_idx]
-                enc_amp_obs = enc_amp_obs[rand_idx]
-
-            self._amp_replay_buffer.store({'amp_obs': amp_obs, 'enc_amp_obs': enc_amp_obs})
+    def _calc_rollout_amp_rewards(self):
+        # rewards are evaluated one step at a time, so that the rollout windows are never all gathered at once
+        mb_amp_obs_heads = self.experience_buffer.tensor_dict['amp_obs_heads']
+        mb_calm_latents = self.experience_buffer.tensor_dict['calm_latents']
+
+        amp_rewards = dict()
+        for n in range(self.horizon_length):
+            amp_obs = self._amp_obs_ring.get_windows(self._amp_obs_env_ids, mb_amp_obs_heads[n])
+            curr_rewards = self._calc_amp_rewards(amp_obs, mb_calm_latents[n])
+            for k, v in curr_rewards.items():
+                if k not in amp_rewards:
+                    amp_rewards[k] = torch.zeros((self.horizon_length,) + v.shape, dtype=v.dtype, device=v.device)
+                amp_rewards[k][n] = v
+        return amp_rewards
+
+    def _store_replay_amp_obs(self, amp_obs_heads, enc_amp_obs_ids):
+        # the trajectories of the kept envs are copied step by step into the replay ring, until the replay
+        # is full every env is kept, in batches of one env per lane
+        num_envs = self._amp_obs_env_ids.shape[0]
+        num_lanes = self._amp_replay_lane_ids.shape[0]
+        buf_size = self._amp_replay_buffer.get_buffer_size()
+        buf_total_count = self._amp_replay_buffer.get_total_count()
+        if (buf_total_count > buf_size):
+            num_batches = 1
+        else:
+            num_batches = max(min(num_envs, buf_size // self.horizon_length) // num_lanes, 1)
+
+        kept_env_ids = torch.randperm(num_envs, device=self.ppo_device)[:num_batches * num_lanes]
+        amp_obs_heads = amp_obs_heads.view(num_envs, self.horizon_length)
+        enc_amp_obs_ids = enc_amp_obs_ids.view(num_envs, self.horizon_length)
+
+        for env_ids in kept_env_ids.view(num_batches, num_lanes):
+            heads = amp_obs_heads[env_ids]
+            episode_starts = self._amp_obs_ring.is_episode_start(env_ids.unsqueeze(-1), heads)
+            episode_starts[:, 0] = True
+            reset_counts = episode_starts.sum(dim=0).tolist()
+            reset_lane_ids = torch.split(episode_starts.t().nonzero(as_tuple=False)[:, 1], reset_counts)
+
+            replay_heads = torch.zeros_like(heads)
+            for n in range(self.horizon_length):
+                amp_obs = self._amp_obs_ring.get_windows(env_ids, heads[:, n])
+                replay_heads[:, n] = self._amp_replay_ring.push(amp_obs, reset_lane_ids[n])
+
+            table_ids, replay_ids = torch.unique(enc_amp_obs_ids[env_ids], return_inverse=True)
+            replay_rows = self._enc_amp_obs_replay_table.append(self._enc_amp_obs_table[table_ids])
+
+            self._amp_replay_buffer.store({
+                'amp_obs_lanes': self._amp_replay_batch_lane_ids,
+                'amp_obs_heads': replay_heads.view(-1),
+                'enc_amp_obs_ids': replay_rows[replay_ids].view(-1)
+            })
         return
 
     def _log_train_info(self, train_info, frame):
         super()._log_train_info(train_info, frame)
         
-        self.writer.add_scalar('losses/conditional_disc_loss', torch_ext.mean_list(train_info['conditional_disc_loss']).item(), frame)
+        self._metrics.add_scalar('losses/conditional_disc_loss', torch_ext.mean_list(train_info['conditional_disc_loss']))
 
-        self.writer.add_scalar('info/conditional_disc_agent_acc', torch_ext.mean_list(train_info['conditional_disc_agent_acc']).item(), frame)
-        self.writer.add_scalar('info/conditional_disc_demo_acc', torch_ext.mean_list(train_info['conditional_disc_demo_acc']).item(), frame)
-        self.writer.add_scalar('info/conditional_disc_agent_logit', torch_ext.mean_list(train_info['conditional_disc_agent_logit']).item(), frame)
-        self.writer.add_scalar('info/conditional_disc_demo_logit', torch_ext.mean_list(train_info['conditional_disc_demo_logit']).item(), frame)
-        self.writer.add_scalar('info/conditional_disc_grad_penalty', torch_ext.mean_list(train_info['conditional_disc_grad_penalty']).item(), frame)
-        self.writer.add_scalar('info/conditional_disc_logit_loss', torch_ext.mean_list(train_info['conditional_disc_logit_loss']).item(), frame)
+        self._metrics.add_scalar('info/conditional_disc_agent_acc', torch_ext.mean_list(train_info['conditional_disc_agent_acc']))
+        self._metrics.add_scalar('info/conditional_disc_demo_acc', torch_ext.mean_list(train_info['conditional_disc_demo_acc']))
+        self._metrics.add_scalar('info/conditional_disc_agent_logit', torch_ext.mean_list(train_info['conditional_disc_agent_logit']))
+        self._metrics.add_scalar('info/conditional_disc_demo_logit', torch_ext.mean_list(train_info['conditional_disc_demo_logit']))
+        self._metrics.add_scalar('info/conditional_disc_grad_penalty', torch_ext.mean_list(train_info['conditional_disc_grad_penalty']))
+        self._metrics.add_scalar('info/conditional_disc_logit_loss', torch_ext.mean_list(train_info['conditional_disc_logit_loss']))
 
         conditional_disc_reward_std, conditional_disc_reward_mean = torch.std_mean(train_info['conditional_disc_rewards'])
-        self.writer.add_scalar('info/conditional_disc_reward_mean', conditional_disc_reward_mean.item(), frame)
-        self.writer.add_scalar('info/conditional_disc_reward_std', conditional_disc_reward_std.item(), frame)
+        self._metrics.add_scalar('info/conditional_disc_reward_mean', conditional_disc_reward_mean)
+        self._metrics.add_scalar('info/conditional_disc_reward_std', conditional_disc_reward_std)
 
-        self.writer.add_scalar('info/encoder_uniformity', torch_ext.mean_list(train_info['encoder_uniformity']).item(), frame)
-        # self.writer.add_scalar('info/calm_latent', torch_ext.mean_list(train_info['calm_latents']).item(), frame)
+        self._metrics.add_scalar('info/encoder_uniformity', torch_ext.mean_list(train_info['encoder_uniformity']))
+        # self._metrics.add_scalar('info/calm_latent', torch_ext.mean_list(train_info['calm_latents']))
 
         return
 
@@ -743,8 +875,8 @@ class CALMAgent(amp_agent.AMPAgent):
             print("disc_pred: ", disc_pred, disc_reward, cdisc_reward)
         return
 
-    def _fetch_amp_obs_demo(self, num_samples):
-        _, _, enc_amp_obs_demo_flat, _, amp_obs_demo_flat = self.vec_env.env.fetch_amp_obs_demo_enc_pair(num_samples)
+    def _fetch_amp_obs_demo(self, num_samples, generator=None):
+        _, _, enc_amp_obs_demo_flat, _, amp_obs_demo_flat = self.vec_env.env.fetch_amp_obs_demo_enc_pair(num_samples, generator=generator)
         return enc_amp_obs_demo_flat, amp_obs_demo_flat
 
     def _init_amp_demo_buf(self):
@@ -757,8 +889,22 @@ class CALMAgent(amp_agent.AMPAgent):
 
         return
 
+    def _build_demo_prefetchers(self):
+        super()._build_demo_prefetchers()
+        if self._amp_demo_prefetch and self._enc_reg_coeff > 0:
+            self._enc_reg_demo_prefetcher = demo_prefetcher.DemoPrefetcher(self._fetch_enc_reg_demos, self.ppo_device,
+                                                                           self._build_demo_generator(2),
+                                                                           depth=self._amp_demo_prefetch_depth)
+        return
+
+    def _close_train(self):
+        super()._close_train()
+        if self._enc_reg_demo_prefetcher is not None:
+            self._enc_reg_demo_prefetcher.close()
+        return
+
     def _update_amp_demos(self):
-        enc_amp_obs_demo, amp_obs_demo = self._fetch_amp_obs_demo(self._amp_batch_size)
+        enc_amp_obs_demo, amp_obs_demo = self._next_amp_demo_batch()
         self._amp_obs_demo_buffer.store({'amp_obs': amp_obs_demo, 'enc_amp_obs': enc_amp_obs_demo})
         return
 
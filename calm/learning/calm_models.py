@@ -26,6 +26,8 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import torch
+
 from learning import amp_models
 
 
@@ -55,18 +57,22 @@ class ModelCALMContinuous(amp_models.ModelAMPContinuous):
                 amp_obs_replay = input_dict['amp_obs_replay']
 
                 batched_calm_latents = input_dict['batched_calm_latents']
-                conditional_disc_agent_logit = self.a2c_network.eval_conditional_disc(amp_obs, batched_calm_latents)
-                result["conditional_disc_agent_logit"] = conditional_disc_agent_logit
-
                 calm_latents_demo = input_dict['calm_latents_demo']
-                conditional_disc_agent_logit = self.a2c_network.eval_conditional_disc(amp_demo_obs, calm_latents_demo)
-                result["conditional_disc_demo_logit"] = conditional_disc_agent_logit
-
                 calm_latents_replay = input_dict['calm_latents_replay']
-                conditional_disc_agent_replay_logit = self.a2c_network.eval_conditional_disc(amp_obs_replay, calm_latents_replay)
-                result["conditional_disc_agent_replay_logit"] = conditional_disc_agent_replay_logit
 
-                conditional_disc_neg_demo_logit = self.a2c_network.eval_conditional_disc(amp_demo_obs, batched_calm_latents)
+                # the agent, replay and negative demo pairs share one conditional discriminator pass, the demo
+                # pairs are evaluated on their own to keep the gradient penalty's double backward to their rows
+                cond_disc_obs = [amp_obs, amp_obs_replay, amp_demo_obs]
+                cond_disc_latents = [batched_calm_latents, calm_latents_replay, batched_calm_latents]
+                cond_disc_logits = self.a2c_network.eval_conditional_disc(torch.cat(cond_disc_obs, dim=0),
+                                                                          torch.cat(cond_disc_latents, dim=0))
+                conditional_disc_agent_logit, conditional_disc_agent_replay_logit, conditional_disc_neg_demo_logit = \
+                    torch.split(cond_disc_logits, [o.shape[0] for o in cond_disc_obs], dim=0)
+                conditional_disc_demo_logit = self.a2c_network.eval_conditional_disc(amp_demo_obs, calm_latents_demo)
+
+                result["conditional_disc_agent_logit"] = conditional_disc_agent_logit
+                result["conditional_disc_demo_logit"] = conditional_disc_demo_logit
+                result["conditional_disc_agent_replay_logit"] = conditional_disc_agent_replay_logit
                 result["conditional_disc_neg_demo_logit"] = conditional_disc_neg_demo_logit
 
             return result
@@ -32,6 +32,7 @@ from isaacgym.torch_utils import *
 from rl_games.algos_torch import players
 
 from learning import amp_players
+import learning.latent_index as latent_index
 
 import numpy as np
 
@@ -45,6 +46,10 @@ class CALMPlayer(amp_players.AMPPlayerContinuous):
         self._interpolate_latents = config.get('interpolate_latents', True)
         # self._interpolate_latents = config.get('interpolate_latents', None)
         self._get_latents_from_data = config.get('latents_from_data', None)
+        self._latent_index_stride = config.get('latent_index_stride', 0.5)
+        self._latent_index_dir = config.get('latent_index_dir', 'output/latent_index')
+        self._latent_index = None
+        self._checkpoint_file = None
 
         self._conditional_disc_reward_scale = config['conditional_disc_reward_scale']
         self._amp_batch_size = int(config['amp_batch_size'])
@@ -78,10 +83,25 @@ class CALMPlayer(amp_players.AMPPlayerContinuous):
         super().run()
         return
 
+    def restore(self, fn):
+        super().restore(fn)
+        if fn != 'Base':
+            self._checkpoint_file = fn
+            self._latent_index = None
+        return
+
     def _fetch_amp_obs_demo(self, num_samples):
         motion_ids, _, enc_amp_obs_demo_flat, _, _ = self.env.fetch_amp_obs_demo_enc_pair(num_samples)
         return motion_ids, enc_amp_obs_demo_flat
 
+    def _get_latent_index(self):
+        if self._latent_index is None:
+            encode_fn = lambda amp_obs: self.model.a2c_network.eval_enc(self._preproc_amp_obs(amp_obs))
+            self._latent_index = latent_index.LatentIndex.load_or_build(self.env.task, encode_fn, self._checkpoint_file,
+                                                                        self._latent_index_stride,
+                                                                        cache_dir=self._latent_index_dir)
+        return self._latent_index
+
     def get_action(self, obs_dict, is_determenistic=False):
         if not self._sample_latent_only_on_reset:
             self._update_latents() # only the step <=0, will apply the alpha and 1-alpha
@@ -154,15 +174,9 @@ class CALMPlayer(amp_players.AMPPlayerContinuous):
         return
 
     def _sample_latents(self, n):
-        # 1. sample motion id
-        # 2. create obs from entire sequence
-        # 3. encode
-
-        motion_ids, new_enc_amp_obs_demo = self._fetch_amp_obs_demo(n)
-
-        proc_new_enc_amp_obs = self._preproc_amp_obs(new_enc_amp_obs_demo)
-        with torch.no_grad():
-            encoded_demo_amp_obs = self.model.a2c_network.eval_enc(proc_new_enc_amp_obs)
+        # latents of motion windows are drawn from the precomputed index of the motion library
+        # instead of encoding fresh demo windows on every reset
+        encoded_demo_amp_obs, motion_ids = self._get_latent_index().sample(n)
 
         # if we're interpolating from data, let's make it visually appealing by forcing the main character to have
         # two different motion files to interpolate from.
@@ -0,0 +1,223 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import copy
+import os
+import queue
+import re
+import shutil
+import tempfile
+import threading
+
+import torch
+
+from rl_games.algos_torch import torch_ext
+
+import learning.resume_state as resume_state
+
+
+class CheckpointWriter:
+    # Writes checkpoints atomically: the state is serialized once into a temp file in the target directory,
+    # fsynced and renamed over the final .pth, so an interrupted job never leaves a truncated checkpoint.
+    # With async_write the state is first snapshotted into pinned cpu memory on the calling thread
+    # (non-blocking device copies) and serialized on a background thread, at most one save is in flight.
+    # Intermediate checkpoints <prefix>_<epoch>.pth are pruned to the newest keep_last, checkpoints whose
+    # epoch is a multiple of keep_every are always kept. 0 disables the respective rule.
+    # An optional full-resume state is packed on the writer thread and stored under 'resume_state' in the
+    # checkpoint or, with resume_side_file, in a separate <name>_resume.pth next to it.
+    def __init__(self, async_write=False, keep_last=0, keep_every=0, resume_side_file=False):
+        self._async_write = async_write
+        self._keep_last = keep_last
+        self._keep_every = keep_every
+        self._resume_side_file = resume_side_file
+        self._error = None
+
+        if self._async_write:
+            self._queue = queue.Queue(maxsize=1)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return
+
+    def save(self, filenames, state, retention_prefix=None, resume_state=None):
+        # filenames are given without the .pth extension, as for torch_ext.save_checkpoint
+        self._check_error()
+        if isinstance(filenames, str):
+            filenames = [filenames]
+
+        if self._async_write:
+            snapshot, event = self._snapshot((state, resume_state))
+            self._queue.put((filenames, snapshot, event, retention_prefix))
+        else:
+            self._write(filenames, (state, resume_state), retention_prefix)
+        return
+
+    def flush(self):
+        if self._async_write:
+            self._queue.join()
+        self._check_error()
+        return
+
+    def close(self):
+        if self._async_write:
+            self.flush()
+            self._queue.put(None)
+            self._thread.join()
+            self._async_write = False
+        return
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+
+            filenames, snapshot, event, retention_prefix = item
+            try:
+                if event is not None:
+                    event.synchronize()
+                self._write(filenames, snapshot, retention_prefix)
+            except Exception as e:
+                self._error = e
+            self._queue.task_done()
+        return
+
+    def _check_error(self):
+        if self._error is not None:
+            error = self._error
+            self._error = None
+            raise error
+        return
+
+    def _snapshot(self, state):
+        event = None
+        if torch.cuda.is_available():
+            snapshot = self._copy_to_host(state, pin_memory=True)
+            event = torch.cuda.Event()
+            event.record()
+        else:
+            snapshot = self._copy_to_host(state, pin_memory=False)
+        return snapshot, event
+
+    def _copy_to_host(self, x, pin_memory):
+        if isinstance(x, torch.Tensor):
+            x = x.detach()
+            if x.is_cuda:
+                host = torch.empty(x.shape, dtype=x.dtype, pin_memory=pin_memory)
+                host.copy_(x, non_blocking=True)
+                return host
+            return x.clone()
+        elif isinstance(x, dict):
+            return type(x)((k, self._copy_to_host(v, pin_memory)) for k, v in x.items())
+        elif isinstance(x, (list, tuple)):
+            return type(x)(self._copy_to_host(v, pin_memory) for v in x)
+        return copy.deepcopy(x)
+
+    def _write(self, filenames, states, retention_prefix):
+        state, resume = states
+        if resume is not None:
+            resume = resume_state.pack_state(resume)
+            if self._resume_side_file:
+                self._write_files([get_resume_file(fn) for fn in filenames], resume)
+            else:
+                state = dict(state)
+                state['resume_state'] = resume
+
+        self._write_files([fn + '.pth' for fn in filenames], state)
+
+        if retention_prefix is not None:
+            self._apply_retention(retention_prefix)
+        return
+
+    def _write_files(self, files, state):
+        print("=> saving checkpoint '{}'".format(files[0]))
+        torch_ext.safe_filesystem_op(self._atomic_write, files[0], lambda f: torch.save(state, f))
+
+        for fn in files[1:]:
+            print("=> saving checkpoint '{}'".format(fn))
+            torch_ext.safe_filesystem_op(self._atomic_copy, files[0], fn)
+        return
+
+    def _atomic_copy(self, src_file, dst_file):
+        with open(src_file, 'rb') as src:
+            self._atomic_write(dst_file, lambda f: shutil.copyfileobj(src, f))
+        return
+
+    def _atomic_write(self, filename, write_fn):
+        dir_name = os.path.dirname(os.path.abspath(filename))
+        fd, tmp_file = tempfile.mkstemp(dir=dir_name, prefix='.' + os.path.basename(filename) + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write_fn(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, filename)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+        return
+
+    def _apply_retention(self, prefix):
+        if self._keep_last <= 0:
+            return
+
+        dir_name = os.path.dirname(os.path.abspath(prefix))
+        pattern = re.compile(re.escape(os.path.basename(prefix)) + r'_(\d+)\.pth$')
+        checkpoints = []
+        for name in os.listdir(dir_name):
+            match = pattern.match(name)
+            if match is not None:
+                checkpoints.append((int(match.group(1)), os.path.join(dir_name, name)))
+        checkpoints.sort()
+
+        for epoch, fn in checkpoints[:-self._keep_last]:
+            if self._keep_every > 0 and epoch % self._keep_every == 0:
+                continue
+            os.remove(fn)
+            side_file = get_resume_file(fn[:-len('.pth')])
+            if os.path.exists(side_file):
+                os.remove(side_file)
+        return
+
+
+def get_resume_file(filename):
+    # side file of the checkpoint filename (given without the .pth extension)
+    return filename + '_resume.pth'
+
+
+def load_resume_state(checkpoint_file, checkpoint):
+    # full-resume state stored with the checkpoint or in its side file, None if there is neither
+    packed = checkpoint.get('resume_state', None)
+    if packed is None:
+        side_file = get_resume_file(os.path.splitext(checkpoint_file)[0])
+        if not os.path.exists(side_file):
+            return None
+        packed = torch_ext.load_checkpoint(side_file)
+    return resume_state.unpack_state(packed)
+
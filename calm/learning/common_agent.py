@@ -27,6 +27,7 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import os
+import random
 import time
 
 from rl_games.algos_torch import a2c_continuous
@@ -35,10 +36,16 @@ from rl_games.algos_torch import central_value
 from rl_games.algos_torch.running_mean_std import RunningMeanStd
 from rl_games.common import a2c_common
 
+import numpy as np
 import torch
 from torch import optim
 
+import learning.actor_learner as actor_learner
 import learning.amp_datasets as amp_datasets
+import learning.metrics as metrics
+import learning.rollout_postprocess as rollout_postprocess
+import learning.mixed_precision as mixed_precision
+import learning.checkpoint_writer as checkpoint_writer
 
 
 class CommonAgent(a2c_continuous.A2CAgent):
@@ -52,6 +59,27 @@ class CommonAgent(a2c_continuous.A2CAgent):
         self.bounds_loss_coef = config.get('bounds_loss_coef', None)
         self.clip_actions = config.get('clip_actions', True)
         self._save_intermediate = config.get('save_intermediate', False)
+        self._full_resume = config.get('full_resume', False)
+        self._pending_resume_state = None
+        self._checkpoint_writer = checkpoint_writer.CheckpointWriter(async_write=config.get('async_checkpoint', False),
+                                                                     keep_last=config.get('checkpoint_keep_last', 0),
+                                                                     keep_every=config.get('checkpoint_keep_every', 0),
+                                                                     resume_side_file=config.get('full_resume_side_file', False))
+        self._experience_storage_dtypes = config.get('experience_storage_dtypes', {})
+        self._actor_learner_config = config.get('actor_learner', None) or {}
+        self._actor_init_fn = config.get('actor_init_fn', None)
+        self._actor_learner = None
+        self._rollout_policy_lag = 0
+        self._agent_config = config
+        self._metrics = self._build_metrics(config)
+        # the central value net is evaluated separately from the policy, so its values cannot be reused
+        self._reuse_critic_values = config.get('reuse_critic_values', True) and not self.has_central_value
+        self._pending_next_values = None
+
+        self._mixed_precision_dtype = mixed_precision.get_autocast_dtype(config.get('mixed_precision_dtype', 'float16'))
+        if self._mixed_precision_dtype == torch.bfloat16:
+            # bf16 has the fp32 exponent range, so no loss scaling is needed
+            self.scaler = torch.cuda.amp.GradScaler(enabled=False)
 
         net_config = self._build_net_config()
         self.model = self.network.build(net_config) # build the encoder of latent space
@@ -85,21 +113,28 @@ class CommonAgent(a2c_continuous.A2CAgent):
             self.central_value_net = central_value.CentralValueTrain(**cv_config).to(self.ppo_device)
 
         self.use_experimental_cv = self.config.get('use_experimental_cv', True)
-        self.dataset = amp_datasets.AMPDataset(self.batch_size, self.minibatch_size, self.is_discrete, self.is_rnn, self.ppo_device, self.seq_len)
+        packed_dataset = self.config.get('packed_dataset', False)
+        self.dataset = amp_datasets.AMPDataset(self.batch_size, self.minibatch_size, self.is_discrete, self.is_rnn, self.ppo_device, self.seq_len,
+                                               packed=packed_dataset)
         self.algo_observer.after_init(self)
         
         return
 
     def init_tensors(self):
         super().init_tensors()
-        self.experience_buffer.tensor_dict['next_obses'] = torch.zeros_like(self.experience_buffer.tensor_dict['obses'])
-        self.experience_buffer.tensor_dict['next_values'] = torch.zeros_like(self.experience_buffer.tensor_dict['values'])
 
-        self.tensor_list += ['next_obses']
+        # observations are kept in horizon + 1 slots and next_obses is the same buffer shifted by one step,
+        # so at done boundaries next_obses holds the reset observation (next_values use the terminal one)
+        obses = self.experience_buffer.tensor_dict['obses']
+        self._obs_buf = torch.zeros((obses.shape[0] + 1,) + obses.shape[1:], dtype=obses.dtype, device=obses.device)
+        self.experience_buffer.tensor_dict['obses'] = self._obs_buf[:-1]
+        self.experience_buffer.tensor_dict['next_obses'] = self._obs_buf[1:]
+        self.experience_buffer.tensor_dict['next_values'] = torch.zeros_like(self.experience_buffer.tensor_dict['values'])
         return
 
     def train(self):
         self.init_tensors()
+        self._apply_experience_storage_dtypes()
         self.last_mean_rewards = -100500
         start_time = time.time()
         total_time = 0
@@ -115,6 +150,14 @@ class CommonAgent(a2c_continuous.A2CAgent):
 
         self._init_train()
 
+        if self._pending_resume_state is not None:
+            # applied after the env reset and buffer setup above, which would otherwise overwrite it
+            self._set_resume_state(self._pending_resume_state)
+            self._pending_resume_state = None
+
+        if self._actor_learner_config.get('num_actors', 0) > 0:
+            self._start_actor_learner()
+
         while True:
             epoch_num = self.update_epoch()
             train_info = self.train_epoch()
@@ -136,9 +179,9 @@ class CommonAgent(a2c_continuous.A2CAgent):
                     print(f'fps step: {fps_step:.1f} fps total: {fps_total:.1f}')
                     print(f'epoch num: {epoch_num:.1f} cost time: {scaled_play_time: .1f}')
 
-                self.writer.add_scalar('performance/total_fps', curr_frames / scaled_time, frame)
-                self.writer.add_scalar('performance/step_fps', curr_frames / scaled_play_time, frame)
-                self.writer.add_scalar('info/epochs', epoch_num, frame)
+                self._metrics.add_scalar('performance/total_fps', curr_frames / scaled_time)
+                self._metrics.add_scalar('performance/step_fps', curr_frames / scaled_play_time)
+                self._metrics.add_scalar('info/epochs', epoch_num)
                 self._log_train_info(train_info, frame)
 
                 self.algo_observer.after_print_stats(frame, epoch_num, total_time)
@@ -148,30 +191,90 @@ class CommonAgent(a2c_continuous.A2CAgent):
                     mean_lengths = self.game_lengths.get_mean()
 
                     for i in range(self.value_size):
-                        self.writer.add_scalar('rewards{0}/frame'.format(i), mean_rewards[i], frame)
-                        self.writer.add_scalar('rewards{0}/iter'.format(i), mean_rewards[i], epoch_num)
-                        self.writer.add_scalar('rewards{0}/time'.format(i), mean_rewards[i], total_time)
+                        self._metrics.add_scalar('rewards{0}/frame'.format(i), mean_rewards[i])
+                        self._metrics.add_scalar('rewards{0}/iter'.format(i), mean_rewards[i], epoch_num)
+                        self._metrics.add_scalar('rewards{0}/time'.format(i), mean_rewards[i], total_time)
 
-                    self.writer.add_scalar('episode_lengths/frame', mean_lengths, frame)
-                    self.writer.add_scalar('episode_lengths/iter', mean_lengths, epoch_num)
+                    self._metrics.add_scalar('episode_lengths/frame', mean_lengths)
+                    self._metrics.add_scalar('episode_lengths/iter', mean_lengths, epoch_num)
 
                     if self.has_self_play_config:
                         self.self_play_manager.update(self)
 
+                self._metrics.flush(frame)
+
                 if self.save_freq > 0:
                     # if self.vec_env.env.task.delta > 0:
                     if epoch_num % self.save_freq == 0:
-                        self.save(model_output_file) # which is not the best models
+                        save_files = [model_output_file] # which is not the best models
 
                         if self._save_intermediate:
                             int_model_output_file = model_output_file + '_' + str(epoch_num).zfill(8)
-                            self.save(int_model_output_file)
+                            save_files.append(int_model_output_file)
+
+                        self._checkpoint_writer.save(save_files, self.get_full_state_weights(),
+                                                     retention_prefix=model_output_file,
+                                                     resume_state=self._get_checkpoint_resume_state())
 
                 if epoch_num > self.max_epochs:
                     self.save(model_output_file)
+                    self._checkpoint_writer.close()
+                    self._close_train()
+                    self._metrics.close()
+                    if self._actor_learner is not None:
+                        self._actor_learner.close()
                     print('MAX EPOCHS NUM!')
                     return self.last_mean_rewards, epoch_num
 
+    def save(self, fn):
+        self._checkpoint_writer.save(fn, self.get_full_state_weights(), resume_state=self._get_checkpoint_resume_state())
+        return
+
+    def restore(self, fn):
+        checkpoint = torch_ext.load_checkpoint(fn)
+        self.set_full_state_weights(checkpoint)
+        if self._full_resume:
+            self._pending_resume_state = checkpoint_writer.load_resume_state(fn, checkpoint)
+        return
+
+    def _get_checkpoint_resume_state(self):
+        if not self._full_resume:
+            return None
+        return self._get_resume_state()
+
+    def _get_resume_state(self):
+        # training state beyond the weights that is needed to continue a run exactly, subclasses add their
+        # buffers and per-env assignments
+        state = {
+            'rng': {
+                'torch': torch.get_rng_state(),
+                'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+                'numpy': np.random.get_state(),
+                'python': random.getstate()
+            },
+            'frame': self.frame,
+            'last_mean_rewards': self.last_mean_rewards,
+            'game_rewards': (self.game_rewards.mean, self.game_rewards.current_size),
+            'game_lengths': (self.game_lengths.mean, self.game_lengths.current_size)
+        }
+        return state
+
+    def _set_resume_state(self, state):
+        rng = state['rng']
+        torch.set_rng_state(rng['torch'])
+        if torch.cuda.is_available() and len(rng['cuda']) > 0:
+            torch.cuda.set_rng_state_all(rng['cuda'])
+        np.random.set_state(rng['numpy'])
+        random.setstate(rng['python'])
+
+        self.frame = state['frame']
+        self.last_mean_rewards = state['last_mean_rewards']
+        for meter, (mean, current_size) in [(self.game_rewards, state['game_rewards']),
+                                            (self.game_lengths, state['game_lengths'])]:
+            meter.mean.copy_(mean)
+            meter.current_size = current_size
+        return
+
     def set_full_state_weights(self, weights):
         self.set_weights(weights)
         self.epoch_num = weights['epoch']
@@ -187,11 +290,7 @@ class CommonAgent(a2c_continuous.A2CAgent):
 
     def train_epoch(self):
         play_time_start = time.time()
-        with torch.no_grad():
-            if self.is_rnn:
-                batch_dict = self.play_steps_rnn()
-            else:
-                batch_dict = self.play_steps() 
+        batch_dict = self._play_rollout()
 
         play_time_end = time.time()
         update_time_start = time.time()
@@ -220,7 +319,7 @@ class CommonAgent(a2c_continuous.A2CAgent):
                 if self.schedule_type == 'legacy':  
                     if self.multi_gpu:
                         curr_train_info['kl'] = self.hvd.average_value(curr_train_info['kl'], 'ep_kls')
-                    self.last_lr, self.entropy_coef = self.scheduler.update(self.last_lr, self.entropy_coef, self.epoch_num, 0, curr_train_info['kl'].item())
+                    self.last_lr, self.entropy_coef = self.scheduler.update(self.last_lr, self.entropy_coef, self.epoch_num, 0, self._get_scheduler_kl(curr_train_info['kl']))
                     self.update_lr(self.last_lr)
 
                 if (train_info is None):
@@ -236,15 +335,18 @@ class CommonAgent(a2c_continuous.A2CAgent):
             if self.schedule_type == 'standard':
                 if self.multi_gpu:
                     av_kls = self.hvd.average_value(av_kls, 'ep_kls')
-                self.last_lr, self.entropy_coef = self.scheduler.update(self.last_lr, self.entropy_coef, self.epoch_num, 0, av_kls.item())
+                self.last_lr, self.entropy_coef = self.scheduler.update(self.last_lr, self.entropy_coef, self.epoch_num, 0, self._get_scheduler_kl(av_kls))
                 self.update_lr(self.last_lr)
 
         if self.schedule_type == 'standard_epoch':
             if self.multi_gpu:
                 av_kls = self.hvd.average_value(torch_ext.mean_list(kls), 'ep_kls')
-            self.last_lr, self.entropy_coef = self.scheduler.update(self.last_lr, self.entropy_coef, self.epoch_num, 0, av_kls.item())
+            self.last_lr, self.entropy_coef = self.scheduler.update(self.last_lr, self.entropy_coef, self.epoch_num, 0, self._get_scheduler_kl(av_kls))
             self.update_lr(self.last_lr)
 
+        if self._actor_learner is not None:
+            self._actor_learner.publish_weights(self.get_weights())
+
         update_time_end = time.time()
         play_time = play_time_end - play_time_start
         update_time = update_time_end - update_time_start
@@ -253,11 +355,59 @@ class CommonAgent(a2c_continuous.A2CAgent):
         train_info['play_time'] = play_time
         train_info['update_time'] = update_time
         train_info['total_time'] = total_time
+        if self._actor_learner is not None:
+            train_info['policy_lag'] = self._rollout_policy_lag
 
         self._record_train_batch_info(batch_dict, train_info)
 
         return train_info
 
+    def play_rollout(self):
+        # rollout entry point of actor processes, see actor_learner.ActorLearner
+        if self.obs is None:
+            self.init_tensors()
+            self._apply_experience_storage_dtypes()
+            self.obs = self.env_reset()
+
+        batch_dict = self._play_steps()
+        # env metrics recorded during the rollout go to the actor's own summary writer
+        self.frame += batch_dict['played_frames']
+        self._metrics.flush(self.frame)
+
+        info = {
+            'game_rewards': self.game_rewards.get_mean() if self.game_rewards.current_size > 0 else None,
+            'game_lengths': self.game_lengths.get_mean() if self.game_lengths.current_size > 0 else None
+        }
+        return batch_dict, info
+
+    def _play_rollout(self):
+        if self._actor_learner is None:
+            return self._play_steps()
+
+        batch_dict, info = self._actor_learner.get_rollout()
+        # the actors report the running means of their own episode meters, which are averaged here
+        for meter, mean in [(self.game_rewards, info['game_rewards']), (self.game_lengths, info['game_lengths'])]:
+            if mean is not None:
+                meter.update(mean.to(self.ppo_device).view(1, -1))
+        self._rollout_policy_lag = info['policy_lag']
+        return batch_dict
+
+    def _play_steps(self):
+        with torch.no_grad():
+            if self.is_rnn:
+                batch_dict = self.play_steps_rnn()
+            else:
+                batch_dict = self.play_steps()
+        return batch_dict
+
+    def _start_actor_learner(self):
+        config = self._actor_learner_config
+        actor_fn = actor_learner.AgentActor(type(self), self.name, self._agent_config, init_fn=self._actor_init_fn)
+        self._actor_learner = actor_learner.ActorLearner(actor_fn, config['num_actors'], self.get_weights(), self.ppo_device,
+                                                         num_slots=config.get('num_slots', 2),
+                                                         max_policy_lag=config.get('max_policy_lag', 1))
+        return
+
     def play_steps(self):
         self.set_eval()
         
@@ -274,6 +424,7 @@ class CommonAgent(a2c_continuous.A2CAgent):
                 res_dict = self.get_masked_action_values(self.obs, masks)
             else:
                 res_dict = self.get_action_values(self.obs)
+            self._resolve_next_values(res_dict['values'], [self.obs['obs']])
 
             for k in update_list:
                 self.experience_buffer.update_data(k, n, res_dict[k]) 
@@ -284,14 +435,11 @@ class CommonAgent(a2c_continuous.A2CAgent):
             self.obs, rewards, self.dones, infos = self.env_step(res_dict['actions'])
             shaped_rewards = self.rewards_shaper(rewards)
             self.experience_buffer.update_data('rewards', n, shaped_rewards)
-            self.experience_buffer.update_data('next_obses', n, self.obs['obs'])
             self.experience_buffer.update_data('dones', n, self.dones)
 
             terminated = infos['terminate'].float()
             terminated = terminated.unsqueeze(-1)
-            next_vals = self._eval_critic(self.obs)
-            next_vals *= (1.0 - terminated)
-            self.experience_buffer.update_data('next_values', n, next_vals)
+            self._store_next_values(n, terminated, [self.obs['obs']])
 
             self.current_rewards += rewards
             self.current_lengths += 1
@@ -309,20 +457,36 @@ class CommonAgent(a2c_continuous.A2CAgent):
 
             done_indices = done_indices[:, 0]
 
-        mb_fdones = self.experience_buffer.tensor_dict['dones'].float()
-        mb_values = self.experience_buffer.tensor_dict['values']
-        mb_next_values = self.experience_buffer.tensor_dict['next_values']
-        mb_rewards = self.experience_buffer.tensor_dict['rewards']
-        
-        mb_advs = self.discount_values(mb_fdones, mb_values, mb_rewards, mb_next_values)
-        mb_returns = mb_advs + mb_values
+        self._resolve_next_values()
+        self._store_last_obs()
 
-        batch_dict = self.experience_buffer.get_transformed_list(a2c_common.swap_and_flatten01, self.tensor_list)
-        batch_dict['returns'] = a2c_common.swap_and_flatten01(mb_returns)
-        batch_dict['played_frames'] = self.batch_size
+        mb_rewards = self.experience_buffer.tensor_dict['rewards']
+        batch_dict = self._postprocess_rollout(mb_rewards)
 
         return batch_dict
 
+    def _apply_experience_storage_dtypes(self):
+        # reduced precision storage for large rollout tensors, the dataset upcasts minibatches to float32
+        tensor_dict = self.experience_buffer.tensor_dict
+        for k, dtype_name in self._experience_storage_dtypes.items():
+            dtype = getattr(torch, dtype_name)
+            assert(k in tensor_dict and dtype.is_floating_point), 'invalid experience storage dtype {}: {}'.format(k, dtype_name)
+
+            if k in ['obses', 'next_obses']:
+                self._obs_buf = self._obs_buf.to(dtype)
+                tensor_dict['obses'] = self._obs_buf[:-1]
+                tensor_dict['next_obses'] = self._obs_buf[1:]
+            else:
+                tensor_dict[k] = tensor_dict[k].to(dtype)
+        return
+
+    def _autocast(self):
+        return mixed_precision.autocast(self.ppo_device, self.mixed_precision, self._mixed_precision_dtype)
+
+    def _store_last_obs(self):
+        self._obs_buf[self.horizon_length] = self.obs['obs']
+        return
+
     def prepare_dataset(self, batch_dict):
         obses = batch_dict['obses']
         returns = batch_dict['returns']
@@ -390,6 +554,8 @@ class CommonAgent(a2c_continuous.A2CAgent):
             'prev_actions': actions_batch, 
             'obs': obs_batch
         }
+        if 'group_ids' in input_dict:
+            batch_dict['group_ids'] = input_dict['group_ids']
 
         rnn_masks = None
         if self.is_rnn:
@@ -397,7 +563,7 @@ class CommonAgent(a2c_continuous.A2CAgent):
             batch_dict['rnn_states'] = input_dict['rnn_states']
             batch_dict['seq_length'] = self.seq_len
 
-        with torch.cuda.amp.autocast(enabled=self.mixed_precision):
+        with self._autocast():
             res_dict = self.model(batch_dict)
             action_log_probs = res_dict['prev_neglogp']
             values = res_dict['values']
@@ -413,10 +579,10 @@ class CommonAgent(a2c_continuous.A2CAgent):
 
             b_loss = self.bound_loss(mu)
             
-            a_loss = torch.mean(a_loss)
-            c_loss = torch.mean(c_loss)
-            b_loss = torch.mean(b_loss)
-            entropy = torch.mean(entropy)
+            a_loss = self._reduce_batch_loss(a_loss, input_dict)
+            c_loss = self._reduce_batch_loss(c_loss, input_dict)
+            b_loss = self._reduce_batch_loss(b_loss, input_dict)
+            entropy = self._reduce_batch_loss(entropy, input_dict)
 
             loss = a_loss + self.critic_coef * c_loss - self.entropy_coef * entropy + self.bounds_loss_coef * b_loss
             
@@ -451,19 +617,31 @@ class CommonAgent(a2c_continuous.A2CAgent):
 
         return
 
+    def _reduce_batch_loss(self, loss, input_dict):
+        return torch.mean(loss)
+
     def discount_values(self, mb_fdones, mb_values, mb_rewards, mb_next_values):
-        lastgaelam = 0
-        mb_advs = torch.zeros_like(mb_rewards)
+        mb_advs = rollout_postprocess.discount_values(mb_fdones, mb_values, mb_rewards, mb_next_values,
+                                                      float(self.gamma), float(self.tau))
+        return mb_advs
 
-        for t in reversed(range(self.horizon_length)):
-            not_done = 1.0 - mb_fdones[t]
-            not_done = not_done.unsqueeze(1)
+    def _postprocess_rollout(self, mb_rewards, extra_dict=None):
+        mb_fdones = self.experience_buffer.tensor_dict['dones'].float()
+        mb_values = self.experience_buffer.tensor_dict['values']
+        mb_next_values = self.experience_buffer.tensor_dict['next_values']
 
-            delta = mb_rewards[t] + self.gamma * mb_next_values[t] - mb_values[t]
-            lastgaelam = delta + self.gamma * self.tau * not_done * lastgaelam
-            mb_advs[t] = lastgaelam
+        mb_advs, mb_returns = rollout_postprocess.compute_returns(mb_fdones, mb_values, mb_rewards, mb_next_values,
+                                                                  float(self.gamma), float(self.tau))
 
-        return mb_advs
+        batch_dict = rollout_postprocess.flatten_rollout(self.experience_buffer.tensor_dict, self.tensor_list)
+        batch_dict['returns'] = rollout_postprocess.swap_and_flatten01(mb_returns)
+        batch_dict['played_frames'] = self.batch_size
+
+        if extra_dict is not None:
+            for k, v in extra_dict.items():
+                batch_dict[k] = rollout_postprocess.swap_and_flatten01(v)
+
+        return batch_dict
 
     def env_reset(self, env_ids=None):
         obs = self.vec_env.reset(env_ids)
@@ -508,6 +686,9 @@ class CommonAgent(a2c_continuous.A2CAgent):
     def _init_train(self):
         return
 
+    def _close_train(self):
+        return
+
     def _eval_critic(self, obs_dict):
         self.model.eval()
         obs = obs_dict['obs']
@@ -518,6 +699,46 @@ class CommonAgent(a2c_continuous.A2CAgent):
             value = self.value_mean_std(value, True)
         return value
 
+    def _store_next_values(self, n, terminated, critic_inputs):
+        # Critic values of the post-step observations. With value reuse they are taken from the values of
+        # the next step's action evaluation, only the envs whose critic inputs changed in between (resets,
+        # new latents) are evaluated again on their post-step inputs in _resolve_next_values.
+        if self._reuse_critic_values:
+            self._pending_next_values = (n, terminated, [x.clone() for x in critic_inputs])
+        else:
+            next_vals = self._eval_next_values(critic_inputs)
+            next_vals *= (1.0 - terminated)
+            self.experience_buffer.update_data('next_values', n, next_vals)
+        return
+
+    def _resolve_next_values(self, values=None, critic_inputs=None):
+        # called with the values and critic inputs of the next action evaluation, or without arguments
+        # at the end of the rollout to evaluate all pending values
+        if self._pending_next_values is None:
+            return
+
+        n, terminated, next_inputs = self._pending_next_values
+        self._pending_next_values = None
+
+        if values is None:
+            next_vals = self._eval_next_values(next_inputs)
+        else:
+            changed = torch.zeros(values.shape[0], dtype=torch.bool, device=values.device)
+            for x, next_x in zip(critic_inputs, next_inputs):
+                changed |= torch.any((x != next_x).view(x.shape[0], -1), dim=-1)
+
+            next_vals = values.clone()
+            changed_ids = changed.nonzero(as_tuple=False).flatten()
+            if changed_ids.shape[0] > 0:
+                next_vals[changed_ids] = self._eval_next_values([x[changed_ids] for x in next_inputs])
+
+        next_vals *= (1.0 - terminated)
+        self.experience_buffer.update_data('next_values', n, next_vals)
+        return
+
+    def _eval_next_values(self, critic_inputs):
+        return self._eval_critic({'obs': critic_inputs[0]})
+
     def _actor_loss(self, old_action_log_probs_batch, action_log_probs, advantage, curr_e_clip):
         ratio = torch.exp(old_action_log_probs_batch - action_log_probs)
         surr1 = advantage * ratio
@@ -563,17 +784,34 @@ class CommonAgent(a2c_continuous.A2CAgent):
     def _record_train_batch_info(self, batch_dict, train_info):
         return
 
+    def _get_scheduler_kl(self, kl):
+        # only the adaptive schedule reads the kl, the others are stepped without a device sync
+        if self.is_adaptive_lr:
+            return kl.item()
+        return None
+
+    def _build_metrics(self, config):
+        sinks = []
+        if self.writer is not None:
+            sinks.append(metrics.TensorBoardSink(self.writer))
+        if config.get('metrics_wandb', False):
+            sinks.append(metrics.WandbSink())
+        return metrics.MetricsLogger(sinks, async_write=config.get('async_metrics', True))
+
     def _log_train_info(self, train_info, frame):
-        self.writer.add_scalar('performance/update_time', train_info['update_time'], frame)
-        self.writer.add_scalar('performance/play_time', train_info['play_time'], frame)
-        self.writer.add_scalar('losses/a_loss', torch_ext.mean_list(train_info['actor_loss']).item(), frame)
-        self.writer.add_scalar('losses/c_loss', torch_ext.mean_list(train_info['critic_loss']).item(), frame)
+        self._metrics.add_scalar('performance/update_time', train_info['update_time'])
+        self._metrics.add_scalar('performance/play_time', train_info['play_time'])
+        self._metrics.add_scalar('losses/a_loss', torch_ext.mean_list(train_info['actor_loss']))
+        self._metrics.add_scalar('losses/c_loss', torch_ext.mean_list(train_info['critic_loss']))
         
-        self.writer.add_scalar('losses/bounds_loss', torch_ext.mean_list(train_info['b_loss']).item(), frame)
-        self.writer.add_scalar('losses/entropy', torch_ext.mean_list(train_info['entropy']).item(), frame)
-        self.writer.add_scalar('info/last_lr', train_info['last_lr'][-1] * train_info['lr_mul'][-1], frame)
-        self.writer.add_scalar('info/lr_mul', train_info['lr_mul'][-1], frame)
-        self.writer.add_scalar('info/e_clip', self.e_clip * train_info['lr_mul'][-1], frame)
-        self.writer.add_scalar('info/clip_frac', torch_ext.mean_list(train_info['actor_clip_frac']).item(), frame)
-        self.writer.add_scalar('info/kl', torch_ext.mean_list(train_info['kl']).item(), frame)
+        self._metrics.add_scalar('losses/bounds_loss', torch_ext.mean_list(train_info['b_loss']))
+        self._metrics.add_scalar('losses/entropy', torch_ext.mean_list(train_info['entropy']))
+        self._metrics.add_scalar('info/last_lr', train_info['last_lr'][-1] * train_info['lr_mul'][-1])
+        self._metrics.add_scalar('info/lr_mul', train_info['lr_mul'][-1])
+        self._metrics.add_scalar('info/e_clip', self.e_clip * train_info['lr_mul'][-1])
+        self._metrics.add_scalar('info/clip_frac', torch_ext.mean_list(train_info['actor_clip_frac']))
+        self._metrics.add_scalar('info/kl', torch_ext.mean_list(train_info['kl']))
+        if self._actor_learner is not None:
+            self._metrics.add_scalar('info/policy_lag', train_info['policy_lag'])
+            self._metrics.add_scalar('info/dropped_rollouts', self._actor_learner.get_num_dropped())
         return
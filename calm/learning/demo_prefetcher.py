@@ -0,0 +1,141 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import queue
+import threading
+
+import torch
+
+
+class DemoPrefetcher:
+    # Produces demo batches ahead of time on a background thread. fetch_fn(generator) is called repeatedly
+    # and its results (a tensor or a tuple of tensors) are kept in a bounded queue of the given depth,
+    # so at most depth batches are ready and one more is being built. On cuda devices the batches
+    # are built on a side stream and the consuming stream waits on an event before using them.
+    # Every batch is an independent call to fetch_fn, so the sampling distribution is unchanged.
+    # fetch_fn samples from the prefetcher's own generator instead of the global rng, so the training
+    # thread's random sequence does not depend on how far ahead the thread is. The generator state
+    # after the last consumed batch is kept for state_dict(), restoring it discards the queued batches
+    # and continues with the batch that would have been consumed next.
+    def __init__(self, fetch_fn, device, generator, depth=2):
+        self._fetch_fn = fetch_fn
+        self._device = torch.device(device)
+        self._use_cuda = self._device.type == 'cuda'
+        self._stream = torch.cuda.Stream(device=self._device) if self._use_cuda else None
+        self._generator = generator
+        self._consumed_state = generator.get_state()
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop_event = None
+        self._thread = None
+        self._error = None
+
+        self._start()
+        return
+
+    def get(self):
+        while True:
+            if self._error is not None:
+                raise self._error
+            try:
+                batch, event, generator_state = self._queue.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+
+        if event is not None:
+            curr_stream = torch.cuda.current_stream(self._device)
+            curr_stream.wait_event(event)
+            for t in self._get_tensors(batch):
+                t.record_stream(curr_stream)
+
+        self._consumed_state = generator_state
+        return batch
+
+    def close(self):
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+        return
+
+    def state_dict(self):
+        state = {
+            'generator': self._consumed_state
+        }
+        return state
+
+    def load_state_dict(self, state):
+        self.close()
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+        self._consumed_state = state['generator']
+        self._generator.set_state(self._consumed_state)
+        self._start()
+        return
+
+    def _start(self):
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop_event,), daemon=True)
+        self._thread.start()
+        return
+
+    def _run(self, stop_event):
+        try:
+            with torch.no_grad():
+                while not stop_event.is_set():
+                    batch, event = self._produce()
+                    self._put((batch, event, self._generator.get_state()), stop_event)
+        except Exception as e:
+            self._error = e
+        return
+
+    def _produce(self):
+        if self._use_cuda:
+            with torch.cuda.stream(self._stream):
+                batch = self._fetch_fn(self._generator)
+                event = torch.cuda.Event()
+                event.record(self._stream)
+        else:
+            batch = self._fetch_fn(self._generator)
+            event = None
+        return batch, event
+
+    def _put(self, item, stop_event):
+        while not stop_event.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        return
+
+    def _get_tensors(self, batch):
+        if isinstance(batch, torch.Tensor):
+            return [batch]
+        return [t for t in batch if isinstance(t, torch.Tensor)]
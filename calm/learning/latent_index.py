@@ -0,0 +1,178 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import hashlib
+import os
+
+import torch
+
+import learning.checkpoint_writer as checkpoint_writer
+
+
+class LatentIndex:
+    # Encoder latents of every clip in a motion library, one per encoder window ending at a fixed stride
+    # along each clip. The latents are unit length, so cosine similarities against the whole library are a
+    # single matmul, split into chunks of chunk_size entries for large libraries.
+    # The index is cached as latent_index_<key>.pth, keyed by the content hash of the encoder checkpoint,
+    # the stride and the window/motion layout, and only rebuilt when one of them changes.
+    def __init__(self, latents, motion_ids, motion_times, motion_weights, chunk_size=65536):
+        self._latents = latents
+        self._motion_ids = motion_ids
+        self._motion_times = motion_times
+        self._motion_weights = motion_weights
+        self._chunk_size = chunk_size
+
+        num_motions = motion_weights.shape[0]
+        self._motion_counts = torch.bincount(motion_ids, minlength=num_motions)
+        self._motion_starts = torch.cumsum(self._motion_counts, dim=0) - self._motion_counts
+        return
+
+    @staticmethod
+    def build(task, encode_fn, stride, batch_size=4096, chunk_size=65536):
+        # encode_fn maps flat encoder amp obs [n, num_enc_amp_obs] to unit latents [n, latent_dim]
+        motion_ids, motion_times = build_window_times(task, stride)
+
+        latents = []
+        for start in range(0, motion_ids.shape[0], batch_size):
+            end = start + batch_size
+            enc_amp_obs = task.build_amp_obs_demo(motion_ids[start:end], motion_times[start:end],
+                                                  task._num_amp_obs_enc_steps)
+            enc_amp_obs = enc_amp_obs.to(task.device).view(-1, task.get_num_enc_amp_obs())
+            with torch.no_grad():
+                latents.append(encode_fn(enc_amp_obs))
+        latents = torch.cat(latents, dim=0)
+
+        motion_weights = task._motion_lib._motion_weights
+        return LatentIndex(latents, motion_ids, motion_times, motion_weights, chunk_size=chunk_size)
+
+    @staticmethod
+    def load_or_build(task, encode_fn, checkpoint_file, stride, cache_dir=None, batch_size=4096, chunk_size=65536):
+        if not cache_dir or checkpoint_file is None or not os.path.isfile(checkpoint_file):
+            return LatentIndex.build(task, encode_fn, stride, batch_size=batch_size, chunk_size=chunk_size)
+
+        cache_file = os.path.join(cache_dir, 'latent_index_' + get_cache_key(task, checkpoint_file, stride))
+        if os.path.isfile(cache_file + '.pth'):
+            state = torch.load(cache_file + '.pth', map_location=task.device)
+            print("Loaded latent index from {:s}".format(cache_file + '.pth'))
+            return LatentIndex(state['latents'], state['motion_ids'], state['motion_times'],
+                               task._motion_lib._motion_weights, chunk_size=chunk_size)
+
+        index = LatentIndex.build(task, encode_fn, stride, batch_size=batch_size, chunk_size=chunk_size)
+        os.makedirs(cache_dir, exist_ok=True)
+        checkpoint_writer.CheckpointWriter().save(cache_file, index.state_dict())
+        return index
+
+    def state_dict(self):
+        state = {
+            'latents': self._latents,
+            'motion_ids': self._motion_ids,
+            'motion_times': self._motion_times
+        }
+        return state
+
+    def get_num_entries(self):
+        return self._latents.shape[0]
+
+    def get_latents(self):
+        return self._latents
+
+    def max_cosine(self, z):
+        # returns the largest cosine similarity of each query with the library and the index of the best entry
+        z = torch.nn.functional.normalize(z, dim=-1)
+        best_sim = None
+        best_idx = None
+        for start, latents in self._chunks():
+            sim, idx = torch.max(torch.matmul(z, latents.t()), dim=-1)
+            if best_sim is None:
+                best_sim, best_idx = sim, idx + start
+            else:
+                better = sim > best_sim
+                best_sim = torch.where(better, sim, best_sim)
+                best_idx = torch.where(better, idx + start, best_idx)
+        return best_sim, best_idx
+
+    def topk(self, z, k):
+        z = torch.nn.functional.normalize(z, dim=-1)
+        k = min(k, self.get_num_entries())
+        best_sim = None
+        best_idx = None
+        for start, latents in self._chunks():
+            sim = torch.matmul(z, latents.t())
+            sim, idx = torch.topk(sim, min(k, sim.shape[-1]), dim=-1)
+            idx = idx + start
+            if best_sim is not None:
+                sim = torch.cat([best_sim, sim], dim=-1)
+                idx = torch.cat([best_idx, idx], dim=-1)
+                sim, order = torch.topk(sim, min(k, sim.shape[-1]), dim=-1)
+                idx = torch.gather(idx, -1, order)
+            best_sim, best_idx = sim, idx
+        return best_sim, best_idx
+
+    def sample(self, n):
+        # motions are drawn with the library weights and a window uniformly within each motion,
+        # matching the distribution of fetch_amp_obs_demo_enc_pair
+        motion_ids = torch.multinomial(self._motion_weights, num_samples=n, replacement=True)
+        motion_ids = motion_ids.to(self._latents.device)
+        counts = self._motion_counts[motion_ids]
+        offsets = (torch.rand(n, device=self._latents.device) * counts).long()
+        idx = self._motion_starts[motion_ids] + torch.minimum(offsets, counts - 1)
+        return self._latents[idx], motion_ids
+
+    def _chunks(self):
+        for start in range(0, self.get_num_entries(), self._chunk_size):
+            yield start, self._latents[start:start + self._chunk_size]
+        return
+
+
+def build_window_times(task, stride):
+    # end times of the encoder windows of every clip, the first window ends once a full encoder window
+    # fits into the clip (or at the end of clips shorter than a window), the rest follow every stride seconds
+    # and the last one ends at the end of the clip
+    motion_lengths = task._motion_lib._motion_lengths
+    enc_window_size = task.dt * (task._num_amp_obs_enc_steps - 1)
+    first_times = torch.clip(motion_lengths, max=enc_window_size)
+    counts = torch.ceil((motion_lengths - first_times) / stride).long() + 1
+
+    motion_ids = torch.repeat_interleave(torch.arange(motion_lengths.shape[0], device=counts.device), counts)
+    starts = torch.cumsum(counts, dim=0) - counts
+    steps = torch.arange(motion_ids.shape[0], device=counts.device) - starts[motion_ids]
+    motion_times = first_times[motion_ids] + steps * stride
+    motion_times = torch.minimum(motion_times, motion_lengths[motion_ids])
+    return motion_ids, motion_times
+
+
+def get_cache_key(task, checkpoint_file, stride):
+    h = hashlib.sha1()
+    with open(checkpoint_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+
+    layout = [stride, task.dt, task._num_amp_obs_enc_steps, task._num_amp_obs_per_step]
+    h.update(repr(layout).encode())
+    h.update(task._motion_lib._motion_lengths.cpu().numpy().tobytes())
+    return h.hexdigest()[:16]
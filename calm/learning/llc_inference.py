@@ -0,0 +1,229 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import torch
+
+from rl_games.algos_torch import players
+from rl_games.algos_torch import torch_ext
+from rl_games.algos_torch.running_mean_std import RunningMeanStd
+
+import learning.calm_network_builder as calm_network_builder
+
+STEP_MODES = ('eager', 'script', 'compile')
+
+
+class LLCInference(torch.nn.Module):
+    # Inference-only view of a trained CALM low-level controller. Only the actor, encoder and
+    # discriminator weights and the obs/amp normalizers are restored from the checkpoint; the critic,
+    # conditional discriminator, optimizer and experience buffers of a full CALMAgent are never built.
+    _UNUSED_MODULES = ('critic_cnn', 'critic_mlp', 'value', 'value_act', '_cond_disc_mlp', '_cond_disc_logits')
+
+    def __init__(self, config_params, obs_size, action_space, amp_obs_size, num_amp_obs_steps, device,
+                 step_mode='eager'):
+        super().__init__()
+        assert step_mode in STEP_MODES, "unsupported llc step mode: {}".format(step_mode)
+        config = config_params['config']
+        self._step_mode = step_mode
+        self._step_fn = None
+        self._normalize_input = config['normalize_input']
+        self._normalize_amp_input = config.get('normalize_amp_input', True)
+        self._clip_actions = config.get('clip_actions', True)
+        self._disc_reward_scale = config['disc_reward_scale']
+        self._num_amp_obs_per_step = amp_obs_size // num_amp_obs_steps
+
+        network_builder = calm_network_builder.CALMBuilder()
+        network_builder.load(config_params['network'])
+        net_config = {
+            'actions_num': action_space.shape[0],
+            'input_shape': (obs_size,),
+            'num_seqs': 1,
+            'value_size': 1,
+            'amp_input_shape': (amp_obs_size,),
+            'amp_obs_steps': num_amp_obs_steps,
+            'calm_latent_shape': (config['latent_dim'],),
+        }
+        self.a2c_network = network_builder.build('calm', **net_config)
+        for name in self._UNUSED_MODULES:
+            if hasattr(self.a2c_network, name):
+                delattr(self.a2c_network, name)
+
+        if self._normalize_input:
+            self.running_mean_std = RunningMeanStd((obs_size,))
+        if self._normalize_amp_input:
+            self._amp_input_mean_std = RunningMeanStd((self._num_amp_obs_per_step,))
+
+        self.register_buffer('actions_low', torch.from_numpy(action_space.low.copy()).float())
+        self.register_buffer('actions_high', torch.from_numpy(action_space.high.copy()).float())
+
+        self.to(device)
+        self.requires_grad_(False)
+        self.eval()
+        return
+
+    def restore(self, fn):
+        checkpoint = torch_ext.load_checkpoint(fn)
+        prefix = 'a2c_network.'
+        model_weights = {}
+        for key, value in checkpoint['model'].items():
+            name = key[len(prefix):] if key.startswith(prefix) else key
+            if name.split('.')[0] not in self._UNUSED_MODULES:
+                model_weights[name] = value
+        self.a2c_network.load_state_dict(model_weights)
+
+        if self._normalize_input:
+            self.running_mean_std.load_state_dict(checkpoint['running_mean_std'])
+        if self._normalize_amp_input:
+            self._amp_input_mean_std.load_state_dict(checkpoint['amp_input_mean_std'])
+        self.eval()
+
+        self._build_step_fn()
+        return
+
+    def _build_step_fn(self):
+        # the fused actor folds the current normalizer statistics, so it is rebuilt after every restore
+        if self._step_mode == 'eager':
+            self._step_fn = None
+            return
+
+        fused_actor = FusedLLCActor(self)
+        if self._step_mode == 'script':
+            self._step_fn = torch.jit.script(fused_actor)
+        else:
+            # static shapes, on cuda the step is captured as a cuda graph
+            compile_mode = 'reduce-overhead' if self.actions_low.is_cuda else 'default'
+            self._step_fn = torch.compile(fused_actor, mode=compile_mode, dynamic=False)
+        return
+
+    def preproc_obs(self, obs):
+        if obs.dtype == torch.uint8:
+            obs = obs.float() / 255.0
+        if self._normalize_input:
+            obs = self.running_mean_std(obs)
+        return obs
+
+    def preproc_amp_obs(self, amp_obs):
+        if self._normalize_amp_input:
+            shape = amp_obs.shape
+            amp_obs = amp_obs.view(-1, self._num_amp_obs_per_step)
+            amp_obs = self._amp_input_mean_std(amp_obs.float())
+            amp_obs = amp_obs.view(shape)
+        return amp_obs
+
+    @torch.no_grad()
+    def compute_action(self, obs, latents):
+        if self._step_fn is not None:
+            mu = self._step_fn(obs, latents)
+            if self._step_mode == 'compile':
+                # cuda graph outputs are overwritten by the next replay
+                mu = mu.clone()
+            return mu
+
+        processed_obs = self.preproc_obs(obs)
+        z = torch.nn.functional.normalize(latents, dim=-1)
+        mu, _ = self.a2c_network.eval_actor(processed_obs, z)
+        if self._clip_actions:
+            mu = players.rescale_actions(self.actions_low, self.actions_high, torch.clamp(mu, -1.0, 1.0))
+        return mu
+
+    @torch.no_grad()
+    def eval_enc(self, amp_obs):
+        proc_amp_obs = self.preproc_amp_obs(amp_obs)
+        return self.a2c_network.eval_enc(proc_amp_obs)
+
+    @torch.no_grad()
+    def calc_disc_rewards(self, amp_obs):
+        proc_amp_obs = self.preproc_amp_obs(amp_obs)
+        disc_logits = self.a2c_network.eval_disc(proc_amp_obs)
+        prob = torch.sigmoid(disc_logits)
+        disc_r = -torch.log(torch.clamp_min(1 - prob, 0.0001))
+        disc_r *= self._disc_reward_scale
+        return disc_r
+
+
+class FusedLLCActor(torch.nn.Module):
+    # Deterministic LLC actor step as a single graph: latent normalization, style mlp, actor mlp, mu and
+    # action rescaling. The obs normalizer is folded into the first actor layer. Normalizing and then
+    # clamping to [-5, 5] is the same as clamping the raw obs to mean +- 5 * std first, so the fold is exact:
+    #   W (clamp(x, lo, hi) - mean) / std + b = (W / std) clamp(x, lo, hi) + (b - (W / std) mean)
+    def __init__(self, llc):
+        super().__init__()
+        net = llc.a2c_network
+        actor_mlp = net.actor_mlp
+        assert net.is_continuous, "fused llc step requires a continuous actor"
+
+        first_dense = actor_mlp._dense_layers[0]
+        obs_size = first_dense.in_features - actor_mlp._style_dim
+        obs_weight = first_dense.weight[:, :obs_size].double()
+        obs_bias = first_dense.bias.double()
+        if llc._normalize_input:
+            rms = llc.running_mean_std
+            mean = rms.running_mean.double()
+            std = torch.sqrt(rms.running_var.double() + rms.epsilon)
+            obs_weight = obs_weight / std
+            obs_bias = obs_bias - obs_weight @ mean
+            obs_low = mean - 5.0 * std
+            obs_high = mean + 5.0 * std
+        else:
+            obs_low = torch.full((obs_size,), -float('inf'), dtype=torch.float64, device=obs_weight.device)
+            obs_high = torch.full((obs_size,), float('inf'), dtype=torch.float64, device=obs_weight.device)
+
+        # weights are stored transposed, [in, out], for addmm
+        self.register_buffer('_obs_weight', obs_weight.float().t().contiguous())
+        self.register_buffer('_obs_bias', obs_bias.float())
+        self.register_buffer('_style_weight', first_dense.weight[:, obs_size:].t().contiguous())
+        self.register_buffer('_obs_low', obs_low.float())
+        self.register_buffer('_obs_high', obs_high.float())
+
+        self._style_mlp = actor_mlp._style_mlp
+        self._style_dense = actor_mlp._style_dense
+        self._dense_layers = torch.nn.ModuleList(list(actor_mlp._dense_layers)[1:])
+        self._activation = actor_mlp._activation
+        self._mu = net.mu
+        self._mu_act = net.mu_act
+
+        self._clip_actions = llc._clip_actions
+        self.register_buffer('_action_scale', (llc.actions_high - llc.actions_low) / 2.0)
+        self.register_buffer('_action_offset', (llc.actions_high + llc.actions_low) / 2.0)
+        self.eval()
+        return
+
+    def forward(self, obs, latents):
+        z = torch.nn.functional.normalize(latents, dim=-1)
+        style = torch.tanh(self._style_dense(self._style_mlp(z)))
+
+        obs = torch.clamp(obs, self._obs_low, self._obs_high)
+        h = torch.addmm(self._obs_bias, obs, self._obs_weight)
+        h = torch.addmm(h, style, self._style_weight)
+        h = self._activation(h)
+        for dense in self._dense_layers:
+            h = self._activation(dense(h))
+
+        mu = self._mu_act(self._mu(h))
+        if self._clip_actions:
+            mu = torch.addcmul(self._action_offset, torch.clamp(mu, -1.0, 1.0), self._action_scale)
+        return mu
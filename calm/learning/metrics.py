@@ -0,0 +1,222 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import queue
+import threading
+
+import torch
+
+
+class MetricsLogger:
+    # Collects training metrics without synchronizing with the device. Scalars are summed into 0-dim
+    # tensors on the device where they were produced (tensors with more than one element are averaged
+    # first), histograms keep the recorded tensors. flush(step) reduces everything with one stack per
+    # device and a single non-blocking copy to the host, a background thread waits for the copy and
+    # writes to the sinks. A scalar recorded several times between flushes is logged as its mean, at the
+    # step given with its last add_scalar call or at the flush step.
+    def __init__(self, sinks, async_write=True):
+        self._sinks = sinks
+        self._enabled = len(sinks) > 0
+        self._async_write = async_write
+        self._scalars = dict()
+        self._histograms = dict()
+        self._steps = dict()
+        self._error = None
+
+        if self._enabled and self._async_write:
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return
+
+    def add_scalar(self, tag, value, step=None):
+        if not self._enabled:
+            return
+
+        if isinstance(value, torch.Tensor):
+            value = value.detach()
+            value = value.float().mean() if value.numel() != 1 else value.float().reshape(())
+
+        entry = self._scalars.get(tag)
+        if entry is None:
+            self._scalars[tag] = [value, 1]
+        else:
+            entry[0] = entry[0] + value
+            entry[1] += 1
+
+        if step is not None:
+            self._steps[tag] = step
+        return
+
+    def add_histogram(self, tag, values, step=None):
+        if not self._enabled:
+            return
+
+        if isinstance(values, torch.Tensor):
+            values = values.detach().float().flatten()
+        else:
+            values = torch.as_tensor(values, dtype=torch.float32).flatten()
+        self._histograms.setdefault(tag, []).append(values)
+
+        if step is not None:
+            self._steps[tag] = step
+        return
+
+    def flush(self, step):
+        if not self._enabled:
+            return
+        self._check_error()
+
+        scalars, histograms, event = self._reduce()
+        steps = dict()
+        for tag in list(scalars.keys()) + list(histograms.keys()):
+            steps[tag] = self._steps.get(tag, step)
+
+        self._scalars = dict()
+        self._histograms = dict()
+        self._steps = dict()
+
+        if self._async_write:
+            self._queue.put((scalars, histograms, steps, event))
+        else:
+            self._write(scalars, histograms, steps, event)
+        return
+
+    def close(self):
+        if self._enabled and self._async_write:
+            self._queue.join()
+            self._queue.put(None)
+            self._thread.join()
+            self._async_write = False
+        self._check_error()
+        return
+
+    def _reduce(self):
+        # returns scalars and histograms as host tensors that are valid once event has completed
+        host_scalars = dict()
+        host_histograms = dict()
+
+        groups = dict()
+        for tag, (value, count) in self._scalars.items():
+            if isinstance(value, torch.Tensor):
+                groups.setdefault(value.device, []).append(tag)
+            else:
+                host_scalars[tag] = value / count
+
+        for device, tags in groups.items():
+            means = torch.stack([self._scalars[tag][0] / self._scalars[tag][1] for tag in tags])
+            host_means = self._copy_to_host(means)
+            for i, tag in enumerate(tags):
+                host_scalars[tag] = (host_means, i)
+
+        for tag, values in self._histograms.items():
+            host_histograms[tag] = self._copy_to_host(torch.cat([v.to(values[0].device) for v in values]))
+
+        event = None
+        cuda_devices = [d for d in groups.keys() if d.type == 'cuda']
+        cuda_devices += [v[0].device for v in self._histograms.values() if v[0].is_cuda]
+        if len(cuda_devices) > 0:
+            event = torch.cuda.Event()
+            event.record()
+        return host_scalars, host_histograms, event
+
+    def _copy_to_host(self, x):
+        if not x.is_cuda:
+            return x
+        host = torch.empty(x.shape, dtype=x.dtype, pin_memory=True)
+        host.copy_(x, non_blocking=True)
+        return host
+
+    def _write(self, scalars, histograms, steps, event):
+        if event is not None:
+            event.synchronize()
+
+        values = dict()
+        for tag, value in scalars.items():
+            if isinstance(value, tuple):
+                host_means, i = value
+                value = host_means[i].item()
+            elif isinstance(value, torch.Tensor):
+                value = value.item()
+            values[tag] = value
+
+        hist_values = {tag: v.numpy() for tag, v in histograms.items()}
+        for sink in self._sinks:
+            sink.write(values, hist_values, steps)
+        return
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            try:
+                self._write(*item)
+            except Exception as e:
+                self._error = e
+            self._queue.task_done()
+        return
+
+    def _check_error(self):
+        if self._error is not None:
+            error = self._error
+            self._error = None
+            raise error
+        return
+
+
+class TensorBoardSink:
+    def __init__(self, writer):
+        self._writer = writer
+        return
+
+    def write(self, scalars, histograms, steps):
+        for tag, value in scalars.items():
+            self._writer.add_scalar(tag, value, steps[tag])
+        for tag, values in histograms.items():
+            self._writer.add_histogram(tag, values, steps[tag])
+        return
+
+
+class WandbSink:
+    # logs without an explicit wandb step, the metric step is added as 'global_step' instead, which keeps
+    # the wandb step monotonic when tensorboard is synced to the same run
+    def __init__(self):
+        import wandb
+        self._wandb = wandb
+        return
+
+    def write(self, scalars, histograms, steps):
+        data = dict(scalars)
+        for tag, values in histograms.items():
+            data[tag] = self._wandb.Histogram(values)
+        if len(steps) > 0:
+            data['global_step'] = max(steps.values())
+        self._wandb.log(data)
+        return
@@ -0,0 +1,81 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# Helpers for the autocast training path. Normalizers and gradient penalties are kept in float32:
+# penalty gradients are taken of loss-scaled outputs, so that fp16 intermediate gradients do not
+# underflow, and are unscaled in float32 before the penalty is formed.
+# fp16 on CUDA goes through torch.cuda.amp.autocast, which is available on torch 1.8. bf16 and CPU
+# autocast need torch.autocast from torch 1.10.
+
+import contextlib
+
+import torch
+
+
+AUTOCAST_DTYPES = {
+    'float16': torch.float16,
+    'bfloat16': torch.bfloat16,
+}
+
+
+def get_autocast_dtype(name):
+    assert(name in AUTOCAST_DTYPES), 'unsupported mixed precision dtype: {}'.format(name)
+    return AUTOCAST_DTYPES[name]
+
+
+def autocast(device, enabled, dtype):
+    device_type = torch.device(device).type
+    if not enabled or (device_type == 'cpu' and dtype == torch.float16):
+        return contextlib.nullcontext()
+
+    if device_type == 'cuda' and dtype == torch.float16:
+        return torch.cuda.amp.autocast(enabled=True)
+
+    assert(hasattr(torch, 'autocast')), '{} autocast on {} requires torch >= 1.10'.format(dtype, device_type)
+    return torch.autocast(device_type=device_type, dtype=dtype)
+
+
+def penalty_grads(outputs, inputs, scaler):
+    # d(outputs)/d(inputs) with create_graph, for gradient penalties inside an autocast region.
+    # The scale is read as a device tensor so that no host sync is needed, with a disabled scaler
+    # it is 1 and this reduces to a plain autograd.grad call.
+    scale = scaler.scale(torch.ones((), dtype=torch.float32, device=outputs.device))
+    scaled_outputs = outputs.float() * scale
+    grads = torch.autograd.grad(scaled_outputs, inputs, grad_outputs=torch.ones_like(scaled_outputs),
+                                create_graph=True, retain_graph=True, only_inputs=True)
+    grads = [g.float() / scale for g in grads]
+    return grads
+
+
+def no_autocast(device):
+    device_type = torch.device(device).type
+    if device_type == 'cuda':
+        return torch.cuda.amp.autocast(enabled=False)
+    elif hasattr(torch, 'autocast'):
+        return torch.autocast(device_type=device_type, enabled=False)
+    return contextlib.nullcontext()
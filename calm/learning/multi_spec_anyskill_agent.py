@@ -0,0 +1,140 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import torch
+from torch import optim
+
+import learning.policy_group as policy_group
+import learning.spec_anyskill_agent as spec_anyskill_agent
+
+
+class MultiSpecAnyskillAgent(spec_anyskill_agent.SpecAnyskillAgent):
+    # Trains one high-level policy per text in a single process. The envs are split into contiguous,
+    # equally sized groups, group i is always conditioned on text policy_texts[i] and acts with its own
+    # policy and optimizer state, while the simulation, the LLC, the reward encoder and the style index
+    # run batched over all envs. Observation and value normalization are shared by the policies.
+    def __init__(self, base_name, config):
+        super().__init__(base_name, config)
+
+        texts, _ = spec_anyskill_agent.load_texts(self.text_file)
+        self._policy_texts = config.get('policy_texts', None) or list(range(len(texts)))
+        self._policy_text_names = [texts[i] for i in self._policy_texts]
+        self._policy_text_idx = torch.tensor(self._policy_texts, dtype=torch.long, device=self.ppo_device)
+
+        num_policies = len(self._policy_texts)
+        assert(self.num_actors % num_policies == 0), \
+            'num_envs {} is not divisible by the number of policies {}'.format(self.num_actors, num_policies)
+
+        net_config = self._build_net_config()
+        models = [self.model]
+        for _ in range(num_policies - 1):
+            models.append(self.network.build(net_config))
+        self.model = policy_group.PolicyGroup(models, self.num_actors // num_policies)
+        self.model.to(self.ppo_device)
+
+        # Adam keeps its state per parameter, so with one parameter group per policy and losses that are
+        # averaged per group the policies are optimized independently
+        param_groups = [{'params': m.parameters()} for m in models]
+        self.optimizer = optim.Adam(param_groups, float(self.last_lr), eps=1e-08, weight_decay=self.weight_decay)
+
+        # rollouts are flattened env major, see rollout_postprocess.flatten_rollout
+        self._env_group_ids = self.model.get_env_group_ids(self.ppo_device)
+        self._batch_group_ids = self._env_group_ids.repeat_interleave(self.horizon_length)
+
+        for i, text in enumerate(self._policy_text_names):
+            print("Policy {:d}: {:s}".format(i, text))
+        return
+
+    def save(self, fn):
+        super().save(fn)
+        for i in range(self.model.get_num_policies()):
+            self._checkpoint_writer.save(fn + '_policy' + str(i), self._get_policy_weights(i))
+        return
+
+    def prepare_dataset(self, batch_dict):
+        super().prepare_dataset(batch_dict)
+
+        dataset_dict = dict(self.dataset.values_dict)
+        dataset_dict['group_ids'] = self._batch_group_ids
+        self.dataset.update_values_dict(dataset_dict)
+        return
+
+    def _get_policy_weights(self, policy_id):
+        # same layout as a SpecAnyskillAgent checkpoint, so a single policy can be played with spec_anyskill
+        state = self.get_stats_weights()
+        state['model'] = self.model.get_policy(policy_id).state_dict()
+        state['text'] = self._policy_text_names[policy_id]
+        return state
+
+    def _reset_latents(self, env_ids):
+        z_text_idx = self._policy_text_idx[self._env_group_ids[env_ids]]
+        z = torch.nn.functional.normalize(self.text_features[z_text_idx], dim=-1)
+        self._text_latents[env_ids] = z
+        self._latent_text_idx[env_ids] = z_text_idx
+
+        if (self.vec_env.env.task.viewer):
+            self._change_char_color(env_ids)
+
+        return
+
+    def _get_critic_inputs(self):
+        return [self.obs['obs'], self._env_group_ids]
+
+    def _eval_next_values(self, critic_inputs):
+        return self._eval_critic({'obs': critic_inputs[0], 'group_ids': critic_inputs[1]})
+
+    def _eval_critic(self, obs_dict):
+        self.model.eval()
+        processed_obs = self._preproc_obs(obs_dict['obs'])
+        value = self.model.eval_critic(processed_obs, obs_dict.get('group_ids', None))
+
+        if self.normalize_value:
+            value = self.value_mean_std(value, True)
+        return value
+
+    def _reduce_batch_loss(self, loss, input_dict):
+        # mean per policy, summed over the policies in the minibatch with equal weights
+        if not isinstance(loss, torch.Tensor) or loss.dim() == 0:
+            return torch.mean(loss)
+
+        group_ids = input_dict['group_ids']
+        group_counts = torch.bincount(group_ids, minlength=self.model.get_num_policies())
+        num_groups = torch.count_nonzero(group_counts)
+        weights = 1.0 / (group_counts[group_ids] * num_groups)
+
+        loss = loss.reshape(loss.shape[0], -1).mean(dim=-1)
+        loss = torch.sum(weights * loss)
+        return loss
+
+    def _calc_anyskill_reward(self, infos):
+        anyskill_rewards, delta, similarity = super()._calc_anyskill_reward(infos)
+
+        group_rewards = anyskill_rewards.reshape(self.model.get_num_policies(), -1).mean(dim=-1)
+        for i in range(group_rewards.shape[0]):
+            self._metrics.add_scalar('reward/policy{:d}_anyskill_reward'.format(i), group_rewards[i])
+        return anyskill_rewards, delta, similarity
@@ -0,0 +1,129 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import torch
+import torch.nn as nn
+
+
+class PolicyGroup(nn.Module):
+    # Independent copies of a policy model, each row of a batch is evaluated by the policy of its group.
+    # The groups own contiguous, equally sized ranges of envs. Batches in env order (rollouts) are split
+    # into slices without copies, other batches (shuffled minibatches, env subsets) pass per-row
+    # 'group_ids' and are gathered per group. Outputs are returned in the order of the input rows.
+    def __init__(self, models, group_size):
+        super().__init__()
+        self.models = nn.ModuleList(models)
+        self._group_size = group_size
+        return
+
+    def get_num_policies(self):
+        return len(self.models)
+
+    def get_policy(self, policy_id):
+        return self.models[policy_id]
+
+    def get_env_group_ids(self, device):
+        group_ids = torch.arange(self.get_num_policies(), device=device)
+        group_ids = group_ids.repeat_interleave(self._group_size)
+        return group_ids
+
+    def is_rnn(self):
+        return self.models[0].is_rnn()
+
+    def get_default_rnn_state(self):
+        return self.models[0].get_default_rnn_state()
+
+    def forward(self, input_dict):
+        assert(not self.is_rnn())
+        group_ids = input_dict.get('group_ids', None)
+        group_rows = self._get_group_rows(input_dict['obs'].shape[0], group_ids)
+        prev_actions = input_dict.get('prev_actions', None)
+
+        group_results = []
+        for model, rows in zip(self.models, group_rows):
+            if rows is None:
+                group_results.append(None)
+                continue
+
+            group_input = dict(input_dict)
+            group_input.pop('group_ids', None)
+            group_input['obs'] = input_dict['obs'][rows]
+            if prev_actions is not None:
+                group_input['prev_actions'] = prev_actions[rows]
+            group_results.append(model(group_input))
+
+        result = self._merge_results(group_results, group_rows, group_ids)
+        return result
+
+    def eval_critic(self, obs, group_ids=None):
+        group_rows = self._get_group_rows(obs.shape[0], group_ids)
+        group_results = []
+        for model, rows in zip(self.models, group_rows):
+            if rows is None:
+                group_results.append(None)
+            else:
+                group_results.append({'values': model.a2c_network.eval_critic(obs[rows])})
+
+        values = self._merge_results(group_results, group_rows, group_ids)['values']
+        return values
+
+    def _get_group_rows(self, batch_size, group_ids):
+        # a slice or an index tensor per group, None for groups without rows in the batch
+        group_rows = []
+        if group_ids is None:
+            assert(batch_size == self._group_size * self.get_num_policies())
+            for i in range(self.get_num_policies()):
+                group_rows.append(slice(i * self._group_size, (i + 1) * self._group_size))
+        else:
+            for i in range(self.get_num_policies()):
+                idx = (group_ids == i).nonzero(as_tuple=False).flatten()
+                group_rows.append(idx if idx.shape[0] > 0 else None)
+        return group_rows
+
+    def _merge_results(self, group_results, group_rows, group_ids):
+        ref_result = next(res for res in group_results if res is not None)
+        merged = dict()
+        for k, ref_v in ref_result.items():
+            if not isinstance(ref_v, torch.Tensor):
+                merged[k] = ref_v
+                continue
+
+            # the model squeezes log probs, which turns the result of a single row group into a scalar
+            group_vals = [None if res is None else res[k].view(1) if res[k].dim() == 0 else res[k]
+                          for res in group_results]
+
+            if group_ids is None:
+                merged[k] = torch.cat(group_vals, dim=0)
+            else:
+                ref_v = next(v for v in group_vals if v is not None)
+                merged_v = ref_v.new_empty((group_ids.shape[0],) + ref_v.shape[1:])
+                for rows, v in zip(group_rows, group_vals):
+                    if rows is not None:
+                        merged_v[rows] = v
+                merged[k] = merged_v
+        return merged
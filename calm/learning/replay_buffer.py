@@ -26,29 +26,81 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
 import torch
 import numpy as np
 
 
 class ReplayBuffer:
-    def __init__(self, buffer_size, device, numpy_keys=None):
+    # Float tensors from all keys are packed into a single [buffer_size, total_width] tensor with
+    # per-key column views, so sampling runs as one gather over all keys. Sampled entries are
+    # column views of the gathered tensor, call .contiguous() before reshaping across the batch dim.
+    #
+    # storage selects where the packed tensor lives: 'device' keeps it on the training device,
+    # 'pinned' in page-locked host memory and 'mmap' in a file backed array at mmap_path, which
+    # allows buffers much larger than device memory. Without mmap_path the array is backed by a
+    # temporary file that close() deletes. With prefetch enabled, the next minibatch of
+    # the same size is gathered and copied to the device on a background thread after each
+    # sample() call, so the transfer overlaps with training. Prefetched samples are drawn before
+    # the following store(), i.e. they can lag the newest entries by one store.
+    def __init__(self, buffer_size, device, numpy_keys=None, storage='device', mmap_path=None, prefetch=False):
+        assert(storage in ['device', 'pinned', 'mmap'])
+
         self._head = 0
         self._total_count = 0
         self._buffer_size = buffer_size
         self._device = device
+        self._storage = storage
+        self._storage_device = device if storage == 'device' else 'cpu'
+        self._mmap_path = mmap_path
+        self._mmap_temp_path = None
         self._data_buf = None
-        self._sample_idx = torch.randperm(buffer_size)
+        self._packed_buf = None
+        self._packed_keys = []
+        self._packed_cols = dict()
+        self._packed_shapes = dict()
+        self._sample_idx = torch.randperm(buffer_size, device=self._storage_device)
         self._sample_head = 0
         self._numpy_keys = numpy_keys
 
+        self._use_cuda_copy = storage != 'device' and torch.device(device).type == 'cuda'
+        self._copy_stream = torch.cuda.Stream(device=device) if self._use_cuda_copy else None
+        self._staging_buf = None
+        self._staging_event = None
+
+        self._prefetch = prefetch
+        self._prefetch_executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        self._prefetch_future = None
+        self._prefetch_n = 0
+
         return
 
     def reset(self):
+        self._wait_prefetch()
+        self._prefetch_future = None
         self._head = 0
         self._total_count = 0
         self._reset_sample_idx()
         return
 
+    def close(self):
+        self._wait_prefetch()
+        self._prefetch_future = None
+        if self._prefetch_executor is not None:
+            self._prefetch_executor.shutdown(wait=True)
+            self._prefetch_executor = None
+            self._prefetch = False
+
+        if self._mmap_temp_path is not None:
+            self._data_buf = None
+            self._packed_buf = None
+            os.remove(self._mmap_temp_path)
+            self._mmap_temp_path = None
+        return
+
     def get_buffer_size(self):
         return self._buffer_size
 
@@ -56,6 +108,8 @@ class ReplayBuffer:
         return self._total_count
 
     def store(self, data_dict):
+        self._wait_prefetch()
+
         if self._data_buf is None:
             self._init_data_buf(data_dict)
 
@@ -63,14 +117,15 @@ class ReplayBuffer:
         buffer_size = self.get_buffer_size()
         assert(n <= buffer_size)
 
+        # at most one wraparound, so every key is written with one or two row-range copies
+        # directly into its columns of the packed buffer
+        store_n = min(n, buffer_size - self._head)
+        remainder = n - store_n
         for key, curr_buf in self._data_buf.items():
             curr_n = data_dict[key].shape[0]
             assert(n == curr_n)
 
-            store_n = min(curr_n, buffer_size - self._head)
             curr_buf[self._head:(self._head + store_n)] = data_dict[key][:store_n]    
-        
-            remainder = n - store_n
             if remainder > 0:
                 curr_buf[0:remainder] = data_dict[key][store_n:]  
 
@@ -79,29 +134,128 @@ class ReplayBuffer:
 
         return
 
+    def state_dict(self):
+        # only the filled rows are returned, as views into the buffer
+        self._wait_prefetch()
+        count = min(self._total_count, self.get_buffer_size())
+        data = dict()
+        if self._data_buf is not None:
+            for k, v in self._data_buf.items():
+                data[k] = v[:count]
+
+        state = {
+            'head': self._head,
+            'total_count': self._total_count,
+            'sample_idx': self._sample_idx,
+            'sample_head': self._sample_head,
+            'data': data
+        }
+        return state
+
+    def load_state_dict(self, state):
+        self.reset()
+        data = state['data']
+        if len(data) > 0:
+            if self._data_buf is None:
+                self._init_data_buf(data)
+            for k, v in data.items():
+                count = v.shape[0]
+                curr_buf = self._data_buf[k]
+                if isinstance(curr_buf, np.ndarray):
+                    curr_buf[:count] = np.asarray(v)
+                else:
+                    curr_buf[:count] = torch.as_tensor(v).to(curr_buf.device)
+
+        self._head = state['head']
+        self._total_count = state['total_count']
+        self._sample_idx[:] = state['sample_idx'].to(self._storage_device)
+        self._sample_head = state['sample_head']
+        return
+
     def sample(self, n):
+        if self._prefetch_future is not None and self._prefetch_n == n:
+            samples, event = self._prefetch_future.result()
+        else:
+            self._wait_prefetch()
+            samples, event = self._sample(n)
+        self._prefetch_future = None
+
+        if event is not None:
+            # the samples were copied on the side stream, the consuming stream waits for the copy
+            curr_stream = torch.cuda.current_stream(self._device)
+            curr_stream.wait_event(event)
+            for v in samples.values():
+                if isinstance(v, torch.Tensor) and v.is_cuda:
+                    v.record_stream(curr_stream)
+
+        if self._prefetch:
+            self._prefetch_n = n
+            self._prefetch_future = self._prefetch_executor.submit(self._sample, n)
+
+        return samples
+
+    def _sample(self, n):
         total_count = self.get_total_count()
         buffer_size = self.get_buffer_size()
 
-        idx = torch.arange(self._sample_head, self._sample_head + n)
+        idx = torch.arange(self._sample_head, self._sample_head + n, device=self._storage_device)
         idx = idx % buffer_size
         rand_idx = self._sample_idx[idx]
         if total_count < buffer_size:
             rand_idx = rand_idx % self._head
 
         samples = dict()
+        event = None
+        if self._packed_buf is not None:
+            packed_samples, event = self._gather_packed(rand_idx)
+            for k in self._packed_keys:
+                col_start, col_end = self._packed_cols[k]
+                samples[k] = packed_samples[:, col_start:col_end].view((n,) + self._packed_shapes[k])
+
         for k, v in self._data_buf.items():
-            samples[k] = v[rand_idx]
+            if k in self._packed_cols:
+                continue
+            if isinstance(v, np.ndarray):
+                samples[k] = v[rand_idx.cpu().numpy()]
+            else:
+                samples[k] = v[rand_idx].to(self._device)
 
         self._sample_head += n
         if self._sample_head >= buffer_size:
             self._reset_sample_idx()
 
-        return samples
+        return samples, event
+
+    def _gather_packed(self, rand_idx):
+        if not self._use_cuda_copy:
+            return self._packed_buf[rand_idx].to(self._device), None
+
+        # gather into a pinned staging buffer and copy to the device on a side stream, the
+        # staging buffer is only refilled once the event of its previous copy has completed
+        if self._staging_event is not None:
+            self._staging_event.synchronize()
+
+        n = rand_idx.shape[0]
+        if self._staging_buf is None or self._staging_buf.shape[0] < n:
+            self._staging_buf = torch.empty((n, self._packed_buf.shape[1]), pin_memory=True)
+        staging = self._staging_buf[:n]
+        torch.index_select(self._packed_buf, 0, rand_idx, out=staging)
+
+        with torch.cuda.stream(self._copy_stream):
+            packed_samples = staging.to(self._device, non_blocking=True)
+            event = torch.cuda.Event()
+            event.record(self._copy_stream)
+        self._staging_event = event
+        return packed_samples, event
+
+    def _wait_prefetch(self):
+        if self._prefetch_future is not None:
+            self._prefetch_future.result()
+        return
 
     def _reset_sample_idx(self):
         buffer_size = self.get_buffer_size()
-        self._sample_idx[:] = torch.randperm(buffer_size)
+        self._sample_idx[:] = torch.randperm(buffer_size, device=self._storage_device)
         self._sample_head = 0
         return
 
@@ -109,11 +263,44 @@ class ReplayBuffer:
         buffer_size = self.get_buffer_size()
         self._data_buf = dict()
 
+        packed_width = 0
         for k, v in data_dict.items():
-            v_shape = v.shape[1:]
+            v_shape = tuple(v.shape[1:])
             if self._numpy_keys is not None and k in self._numpy_keys:
                 self._data_buf[k] = np.zeros((buffer_size,) + v_shape, dtype=np.float32)
+            elif torch.is_floating_point(v):
+                width = int(np.prod(v_shape))
+                self._packed_keys.append(k)
+                self._packed_cols[k] = (packed_width, packed_width + width)
+                self._packed_shapes[k] = v_shape
+                packed_width += width
             else:
-                self._data_buf[k] = torch.zeros((buffer_size,) + v_shape, device=self._device)
+                self._data_buf[k] = torch.zeros((buffer_size,) + v_shape, device=self._storage_device, dtype=v.dtype)
+
+        if len(self._packed_keys) > 0:
+            self._packed_buf = self._build_packed_buf(packed_width)
+            for k in self._packed_keys:
+                col_start, col_end = self._packed_cols[k]
+                self._data_buf[k] = self._packed_buf[:, col_start:col_end].view((buffer_size,) + self._packed_shapes[k])
 
         return
+
+    def _build_packed_buf(self, width):
+        buffer_size = self.get_buffer_size()
+        if self._storage == 'device':
+            packed_buf = torch.zeros((buffer_size, width), device=self._device)
+        elif self._storage == 'pinned':
+            packed_buf = torch.zeros((buffer_size, width), pin_memory=self._use_cuda_copy)
+        elif self._storage == 'mmap':
+            if self._mmap_path is None:
+                fd, self._mmap_temp_path = tempfile.mkstemp(prefix='replay_buffer_', suffix='.dat')
+                os.close(fd)
+                mmap_path = self._mmap_temp_path
+            else:
+                mmap_path = self._mmap_path
+                mmap_dir = os.path.dirname(mmap_path)
+                if mmap_dir != '':
+                    os.makedirs(mmap_dir, exist_ok=True)
+            mmap_buf = np.memmap(mmap_path, dtype=np.float32, mode='w+', shape=(buffer_size, width))
+            packed_buf = torch.from_numpy(mmap_buf)
+        return packed_buf
@@ -0,0 +1,119 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# Packing of the optional full-resume state (replay buffers, rng states, per-env latents, ...). Large tensors
+# and numpy arrays are split into chunks that are zlib compressed in parallel, compression releases the GIL.
+# Numpy arrays are always packed and chunks are stored as uint8 tensors, so the packed state only contains
+# tensors and python primitives and loads with torch.load(weights_only=True).
+
+from concurrent.futures import ThreadPoolExecutor
+import zlib
+
+import numpy as np
+import torch
+
+PACKED_TENSOR_KEY = '__packed_tensor__'
+
+_MIN_PACK_BYTES = 1 << 16
+_CHUNK_BYTES = 1 << 24
+
+
+def pack_state(state, compress_level=1, num_workers=4):
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        packed = _map_state(state, lambda x: _pack_array(x, executor, compress_level))
+    return packed
+
+
+def unpack_state(packed, num_workers=4):
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        state = _unpack(packed, executor)
+    return state
+
+
+def _map_state(x, pack_fn):
+    if isinstance(x, (torch.Tensor, np.ndarray)):
+        return pack_fn(x)
+    elif isinstance(x, dict):
+        return type(x)((k, _map_state(v, pack_fn)) for k, v in x.items())
+    elif isinstance(x, (list, tuple)):
+        return type(x)(_map_state(v, pack_fn) for v in x)
+    return x
+
+
+def _pack_array(x, executor, compress_level):
+    # the bytes are taken through numpy, so numpy dtypes without a torch equivalent (e.g. the uint32 keys of
+    # np.random.get_state()) are packed as they are and torch.frombuffer (torch >= 1.10) is not needed
+    is_numpy = isinstance(x, np.ndarray)
+    if is_numpy:
+        a = np.ascontiguousarray(x)
+        dtype = a.dtype.name
+    else:
+        t = x.detach().cpu()
+        if t.numel() * t.element_size() < _MIN_PACK_BYTES:
+            return t.clone()
+
+        dtype = str(t.dtype).replace('torch.', '')
+        if t.dtype == torch.bfloat16:
+            # numpy has no bfloat16, its bits are packed as int16
+            t = t.view(torch.int16)
+        a = t.contiguous().numpy()
+
+    raw = a.reshape(-1).view(np.uint8)
+    chunks = [raw[i:i + _CHUNK_BYTES] for i in range(0, raw.shape[0], _CHUNK_BYTES)]
+    compressed = executor.map(lambda c: zlib.compress(c, compress_level), chunks)
+    packed = {
+        PACKED_TENSOR_KEY: True,
+        'dtype': dtype,
+        'shape': list(a.shape),
+        'numpy': is_numpy,
+        'chunks': [torch.from_numpy(np.frombuffer(bytearray(c), dtype=np.uint8)) for c in compressed],
+    }
+    return packed
+
+
+def _unpack(x, executor):
+    if isinstance(x, dict):
+        if x.get(PACKED_TENSOR_KEY, False):
+            return _unpack_array(x, executor)
+        return type(x)((k, _unpack(v, executor)) for k, v in x.items())
+    elif isinstance(x, (list, tuple)):
+        return type(x)(_unpack(v, executor) for v in x)
+    return x
+
+
+def _unpack_array(packed, executor):
+    chunks = executor.map(lambda c: zlib.decompress(c.numpy().tobytes()), packed['chunks'])
+    raw = np.frombuffer(bytearray(b''.join(chunks)), dtype=np.uint8)
+    if packed['numpy']:
+        return raw.view(np.dtype(packed['dtype'])).reshape(packed['shape'])
+
+    dtype = getattr(torch, packed['dtype'])
+    if dtype == torch.bfloat16:
+        return torch.from_numpy(raw.view(np.int16)).view(torch.bfloat16).reshape(packed['shape'])
+    np_dtype = torch.empty(0, dtype=dtype).numpy().dtype
+    return torch.from_numpy(raw.view(np_dtype)).reshape(packed['shape'])
@@ -0,0 +1,92 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import torch
+
+import learning.rollout_postprocess as rollout_postprocess
+
+
+class RewardTerm:
+    def __init__(self, name, weight, compute_fn):
+        self.name = name
+        self.weight = float(weight)
+        self.compute_fn = compute_fn
+        return
+
+
+class RewardGraph:
+    # Declarative reward composition. A term is evaluated only if it contributes to the reward
+    # (non-zero weight) or is listed in logged, all other terms are never computed and compute()
+    # returns None for them. Each evaluation runs in a 'reward/<name>' profiler range so that the
+    # per-term cost shows up in torch.profiler traces.
+    def __init__(self, terms, logged=None):
+        self._terms = dict()
+        for term in terms:
+            assert(term.name not in self._terms), 'duplicate reward term {}'.format(term.name)
+            self._terms[term.name] = term
+
+        logged = set(logged) if logged is not None else set()
+        unknown = logged - set(self._terms.keys())
+        assert(len(unknown) == 0), 'unknown logged reward terms {}'.format(sorted(unknown))
+
+        self._active = dict()
+        for name, term in self._terms.items():
+            self._active[name] = (term.weight != 0.0) or (name in logged)
+        return
+
+    def is_active(self, name):
+        return self._active[name]
+
+    def get_weight(self, name):
+        return self._terms[name].weight
+
+    def get_active_terms(self):
+        return [name for name, active in self._active.items() if active]
+
+    def compute(self, name, *args, **kwargs):
+        if not self._active[name]:
+            return None
+
+        with torch.profiler.record_function('reward/' + name):
+            val = self._terms[name].compute_fn(*args, **kwargs)
+        return val
+
+    def combine(self, values):
+        # weighted sum over the terms in values, terms without weight or without a value are skipped
+        terms = []
+        weights = []
+        for name, val in values.items():
+            weight = self._terms[name].weight
+            if weight != 0.0 and val is not None:
+                terms.append(val)
+                weights.append(weight)
+
+        assert(len(terms) > 0), 'no weighted reward terms to combine'
+        with torch.profiler.record_function('reward/combine'):
+            rewards = rollout_postprocess.combine_rewards(terms, weights)
+        return rewards
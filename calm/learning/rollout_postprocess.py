@@ -0,0 +1,91 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# Rollout post-processing shared by all agents: reward mixing, GAE and returns, and flattening of
+# the [horizon, num_envs, ...] experience tensors into the dataset layout. GAE is evaluated as a
+# reverse scan with log2(horizon) doubling steps instead of a Python loop over the horizon.
+# The TorchScript versions are exported by name.
+
+import torch
+
+
+def _combine_rewards(terms, weights):
+    # type: (List[Tensor], List[float]) -> Tensor
+    rewards = weights[0] * terms[0]
+    for i in range(1, len(terms)):
+        rewards = rewards + weights[i] * terms[i]
+    return rewards
+
+
+def _reverse_linear_scan(x, a):
+    # type: (Tensor, Tensor) -> Tensor
+    # y[t] = x[t] + a[t] * y[t + 1] with y[horizon] = 0, scanned along the first dim
+    horizon = x.shape[0]
+    shift = 1
+    while shift < horizon:
+        x = torch.cat([x[:horizon - shift] + a[:horizon - shift] * x[shift:], x[horizon - shift:]], dim=0)
+        a = torch.cat([a[:horizon - shift] * a[shift:], a[horizon - shift:]], dim=0)
+        shift *= 2
+    return x
+
+
+def _discount_values(fdones, values, rewards, next_values, gamma, tau):
+    # type: (Tensor, Tensor, Tensor, Tensor, float, float) -> Tensor
+    not_dones = (1.0 - fdones).unsqueeze(-1)
+    deltas = rewards + gamma * next_values - values
+    return _reverse_linear_scan(deltas, gamma * tau * not_dones)
+
+
+def _compute_returns(fdones, values, rewards, next_values, gamma, tau):
+    # type: (Tensor, Tensor, Tensor, Tensor, float, float) -> Tuple[Tensor, Tensor]
+    advs = _discount_values(fdones, values, rewards, next_values, gamma, tau)
+    return advs, advs + values
+
+
+def _swap_and_flatten01(x):
+    # type: (Tensor) -> Tensor
+    return x.transpose(0, 1).reshape((x.shape[0] * x.shape[1],) + x.shape[2:])
+
+
+combine_rewards = torch.jit.script(_combine_rewards)
+reverse_linear_scan = torch.jit.script(_reverse_linear_scan)
+discount_values = torch.jit.script(_discount_values)
+compute_returns = torch.jit.script(_compute_returns)
+swap_and_flatten01 = torch.jit.script(_swap_and_flatten01)
+
+
+def flatten_rollout(tensor_dict, keys):
+    # [horizon, num_envs, ...] -> [num_envs * horizon, ...], same ordering as a2c_common.swap_and_flatten01
+    batch_dict = {}
+    for k in keys:
+        v = tensor_dict.get(k)
+        if isinstance(v, dict):
+            batch_dict[k] = {dk: swap_and_flatten01(dv) for dk, dv in v.items()}
+        elif v is not None:
+            batch_dict[k] = swap_and_flatten01(v)
+    return batch_dict
@@ -26,19 +26,14 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-import copy
-from gym import spaces
 import numpy as np
 import os
 import torch 
 import yaml
 import threading
-from rl_games.algos_torch import players
 
 import learning.common_player as common_player
-import learning.calm_players as calm_players
-import learning.calm_models as calm_models
-import learning.calm_network_builder as calm_network_builder
+import learning.llc_inference as llc_inference
 from utils import anyskill
 
 skill_command = "put up your hand"
@@ -54,6 +49,7 @@ class SceneAnyskillPlayer(common_player.CommonPlayer):
         self._task_size = self.env.task.get_task_obs_size()
         
         self._llc_steps = config['llc_steps']
+        self._llc_step_mode = config.get('llc_step_mode', 'eager')
         llc_checkpoint = config['llc_checkpoint']
         assert(llc_checkpoint != "")
         self._build_llc(llc_config_params, llc_checkpoint)
@@ -250,38 +246,20 @@ class SceneAnyskillPlayer(common_player.CommonPlayer):
             return torch.from_numpy(obs).to(self.device), torch.from_numpy(rewards), torch.from_numpy(dones), infos
     
     def _build_llc(self, config_params, checkpoint_file):
-        network_params = config_params['network']
-
-        network_builder = calm_network_builder.CALMBuilder()
-
-        network_builder.load(network_params)
-
-        network = calm_models.ModelCALMContinuous(network_builder)
-
-        llc_agent_config = self._build_llc_agent_config(config_params, network)
-
-        self._llc_agent = calm_players.CALMPlayer(llc_agent_config)
+        obs_size = self.env_info['observation_space'].shape[0] - self._task_size
+        amp_obs_size = self.env.amp_observation_space.shape[0]
+        num_amp_obs_steps = self.env.task._num_amp_obs_steps
 
+        self._llc_agent = llc_inference.LLCInference(config_params, obs_size, self.env_info['action_space'],
+                                                     amp_obs_size, num_amp_obs_steps, self.device,
+                                                     step_mode=self._llc_step_mode)
         self._llc_agent.restore(checkpoint_file)
         print("Loaded LLC checkpoint from {:s}".format(checkpoint_file))
-        return
-
-    def _build_llc_agent_config(self, config_params, network):
-        llc_env_info = copy.deepcopy(self.env_info)
-        obs_space = llc_env_info['observation_space']
-        obs_size = obs_space.shape[0]
-        obs_size -= self._task_size
-        llc_env_info['observation_space'] = spaces.Box(obs_space.low[:obs_size], obs_space.high[:obs_size])
-        llc_env_info['amp_observation_space'] = self.env.amp_observation_space.shape
-        llc_env_info['num_envs'] = self.env.task.num_envs
-        llc_env_info['num_amp_obs_steps'] = self.env.task._num_amp_obs_steps
-
-        config = config_params['config']
-        config['network'] = network
-        config['env_info'] = llc_env_info
-        config['env'] = self.env
 
-        return config
+        # episode length used by the CALM player when it interpolates latents
+        if config_params['config'].get('interpolate_latents', True):
+            self.env.task.max_episode_length = 500
+        return
 
     def _setup_action_space(self):
         super()._setup_action_space()
@@ -290,11 +268,7 @@ class SceneAnyskillPlayer(common_player.CommonPlayer):
 
     def _compute_llc_action(self, obs, actions):
         llc_obs = self._extract_llc_obs(obs)
-        processed_obs = self._llc_agent._preproc_obs(llc_obs)
-
-        z = torch.nn.functional.normalize(actions, dim=-1)
-        mu, _ = self._llc_agent.model.a2c_network.eval_actor(processed_obs, z)
-        llc_action = players.rescale_actions(self.actions_low, self.actions_high, torch.clamp(mu, -1.0, 1.0))
+        llc_action = self._llc_agent.compute_action(llc_obs, actions)
 
         return llc_action
 
@@ -304,7 +278,7 @@ class SceneAnyskillPlayer(common_player.CommonPlayer):
         return llc_obs
     
     def _calc_disc_reward(self, amp_obs):
-        disc_reward = self._llc_agent._calc_disc_rewards(amp_obs)
+        disc_reward = self._llc_agent.calc_disc_rewards(amp_obs)
         return disc_reward
 
     def get_skill_command(self):
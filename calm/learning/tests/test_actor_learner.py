@@ -0,0 +1,192 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import gym
+import numpy as np
+import pytest
+import torch
+
+common_agent = pytest.importorskip('learning.common_agent')
+
+from rl_games.algos_torch import models
+from rl_games.common import env_configurations
+from rl_games.common import vecenv
+from rl_games.common.algo_observer import DefaultAlgoObserver
+from rl_games.common.tr_helpers import DefaultRewardsShaper
+
+from benchmarks.actor_learner import StandInVecEnv
+
+OBS_SIZE = 8
+NUM_ACTIONS = 2
+NUM_ENVS = 8
+MAX_EPOCHS = 4
+
+
+class StandInEnv(vecenv.IVecEnv):
+    # rl_games vec env interface around the benchmark's stand-in env, done envs are reset by the env itself
+    def __init__(self, num_envs):
+        self._env = StandInVecEnv(num_envs, OBS_SIZE, NUM_ACTIONS, sim_iters=1, seed=0)
+        return
+
+    def step(self, actions):
+        obs, rewards, dones = self._env.step(actions)
+        return obs, rewards[:, 0], dones, {'terminate': dones}
+
+    def reset(self, env_ids=None):
+        return self._env.reset()
+
+    def get_env_info(self):
+        info = {
+            'action_space': gym.spaces.Box(-np.ones(NUM_ACTIONS), np.ones(NUM_ACTIONS)),
+            'observation_space': gym.spaces.Box(-np.inf * np.ones(OBS_SIZE), np.inf * np.ones(OBS_SIZE))
+        }
+        return info
+
+    def set_env_state(self, env_state):
+        return
+
+
+class StandInNetwork(torch.nn.Module):
+    def __init__(self, input_shape, actions_num, **kwargs):
+        super().__init__()
+        self.mlp = torch.nn.Sequential(torch.nn.Linear(input_shape[0], 32), torch.nn.ELU())
+        self.mu = torch.nn.Linear(32, actions_num)
+        self.value = torch.nn.Linear(32, 1)
+        self.logstd = torch.nn.Parameter(torch.full((actions_num,), -1.0))
+        return
+
+    def is_rnn(self):
+        return False
+
+    def forward(self, input_dict):
+        x = self.mlp(input_dict['obs'])
+        return self.mu(x), self.logstd.expand(x.shape[0], -1), self.value(x), None
+
+    def eval_critic(self, obs):
+        return self.value(self.mlp(obs))
+
+
+class StandInNetworkBuilder:
+    def build(self, name, **kwargs):
+        return StandInNetwork(**kwargs)
+
+
+class StandInAgent(common_agent.CommonAgent):
+    # records the policy lag of the consumed rollouts and the ids of all rollouts the learner received
+    def __init__(self, base_name, config):
+        super().__init__(base_name, config)
+        self.policy_lags = []
+        self.received_rollouts = []
+        self._num_rollouts = 0
+        return
+
+    def play_rollout(self):
+        batch_dict, info = super().play_rollout()
+        info['rollout_id'] = self._num_rollouts
+        self._num_rollouts += 1
+        return batch_dict, info
+
+    def _start_actor_learner(self):
+        super()._start_actor_learner()
+        get_msg = self._actor_learner._get_msg
+
+        def record_msg():
+            msg = get_msg()
+            if msg[0] == 'rollout':
+                self.received_rollouts.append((msg[1], msg[4]['rollout_id']))
+            return msg
+
+        self._actor_learner._get_msg = record_msg
+        return
+
+    def _record_train_batch_info(self, batch_dict, train_info):
+        self.policy_lags.append(train_info['policy_lag'])
+        return
+
+
+def register_stand_in_env(actor_id=0):
+    vecenv.register('STAND_IN', lambda config_name, num_actors, **kwargs: StandInEnv(num_actors))
+    env_configurations.register('stand_in', {'vecenv_type': 'STAND_IN', 'env_creator': lambda **kwargs: None})
+    return
+
+
+def build_config(train_dir, max_policy_lag):
+    config = {
+        'name': 'stand_in',
+        'env_name': 'stand_in',
+        'num_actors': NUM_ENVS,
+        'device': 'cpu',
+        'features': {'observer': DefaultAlgoObserver()},
+        'network': models.ModelA2CContinuousLogStd(StandInNetworkBuilder()),
+        'reward_shaper': DefaultRewardsShaper(),
+        'train_dir': train_dir,
+        'ppo': True,
+        'lr_schedule': 'constant',
+        'learning_rate': 1e-4,
+        'max_epochs': MAX_EPOCHS,
+        'horizon_length': 8,
+        'minibatch_size': 32,
+        'mini_epochs': 1,
+        'e_clip': 0.2,
+        'clip_value': False,
+        'critic_coef': 1.0,
+        'entropy_coef': 0.0,
+        'bounds_loss_coef': 0.0,
+        'grad_norm': 1.0,
+        'gamma': 0.99,
+        'tau': 0.95,
+        'normalize_advantage': True,
+        'normalize_input': False,
+        'normalize_value': False,
+        'async_metrics': False,
+        'actor_learner': {
+            'num_actors': 2,
+            'num_slots': 2,
+            'max_policy_lag': max_policy_lag
+        },
+        'actor_init_fn': register_stand_in_env
+    }
+    return config
+
+
+@pytest.mark.parametrize('max_policy_lag', [0, 1])
+def test_actor_learner_training(tmp_path, max_policy_lag):
+    register_stand_in_env()
+    agent = StandInAgent('stand_in', build_config(str(tmp_path), max_policy_lag))
+    agent.train()
+
+    num_epochs = MAX_EPOCHS + 1
+    assert len(agent.policy_lags) == num_epochs
+    assert all(0 <= lag <= max_policy_lag for lag in agent.policy_lags)
+
+    # every actor's rollouts reach the learner in order and each one is either trained on or dropped
+    for actor_id in range(2):
+        rollout_ids = [i for a, i in agent.received_rollouts if a == actor_id]
+        assert rollout_ids == list(range(len(rollout_ids)))
+    assert agent._actor_learner.get_num_dropped() == len(agent.received_rollouts) - num_epochs
+    return
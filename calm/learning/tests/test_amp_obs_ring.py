@@ -0,0 +1,98 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pytest
+import torch
+
+import learning.amp_obs_ring as amp_obs_ring
+
+
+def step_windows(windows, reset_mask, g):
+    # the env history update of humanoid_amp: resets re-initialize the history, every step shifts
+    # the history by one frame and writes the new frame first
+    num_envs, num_steps, frame_size = windows.shape
+    reset_hist = torch.randn(num_envs, num_steps, frame_size, generator=g)
+    windows = torch.where(reset_mask.view(-1, 1, 1), reset_hist, windows)
+    new_frames = torch.randn(num_envs, 1, frame_size, generator=g)
+    return torch.cat([new_frames, windows[:, :-1]], dim=1)
+
+
+@pytest.mark.parametrize('num_steps', [1, 2, 10])
+def test_amp_obs_ring_matches_raw_windows(num_steps):
+    g = torch.Generator().manual_seed(num_steps)
+    num_envs = 6
+    frame_size = 3
+    horizon = 8
+    ring = amp_obs_ring.AMPObsRing(num_envs, num_steps, frame_size, horizon + num_steps, 'cpu')
+    env_ids = torch.arange(num_envs)
+
+    windows = torch.randn(num_envs, num_steps, frame_size, generator=g)
+    reset_env_ids = env_ids[:0]
+    raw_windows = []
+    raw_heads = []
+    for i in range(10 * horizon):
+        # several resets, including consecutive ones, while the ring wraps around
+        reset_mask = torch.zeros(num_envs, dtype=torch.bool)
+        reset_mask[reset_env_ids] = True
+        windows = step_windows(windows, reset_mask, g)
+
+        heads = ring.push(windows.view(num_envs, -1), reset_env_ids)
+        raw_windows.append(windows.view(num_envs, -1))
+        raw_heads.append(heads)
+
+        reset_env_ids = (torch.rand(num_envs, generator=g) < 0.3).nonzero(as_tuple=False).flatten()
+
+        # every window pushed during the last horizon steps can still be rebuilt
+        for curr_windows, curr_heads in zip(raw_windows[-horizon:], raw_heads[-horizon:]):
+            assert torch.equal(ring.get_windows(env_ids, curr_heads), curr_windows)
+
+    rand_env_ids = torch.randint(num_envs, (32,), generator=g)
+    rand_steps = torch.randint(len(raw_windows) - horizon, len(raw_windows), (32,), generator=g)
+    rand_heads = torch.stack(raw_heads)[rand_steps, rand_env_ids]
+    ref_windows = torch.stack(raw_windows)[rand_steps, rand_env_ids]
+    assert torch.equal(ring.get_windows(rand_env_ids, rand_heads), ref_windows)
+
+    state = ring.state_dict()
+    restored_ring = amp_obs_ring.AMPObsRing(num_envs, num_steps, frame_size, horizon + num_steps, 'cpu')
+    restored_ring.load_state_dict(state)
+    assert torch.equal(restored_ring.get_windows(rand_env_ids, rand_heads), ref_windows)
+    return
+
+
+def test_row_table_keeps_live_groups():
+    table = amp_obs_ring.RowTable((2,), 3, 'cpu', capacity=1)
+    ids = []
+    for i in range(8):
+        # groups of varying sizes, including empty ones, grow the table past its initial capacity
+        n = i % 4
+        ids.append(table.append(torch.arange(2 * n, dtype=torch.float32).view(n, 2) + 100 * i))
+
+    for i in range(5, 8):
+        n = i % 4
+        assert torch.equal(table.get(ids[i]), torch.arange(2 * n, dtype=torch.float32).view(n, 2) + 100 * i)
+    return
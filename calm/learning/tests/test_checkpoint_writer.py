@@ -0,0 +1,53 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+
+import pytest
+import torch
+
+import learning.checkpoint_writer as checkpoint_writer
+
+
+@pytest.mark.parametrize('async_write', [False, True])
+def test_checkpoint_writer_retention(tmp_path, async_write):
+    prefix = os.path.join(tmp_path, 'Humanoid')
+    writer = checkpoint_writer.CheckpointWriter(async_write=async_write, keep_last=2, keep_every=3,
+                                                resume_side_file=True)
+    for epoch in range(1, 8):
+        filenames = [prefix, prefix + '_' + str(epoch).zfill(8)]
+        writer.save(filenames, {'epoch': epoch}, retention_prefix=prefix, resume_state={'epoch': epoch})
+    writer.close()
+
+    kept = [e for e in range(1, 8) if os.path.exists(prefix + '_' + str(e).zfill(8) + '.pth')]
+    kept_side_files = [e for e in range(1, 8) if os.path.exists(checkpoint_writer.get_resume_file(prefix + '_' + str(e).zfill(8)))]
+    assert kept == [3, 6, 7]
+    assert kept_side_files == [3, 6, 7]
+    assert torch.load(prefix + '.pth')['epoch'] == 7
+    assert not any(name.endswith('.tmp') for name in os.listdir(tmp_path))
+    return
@@ -0,0 +1,53 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import torch
+
+import learning.latent_index as latent_index
+
+
+def test_latent_index_matches_brute_force():
+    g = torch.Generator().manual_seed(0)
+    latents = torch.nn.functional.normalize(torch.randn(100, 8, generator=g), dim=-1)
+    motion_ids = torch.randint(0, 5, (100,), generator=g)
+    index = latent_index.LatentIndex(latents, motion_ids, torch.rand(100, generator=g), torch.ones(5), chunk_size=16)
+
+    z = torch.randn(10, 8, generator=g)
+    sim = torch.matmul(torch.nn.functional.normalize(z, dim=-1), latents.t())
+
+    best_sim, best_idx = index.max_cosine(z)
+    ref_sim, ref_idx = torch.max(sim, dim=-1)
+    assert torch.allclose(best_sim, ref_sim, atol=1e-6)
+    assert torch.equal(best_idx, ref_idx)
+
+    for k in [1, 5, 40, 200]:
+        topk_sim, topk_idx = index.topk(z, k)
+        ref_sim, ref_idx = torch.topk(sim, min(k, 100), dim=-1)
+        assert torch.allclose(topk_sim, ref_sim, atol=1e-6)
+        assert torch.equal(topk_idx, ref_idx)
+    return
@@ -0,0 +1,73 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import tempfile
+
+import pytest
+import torch
+
+import learning.replay_buffer as replay_buffer
+
+
+def test_replay_buffer_close_removes_temp_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    buffer = replay_buffer.ReplayBuffer(16, 'cpu', storage='mmap', prefetch=True)
+    buffer.store({'amp_obs': torch.randn(7, 3, 2)})
+    buffer.sample(5)
+    buffer.sample(5)
+    assert len(os.listdir(tmp_path)) == 1
+
+    buffer.close()
+    assert len(os.listdir(tmp_path)) == 0
+    return
+
+
+def build_replay_buffer(storage, mmap_path):
+    return replay_buffer.ReplayBuffer(16, 'cpu', storage=storage, mmap_path=mmap_path)
+
+
+@pytest.mark.parametrize('storage', ['device', 'pinned', 'mmap'])
+def test_replay_buffer_state_round_trip(tmp_path, storage):
+    buffer = build_replay_buffer(storage, os.path.join(tmp_path, 'src.dat'))
+    for i in range(3):
+        # 3 * 7 entries wrap around the 16 entry buffer
+        buffer.store({'amp_obs': torch.randn(7, 3, 2), 'ids': torch.arange(7) + 7 * i})
+    buffer.sample(5)
+
+    restored = build_replay_buffer(storage, os.path.join(tmp_path, 'dst.dat'))
+    restored.load_state_dict(buffer.state_dict())
+
+    # the saved sampling permutation covers the next two minibatches, later ones are reshuffled from the global rng
+    assert restored.get_total_count() == buffer.get_total_count()
+    for _ in range(2):
+        samples = buffer.sample(5)
+        restored_samples = restored.sample(5)
+        for k in ['amp_obs', 'ids']:
+            assert torch.equal(samples[k], restored_samples[k])
+    return
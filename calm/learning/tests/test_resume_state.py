@@ -0,0 +1,66 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+
+import numpy as np
+import torch
+
+import learning.resume_state as resume_state
+
+
+def test_resume_state_round_trip(tmp_path):
+    np.random.seed(0)
+    state = {
+        'numpy_rng': np.random.get_state(),
+        'bf16': torch.randn(65536).to(torch.bfloat16),
+        'small_bf16': torch.randn(4).to(torch.bfloat16),
+        'empty': torch.zeros((0, 3)),
+        'empty_numpy': np.zeros((0, 2), dtype=np.float32),
+        'uint16_numpy': np.arange(5, dtype=np.uint16).reshape(5, 1),
+        'chunked': torch.randn(5 << 20),
+        'nested': [1, 'a', (torch.arange(3), None)]
+    }
+
+    packed = resume_state.pack_state(state, num_workers=2)
+    torch.save(packed, os.path.join(tmp_path, 'state.pth'))
+    packed = torch.load(os.path.join(tmp_path, 'state.pth'), weights_only=True)
+    unpacked = resume_state.unpack_state(packed)
+
+    expected = np.random.rand(8)
+    np.random.set_state(unpacked['numpy_rng'])
+    assert np.array_equal(np.random.rand(8), expected)
+
+    for k in ['bf16', 'small_bf16', 'empty', 'chunked']:
+        assert unpacked[k].dtype == state[k].dtype
+        assert torch.equal(unpacked[k], state[k])
+    assert unpacked['empty_numpy'].shape == (0, 2) and unpacked['empty_numpy'].dtype == np.float32
+    assert unpacked['uint16_numpy'].dtype == np.uint16 and np.array_equal(unpacked['uint16_numpy'], state['uint16_numpy'])
+    assert unpacked['nested'][:2] == [1, 'a']
+    assert torch.equal(unpacked['nested'][2][0], torch.arange(3)) and unpacked['nested'][2][1] is None
+    return
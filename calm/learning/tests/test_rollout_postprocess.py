@@ -0,0 +1,60 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pytest
+import torch
+
+import learning.rollout_postprocess as rollout_postprocess
+
+
+def discount_values_loop(fdones, values, rewards, next_values, gamma, tau):
+    # the per-step GAE loop of a2c_common
+    lastgaelam = 0
+    advs = torch.zeros_like(rewards)
+    for t in reversed(range(rewards.shape[0])):
+        not_done = 1.0 - fdones[t].unsqueeze(1)
+        delta = rewards[t] + gamma * next_values[t] - values[t]
+        lastgaelam = delta + gamma * tau * not_done * lastgaelam
+        advs[t] = lastgaelam
+    return advs
+
+
+@pytest.mark.parametrize('horizon', [1, 2, 3, 7, 16, 32])
+def test_compute_returns_matches_loop(horizon):
+    g = torch.Generator().manual_seed(horizon)
+    num_envs = 64
+    fdones = (torch.rand(horizon, num_envs, generator=g) < 0.2).float()
+    values = torch.randn(horizon, num_envs, 1, generator=g)
+    rewards = torch.randn(horizon, num_envs, 1, generator=g)
+    next_values = torch.randn(horizon, num_envs, 1, generator=g)
+
+    advs, returns = rollout_postprocess.compute_returns(fdones, values, rewards, next_values, 0.99, 0.95)
+    ref_advs = discount_values_loop(fdones, values, rewards, next_values, 0.99, 0.95)
+    assert torch.allclose(advs, ref_advs, atol=1e-5)
+    assert torch.allclose(returns, ref_advs + values, atol=1e-5)
+    return
@@ -264,6 +264,26 @@ def quat_angle_axis(x):
     return angle, axis
 
 
+@torch.jit.script
+def quat_slerp(q0, q1, t):
+    """
+    Spherical linear interpolation between two sets of rotations. The blend factor t needs to
+    be broadcastable to q0[..., :1]
+    """
+    cos_half_theta = torch.sum(q0 * q1, dim=-1, keepdim=True)
+    q1 = torch.where(cos_half_theta < 0, -q1, q1)
+    cos_half_theta = cos_half_theta.abs().clamp(max=1.0)
+
+    half_theta = torch.acos(cos_half_theta)
+    sin_half_theta = torch.sqrt(1.0 - cos_half_theta * cos_half_theta)
+    small = sin_half_theta < 1e-3
+    safe_sin = torch.where(small, torch.ones_like(sin_half_theta), sin_half_theta)
+
+    ratio_a = torch.where(small, 1.0 - t, torch.sin((1.0 - t) * half_theta) / safe_sin)
+    ratio_b = torch.where(small, t, torch.sin(t * half_theta) / safe_sin)
+    return quat_unit(ratio_a * q0 + ratio_b * q1)
+
+
 @torch.jit.script
 def quat_yaw_rotation(x, z_up: bool = True):
     """
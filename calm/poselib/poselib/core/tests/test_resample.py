@@ -0,0 +1,90 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import torch
+
+from ..rotation3d import quat_from_angle_axis, quat_mul, quat_slerp
+from ...skeleton.skeleton3d import SkeletonMotion, SkeletonState, SkeletonTree
+
+
+def build_motion(num_frames, fps):
+    skeleton_tree = SkeletonTree(
+        ["root", "child"],
+        torch.tensor([-1, 0], dtype=torch.int32),
+        torch.tensor([[0.0, 0.0, 0.0], [0.0, 0.0, 1.0]]),
+    )
+    angles = torch.linspace(0.0, 1.5, num_frames)
+    z_axis = torch.tensor([0.0, 0.0, 1.0]).expand(num_frames, 3)
+    rotation = quat_from_angle_axis(angles, z_axis)
+    local_rotation = torch.stack([rotation, rotation], dim=1)
+    root_translation = torch.stack(
+        [angles, torch.zeros(num_frames), torch.ones(num_frames)], dim=-1
+    )
+    state = SkeletonState.from_rotation_and_root_translation(
+        skeleton_tree, r=local_rotation, t=root_translation, is_local=True
+    )
+    return SkeletonMotion.from_skeleton_state(state, fps=fps)
+
+
+def test_quat_slerp():
+    z_axis = torch.tensor([[0.0, 0.0, 1.0]])
+    q0 = quat_from_angle_axis(torch.tensor([0.2]), z_axis)
+    q1 = quat_from_angle_axis(torch.tensor([1.4]), z_axis)
+
+    assert torch.allclose(quat_slerp(q0, q1, torch.zeros(1, 1)), q0, atol=1e-6)
+    assert torch.allclose(quat_slerp(q0, q1, torch.ones(1, 1)), q1, atol=1e-6)
+    half = quat_from_angle_axis(torch.tensor([0.8]), z_axis)
+    assert torch.allclose(quat_slerp(q0, q1, torch.full((1, 1), 0.5)), half, atol=1e-6)
+
+    # the shorter arc is taken for quaternions in opposite hemispheres
+    assert torch.allclose(quat_slerp(q0, -q1, torch.full((1, 1), 0.5)), half, atol=1e-6)
+    # nearly identical rotations fall back to a normalized lerp
+    q2 = quat_mul(q0, quat_from_angle_axis(torch.tensor([1e-5]), z_axis))
+    assert torch.allclose(quat_slerp(q0, q2, torch.full((1, 1), 0.5)), q0, atol=1e-5)
+
+
+def test_skeleton_motion_resample():
+    motion = build_motion(31, 30)
+    new_motion = motion.resample(60)
+
+    # the 1 second clip keeps its duration, with both endpoints kept
+    assert new_motion.fps == 60
+    assert new_motion.to_dict()["fps"] == 60
+    assert len(new_motion) == 61
+    assert torch.allclose(new_motion.local_rotation[0], motion.local_rotation[0], atol=1e-6)
+    assert torch.allclose(new_motion.local_rotation[-1], motion.local_rotation[-1], atol=1e-6)
+    assert torch.allclose(new_motion.root_translation[-1], motion.root_translation[-1], atol=1e-6)
+    # every other frame lands on an input frame
+    assert torch.allclose(new_motion.root_translation[::2], motion.root_translation, atol=1e-6)
+
+    # a batch of clips with different lengths, the 0.3 second clip ends on its last input frame
+    short_motion = build_motion(10, 30)
+    new_motions = SkeletonMotion.resample_motions([motion, short_motion], 20)
+    assert [len(m) for m in new_motions] == [21, 7]
+    assert all(m.fps == 20 for m in new_motions)
+    assert torch.allclose(new_motions[1].root_translation[-1], short_motion.root_translation[-1], atol=1e-6)
@@ -1305,9 +1305,93 @@ class SkeletonMotion(SkeletonState):
             r=self.local_rotation[start:end:skip_every],
             is_local=True
           ),
-          fps=self.fps
+          fps=new_fps
         )
 
+    def resample(self, fps: float, device: Optional[str] = None):
+        """
+        Resample the motion along its last axis to an arbitrary frame rate. See
+        :meth:`resample_motions`.
+
+        :param fps: number of frames per second in the output
+        :type fps: float
+        :rtype: SkeletonMotion
+        """
+        return SkeletonMotion.resample_motions([self], fps, device)[0]
+
+    @staticmethod
+    def _resample_frame_blend(num_frames: int, old_fps: float, new_fps: float):
+        duration = (num_frames - 1) / old_fps
+        new_num_frames = int(np.floor(duration * new_fps + 1e-6)) + 1
+        phase = torch.arange(new_num_frames, dtype=torch.float64) * (old_fps / new_fps)
+        frame_idx0 = phase.floor().long().clamp(max=num_frames - 1)
+        frame_idx1 = (frame_idx0 + 1).clamp(max=num_frames - 1)
+        blend = (phase - frame_idx0).clamp(0.0, 1.0).float()
+        return frame_idx0, frame_idx1, blend
+
+    @staticmethod
+    def resample_motions(motions: List["SkeletonMotion"], fps: float, device: Optional[str] = None):
+        """
+        Resample a batch of motions to an arbitrary frame rate. The frames of all the motions are
+        concatenated so that the local rotations are interpolated with a single slerp and the root
+        translations with a single lerp, on the given device. Velocities are re-estimated on the
+        skeleton tree's device afterwards. The motions need to share the same number of joints.
+
+        :param motions: the motions to resample (each with one leading frame dimension)
+        :type motions: List[SkeletonMotion]
+        :param fps: number of frames per second in the output
+        :type fps: float
+        :param device: device used for the interpolation (defaults to the motions' device)
+        :type device: string, optional
+        :rtype: List[SkeletonMotion]
+        """
+        num_joints = motions[0].num_joints
+        assert all(
+            m.num_joints == num_joints for m in motions
+        ), "all the motions need to have the same number of joints"
+        if device is None:
+            device = motions[0].tensor.device
+
+        frame_idx0 = []
+        frame_idx1 = []
+        blends = []
+        new_lengths = []
+        frame_offset = 0
+        for m in motions:
+            f0, f1, blend = SkeletonMotion._resample_frame_blend(len(m), m.fps, fps)
+            frame_idx0.append(f0 + frame_offset)
+            frame_idx1.append(f1 + frame_offset)
+            blends.append(blend)
+            new_lengths.append(blend.shape[0])
+            frame_offset += len(m)
+
+        frame_idx0 = torch.cat(frame_idx0).to(device)
+        frame_idx1 = torch.cat(frame_idx1).to(device)
+        blend = torch.cat(blends).to(device)
+
+        local_rotation = torch.cat([m.local_rotation for m in motions], dim=0).to(device)
+        root_translation = torch.cat([m.root_translation for m in motions], dim=0).to(device)
+
+        new_rotation = quat_slerp(
+            local_rotation[frame_idx0],
+            local_rotation[frame_idx1],
+            blend[:, None, None],
+        )
+        new_translation = torch.lerp(
+            root_translation[frame_idx0], root_translation[frame_idx1], blend[:, None]
+        )
+
+        new_motions = []
+        new_rotation = torch.split(new_rotation, new_lengths, dim=0)
+        new_translation = torch.split(new_translation, new_lengths, dim=0)
+        for m, r, t in zip(motions, new_rotation, new_translation):
+            tree_device = m.skeleton_tree.local_translation.device
+            new_state = SkeletonState.from_rotation_and_root_translation(
+                m.skeleton_tree, r=r.to(tree_device), t=t.to(tree_device), is_local=True
+            )
+            new_motions.append(SkeletonMotion.from_skeleton_state(new_state, fps=fps))
+        return new_motions
+
     def retarget_to(
         self,
         joint_mapping: Dict[str, str],
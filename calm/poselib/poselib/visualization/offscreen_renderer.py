@@ -0,0 +1,297 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Headless stick-figure renderer for skeleton motions. Joint positions are projected and rasterized
+with vectorized numpy for all frames of a clip at once, so no display or matplotlib artists are
+involved. Many clips can be rendered in parallel with a process pool.
+"""
+import os
+from multiprocessing import Pool
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..core import logger
+
+
+def get_camera_axes(azim: float, elev: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Image plane axes of an orthographic camera looking at the origin of a z-up world.
+
+    :param azim: azimuth of the camera in degrees around the z axis
+    :type azim: float
+    :param elev: elevation of the camera in degrees above the xy plane
+    :type elev: float
+    :rtype: (np.ndarray, np.ndarray), the right and up axes in world coordinates
+    """
+    a = np.deg2rad(azim)
+    e = np.deg2rad(elev)
+    right = np.array([-np.sin(a), np.cos(a), 0.0], dtype=np.float32)
+    up = np.array(
+        [-np.sin(e) * np.cos(a), -np.sin(e) * np.sin(a), np.cos(e)], dtype=np.float32
+    )
+    return right, up
+
+
+def project_joints(
+    positions: np.ndarray,
+    height: int,
+    width: int,
+    azim: float = 0.0,
+    elev: float = 15.0,
+    margin: float = 0.1,
+    follow_root: bool = True,
+) -> np.ndarray:
+    """
+    Project joint positions of a clip to pixel coordinates. The scale is shared by all frames so
+    that the figure keeps its size across the clip.
+
+    :param positions: global joint positions of shape [num_frames, num_joints, 3]
+    :type positions: np.ndarray
+    :param follow_root: keep the root centered horizontally in every frame
+    :type follow_root: bool, optional
+    :rtype: np.ndarray, pixel coordinates (x, y) of shape [num_frames, num_joints, 2]
+    """
+    positions = np.asarray(positions, dtype=np.float32)
+    if follow_root:
+        positions = positions.copy()
+        positions[..., :2] -= positions[..., :1, :2]
+
+    right, up = get_camera_axes(azim, elev)
+    uv = np.stack([positions @ right, positions @ up], axis=-1)
+
+    uv_min = uv.reshape(-1, 2).min(axis=0)
+    uv_max = uv.reshape(-1, 2).max(axis=0)
+    center = 0.5 * (uv_min + uv_max)
+    extent = max(float((uv_max - uv_min).max()), 1e-6)
+    scale = (1.0 - 2.0 * margin) * min(height, width) / extent
+
+    pixels = np.empty_like(uv)
+    pixels[..., 0] = 0.5 * width + (uv[..., 0] - center[0]) * scale
+    pixels[..., 1] = 0.5 * height - (uv[..., 1] - center[1]) * scale
+    return pixels
+
+
+def _disk_offsets(radius: int) -> np.ndarray:
+    r = np.arange(-radius, radius + 1)
+    dy, dx = np.meshgrid(r, r, indexing="ij")
+    mask = dx * dx + dy * dy <= radius * radius
+    return np.stack([dx[mask], dy[mask]], axis=-1)
+
+
+def _splat(frames, frame_ids, points, offsets, color):
+    # frame_ids: [N], points: [N, 2] float pixel coordinates
+    height, width = frames.shape[1:3]
+    pts = np.rint(points).astype(np.int64)
+    xs = (pts[:, None, 0] + offsets[None, :, 0]).reshape(-1)
+    ys = (pts[:, None, 1] + offsets[None, :, 1]).reshape(-1)
+    fs = np.repeat(frame_ids, offsets.shape[0])
+    valid = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    frames[fs[valid], ys[valid], xs[valid]] = color
+    return
+
+
+def rasterize_stick_figures(
+    pixels: np.ndarray,
+    parent_indices: np.ndarray,
+    height: int,
+    width: int,
+    bone_color: Sequence[int] = (60, 90, 200),
+    joint_color: Sequence[int] = (220, 50, 50),
+    background: Sequence[int] = (255, 255, 255),
+    line_width: int = 2,
+    joint_radius: int = 3,
+    frame_chunk: int = 256,
+) -> np.ndarray:
+    """
+    Draw a stick figure for every frame into RGB frame buffers. Bones of all frames are sampled
+    and written with a single scatter per chunk of frames.
+
+    :param pixels: pixel coordinates of shape [num_frames, num_joints, 2]
+    :type pixels: np.ndarray
+    :param parent_indices: parent index of each joint, -1 for the root
+    :type parent_indices: np.ndarray
+    :rtype: np.ndarray, frames of shape [num_frames, height, width, 3] in uint8
+    """
+    num_frames = pixels.shape[0]
+    parent_indices = np.asarray(parent_indices)
+    children = np.nonzero(parent_indices >= 0)[0]
+    parents = parent_indices[children]
+
+    frames = np.empty((num_frames, height, width, 3), dtype=np.uint8)
+    frames[:] = np.asarray(background, dtype=np.uint8)
+
+    bone_offsets = _disk_offsets(max(line_width // 2, 0))
+    joint_offsets = _disk_offsets(joint_radius)
+
+    for start in range(0, num_frames, frame_chunk):
+        end = min(start + frame_chunk, num_frames)
+        chunk = pixels[start:end]
+        chunk_ids = np.arange(start, end)
+
+        if len(children) > 0:
+            p0 = chunk[:, parents]
+            p1 = chunk[:, children]
+            seg_len = np.linalg.norm(p1 - p0, axis=-1)
+            num_samples = int(np.ceil(seg_len.max())) + 1 if seg_len.size > 0 else 1
+            num_samples = min(num_samples, 2 * (height + width))
+            t = np.linspace(0.0, 1.0, num_samples, dtype=np.float32)
+            samples = p0[..., None, :] + (p1 - p0)[..., None, :] * t[:, None]
+            sample_ids = np.broadcast_to(
+                chunk_ids[:, None, None], samples.shape[:-1]
+            ).reshape(-1)
+            _splat(frames, sample_ids, samples.reshape(-1, 2), bone_offsets, bone_color)
+
+        joint_ids = np.broadcast_to(chunk_ids[:, None], chunk.shape[:-1]).reshape(-1)
+        _splat(frames, joint_ids, chunk.reshape(-1, 2), joint_offsets, joint_color)
+
+    return frames
+
+
+def render_skeleton_motion(
+    skeleton_motion,
+    height: int = 256,
+    width: int = 256,
+    skip_n: int = 1,
+    azim: float = 0.0,
+    elev: float = 15.0,
+    follow_root: bool = True,
+    **kwargs,
+) -> np.ndarray:
+    """
+    Render a skeleton motion (or any skeleton state with one leading dimension) to frames.
+
+    :rtype: np.ndarray, frames of shape [num_frames, height, width, 3] in uint8
+    """
+    positions = skeleton_motion.global_translation[::skip_n].cpu().numpy()
+    parent_indices = skeleton_motion.skeleton_tree.parent_indices.cpu().numpy()
+    pixels = project_joints(
+        positions, height, width, azim=azim, elev=elev, follow_root=follow_root
+    )
+    return rasterize_stick_figures(pixels, parent_indices, height, width, **kwargs)
+
+
+def make_contact_sheet(frames: np.ndarray, num_tiles: int = 16, num_cols: int = 4) -> np.ndarray:
+    """
+    Tile evenly spaced frames of a clip into a single image.
+
+    :rtype: np.ndarray, image of shape [rows * height, num_cols * width, 3]
+    """
+    num_frames, height, width, channels = frames.shape
+    num_tiles = min(num_tiles, num_frames)
+    num_cols = min(num_cols, num_tiles)
+    num_rows = (num_tiles + num_cols - 1) // num_cols
+
+    tile_ids = np.linspace(0, num_frames - 1, num_tiles).round().astype(np.int64)
+    tiles = np.full(
+        (num_rows * num_cols, height, width, channels), 255, dtype=frames.dtype
+    )
+    tiles[:num_tiles] = frames[tile_ids]
+    sheet = tiles.reshape(num_rows, num_cols, height, width, channels)
+    sheet = sheet.transpose(0, 2, 1, 3, 4).reshape(
+        num_rows * height, num_cols * width, channels
+    )
+    return sheet
+
+
+def write_video(frames: np.ndarray, file_path: str, fps: float) -> None:
+    import cv2
+
+    height, width = frames.shape[1:3]
+    writer = cv2.VideoWriter(
+        file_path, cv2.VideoWriter_fourcc(*"mp4v"), float(fps), (width, height)
+    )
+    for frame in frames:
+        writer.write(frame[..., ::-1])
+    writer.release()
+    return
+
+
+def write_image(image: np.ndarray, file_path: str) -> None:
+    import matplotlib.image
+
+    matplotlib.image.imsave(file_path, image)
+    return
+
+
+def _render_file(args):
+    from ..skeleton.skeleton3d import SkeletonMotion
+
+    motion_file, output_file, mode, render_kwargs = args
+    motion = SkeletonMotion.from_file(motion_file)
+    skip_n = render_kwargs.get("skip_n", 1)
+    frames = render_skeleton_motion(motion, **render_kwargs)
+
+    if mode == "video":
+        write_video(frames, output_file, motion.fps / skip_n)
+    elif mode == "sheet":
+        write_image(make_contact_sheet(frames), output_file)
+    else:
+        assert False, "unsupported render mode: {}".format(mode)
+    return output_file
+
+
+def render_motion_files(
+    motion_files: List[str],
+    output_dir: str,
+    mode: str = "sheet",
+    num_workers: Optional[int] = None,
+    **render_kwargs,
+) -> List[str]:
+    """
+    Render a list of SkeletonMotion files headlessly, one output per clip. Clips are distributed
+    over a process pool so that loading, forward kinematics and encoding run in parallel.
+
+    :param mode: "video" for an mp4 per clip (requires OpenCV) or "sheet" for a png contact sheet
+    :type mode: string, optional
+    :param num_workers: number of processes (defaults to the number of cpus)
+    :type num_workers: int, optional
+    :rtype: List[str], paths of the written files
+    """
+    ext = {"video": ".mp4", "sheet": ".png"}[mode]
+    os.makedirs(output_dir, exist_ok=True)
+
+    jobs = []
+    for motion_file in motion_files:
+        name = os.path.splitext(os.path.basename(motion_file))[0]
+        output_file = os.path.join(output_dir, name + ext)
+        jobs.append((motion_file, output_file, mode, render_kwargs))
+
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    num_workers = max(min(num_workers, len(jobs)), 1)
+
+    logger.info("rendering {} clips with {} workers".format(len(jobs), num_workers))
+    if num_workers == 1:
+        output_files = [_render_file(job) for job in jobs]
+    else:
+        with Pool(num_workers) as pool:
+            output_files = pool.map(_render_file, jobs, chunksize=1)
+    return output_files
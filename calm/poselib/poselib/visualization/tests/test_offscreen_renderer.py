@@ -0,0 +1,60 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import numpy as np
+import torch
+
+from ..offscreen_renderer import make_contact_sheet, render_skeleton_motion
+from ...skeleton.skeleton3d import SkeletonMotion, SkeletonState, SkeletonTree
+
+
+def test_render_skeleton_motion():
+    skeleton_tree = SkeletonTree(
+        ["root", "spine", "head"],
+        torch.tensor([-1, 0, 1], dtype=torch.int32),
+        torch.tensor([[0.0, 0.0, 0.0], [0.0, 0.0, 0.5], [0.0, 0.0, 0.5]]),
+    )
+    num_frames = 9
+    local_rotation = torch.zeros(num_frames, 3, 4)
+    local_rotation[..., 3] = 1.0
+    root_translation = torch.zeros(num_frames, 3)
+    root_translation[:, 0] = torch.linspace(0.0, 1.0, num_frames)
+    root_translation[:, 2] = 1.0
+    state = SkeletonState.from_rotation_and_root_translation(
+        skeleton_tree, r=local_rotation, t=root_translation, is_local=True
+    )
+    motion = SkeletonMotion.from_skeleton_state(state, fps=30)
+
+    frames = render_skeleton_motion(motion, height=32, width=48, skip_n=2)
+    assert frames.shape == (5, 32, 48, 3)
+    assert frames.dtype == np.uint8
+    # every frame has the stick figure drawn over the white background
+    assert np.all(np.any(frames.reshape(5, -1) != 255, axis=-1))
+
+    sheet = make_contact_sheet(frames, num_tiles=4, num_cols=2)
+    assert sheet.shape == (64, 96, 3)
@@ -0,0 +1,89 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+import glob
+import os
+
+import yaml
+
+from poselib.visualization.offscreen_renderer import render_motion_files
+
+"""
+This script renders motion clips without a display, for reviewing a dataset at a glance.
+The input can be a single SkeletonMotion npy file, a directory of npy files or a motion yaml
+file in the same format as the ones consumed by MotionLib. Each clip is written to the output
+directory either as a png contact sheet or as an mp4 video (requires OpenCV).
+"""
+
+
+def collect_motion_files(motion_path):
+    if os.path.isdir(motion_path):
+        motion_files = sorted(glob.glob(os.path.join(motion_path, "*.npy")))
+    elif os.path.splitext(motion_path)[1] == ".yaml":
+        dir_name = os.path.dirname(motion_path)
+        with open(motion_path, "r") as f:
+            motion_config = yaml.load(f, Loader=yaml.SafeLoader)
+        motion_files = [
+            os.path.join(dir_name, m["file"]) for m in motion_config["motions"]
+        ]
+    else:
+        motion_files = [motion_path]
+    return motion_files
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--motion_path", type=str, required=True)
+    parser.add_argument("--output_dir", type=str, default="output/renders")
+    parser.add_argument("--mode", type=str, default="sheet", choices=["sheet", "video"])
+    parser.add_argument("--num_workers", type=int, default=None)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--skip_n", type=int, default=1)
+    parser.add_argument("--azim", type=float, default=0.0)
+    parser.add_argument("--elev", type=float, default=15.0)
+    args = parser.parse_args()
+
+    motion_files = collect_motion_files(args.motion_path)
+    output_files = render_motion_files(
+        motion_files,
+        args.output_dir,
+        mode=args.mode,
+        num_workers=args.num_workers,
+        height=args.size,
+        width=args.size,
+        skip_n=args.skip_n,
+        azim=args.azim,
+        elev=args.elev,
+    )
+    print("Rendered {} clips to {}".format(len(output_files), args.output_dir))
+
+    return
+
+if __name__ == '__main__':
+    main()
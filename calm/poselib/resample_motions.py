@@ -0,0 +1,74 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+import os
+
+from poselib.skeleton.skeleton3d import SkeletonMotion
+from render_motions import collect_motion_files
+
+"""
+This script resamples motion clips to a common frame rate, e.g. the simulation rate, so that
+clips recorded at mixed frame rates can be used together. The input can be a single SkeletonMotion
+npy file, a directory of npy files or a motion yaml file. Clips are resampled in batches of
+--batch_size, with the interpolation running on --device, and written to the output directory
+under their paths relative to the input directory or motion yaml, e.g. refined/clip.npy.
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--motion_path", type=str, required=True)
+    parser.add_argument("--output_dir", type=str, required=True)
+    parser.add_argument("--fps", type=float, required=True)
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--batch_size", type=int, default=64)
+    args = parser.parse_args()
+
+    motion_files = collect_motion_files(args.motion_path)
+    if os.path.isdir(args.motion_path):
+        motion_dir = args.motion_path
+    else:
+        motion_dir = os.path.dirname(args.motion_path)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for i in range(0, len(motion_files), args.batch_size):
+        batch_files = motion_files[i:i + args.batch_size]
+        motions = [SkeletonMotion.from_file(f) for f in batch_files]
+        new_motions = SkeletonMotion.resample_motions(motions, args.fps, args.device)
+
+        for f, m in zip(batch_files, new_motions):
+            output_file = os.path.join(args.output_dir, os.path.relpath(f, motion_dir))
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            m.to_file(output_file)
+        print("Resampled {}/{} clips".format(i + len(batch_files), len(motion_files)))
+
+    return
+
+if __name__ == '__main__':
+    main()
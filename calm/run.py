@@ -22,11 +22,14 @@ from learning import anyskill_agent
 from learning import spec_anyskill_agent
 from learning import spec_anyskill_players
 from learning import spec_anyskill_network_builder
+from learning import multi_spec_anyskill_agent
 from learning import scene_anyskill_players
 
 from env.tasks import humanoid_amp_task
 
+import copy
 import datetime
+import functools
 
 try:
     import wandb
@@ -185,6 +188,9 @@ def build_alg_runner(algo_observer):
     runner.model_builder.network_factory.register_builder('spec_anyskill', lambda **kwargs: spec_anyskill_network_builder.SpecAnyskillBuilder())
     runner.player_factory.register_builder('spec_anyskill', lambda **kwargs: spec_anyskill_players.SpecAnyskillPlayer(**kwargs))
 
+    runner.algo_factory.register_builder('multi_spec_anyskill', lambda **kwargs: multi_spec_anyskill_agent.MultiSpecAnyskillAgent(**kwargs))
+    runner.player_factory.register_builder('multi_spec_anyskill', lambda **kwargs: spec_anyskill_players.SpecAnyskillPlayer(**kwargs))
+
     runner.model_builder.model_factory.register_builder('scene_anyskill', lambda network, **kwargs: hrl_models.ModelHRLContinuous(network))
     runner.algo_factory.register_builder('scene_anyskill', lambda **kwargs: spec_anyskill_agent.SpecAnyskillAgent(**kwargs))
     runner.model_builder.network_factory.register_builder('scene_anyskill', lambda **kwargs: spec_anyskill_network_builder.SpecAnyskillBuilder())
@@ -198,19 +204,26 @@ def build_alg_runner(algo_observer):
     return runner
 
 
-def main():
+def init_actor_process(actor_args, actor_cfg, actor_cfg_train, actor_id):
+    # rollout actor processes are spawned without running main(), restore the globals create_rlgpu_env reads
     global args
     global cfg
     global cfg_train
-    global run_name
 
-    set_np_formatting()
-    args = get_args()
-    cfg, cfg_train, logdir = load_cfg(args)
+    args = actor_args
+    cfg = actor_cfg
+    cfg_train = actor_cfg_train
+
+    seed = cfg_train['params']['seed'] + actor_id + 1
+    cfg_train['params']['seed'] = set_seed(seed, cfg_train['params'].get("torch_deterministic", False))
+
+    if wandb is not None:
+        wandb.init(mode='disabled')
+    return
 
-    time_str = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    # run_name = f"{args.wandb_run_name}_{time_str}"
-    assert args.track and wandb or not args.track, "Tracking requires wandb to be installed."
+
+def prepare_cfg(args):
+    cfg, cfg_train, logdir = load_cfg(args)
 
     cfg_train['params']['seed'] = set_seed(cfg_train['params'].get("seed", -1), cfg_train['params'].get("torch_deterministic", False))
 
@@ -237,6 +250,23 @@ def main():
     cfg['env']['render'] = args.render
     cfg['env']['articulated'] = args.articulated
     cfg['env']['wandb_counter'] = args.wandb_counter
+    return cfg, cfg_train
+
+
+def main():
+    global args
+    global cfg
+    global cfg_train
+    global run_name
+
+    set_np_formatting()
+    args = get_args()
+
+    time_str = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    # run_name = f"{args.wandb_run_name}_{time_str}"
+    assert args.track and wandb or not args.track, "Tracking requires wandb to be installed."
+
+    cfg, cfg_train = prepare_cfg(args)
     run_name = f"{args.render}_{str(args.wandb_counter)}_{time_str}"
 
     if args.track:
@@ -249,6 +279,11 @@ def main():
             name=run_name,
         )
 
+    actor_learner_config = cfg_train['params']['config'].get('actor_learner', None) or {}
+    if actor_learner_config.get('num_actors', 0) > 0:
+        cfg_train['params']['config']['actor_init_fn'] = functools.partial(init_actor_process, args, cfg,
+                                                                                    copy.deepcopy(cfg_train))
+
     vargs = vars(args)
 
     algo_observer = RLGPUAlgoObserver()
@@ -39,7 +39,7 @@ if __name__ == "__main__":
     evaluator = anytest()
     test_dataset = ASDataset(args.test_motion_file, args.test_image_file)
     test_loader = DataLoader(test_dataset, batch_size=args.batch_size, drop_last=True, num_workers=args.num_workers,
-                              shuffle=True)
+                              shuffle=True, collate_fn=ASDataset.collate_batch)
     output = {}
     matching_score_sum = 0
     top_k_count = 0
@@ -85,6 +85,13 @@ def load_cfg(args):
     with open(os.path.join(os.getcwd(), args.cfg_env), 'r') as f:
         cfg = yaml.load(f, Loader=yaml.SafeLoader)
 
+    # Apply a config overlay, e.g. written by autotune.py, command line overrides still take precedence
+    if args.cfg_overlay != "":
+        with open(os.path.join(os.getcwd(), args.cfg_overlay), 'r') as f:
+            overlay = yaml.load(f, Loader=yaml.SafeLoader)
+        merge_cfg(cfg, overlay.get('cfg_env', {}))
+        merge_cfg(cfg_train, overlay.get('cfg_train', {}))
+
     # Override number of environments if passed on the command line
     if args.num_envs > 0:
         cfg["env"]["numEnvs"] = args.num_envs
@@ -159,6 +166,15 @@ def load_cfg(args):
     return cfg, cfg_train, logdir
 
 
+def merge_cfg(cfg, overlay):
+    for k, v in overlay.items():
+        if isinstance(v, dict) and isinstance(cfg.get(k, None), dict):
+            merge_cfg(cfg[k], v)
+        else:
+            cfg[k] = v
+    return cfg
+
+
 def parse_sim_params(args, cfg, cfg_train):
     # initialize sim
     sim_params = gymapi.SimParams()
@@ -221,6 +237,8 @@ def get_args(benchmark=False):
             "help": "Requires --experiment flag, adds physics engine, sim device, pipeline info and if domain randomization is used to the experiment name provided by user"},
         {"name": "--cfg_env", "type": str, "default": "Base", "help": "Environment configuration file (.yaml)"},
         {"name": "--cfg_train", "type": str, "default": "Base", "help": "Training configuration file (.yaml)"},
+        {"name": "--cfg_overlay", "type": str, "default": "",
+            "help": "Optional yaml with cfg_env and cfg_train entries merged over the configuration files"},
         {"name": "--motion_file", "type": str,
             "default": "", "help": "Specify reference motion file"},
         {"name": "--num_envs", "type": int, "default": 0,
@@ -34,7 +34,7 @@ from poselib.poselib.skeleton.skeleton3d import SkeletonMotion
 from poselib.poselib.core.rotation3d import *
 from isaacgym.torch_utils import *
 
-from utils import torch_utils
+from utils import quat_kernels
 from utils.device_dtype_mixin import DeviceDtypeModuleMixin
 from torch import nn
 from torch import Tensor
@@ -236,15 +236,15 @@ class MotionLib(DeviceDtypeModuleMixin):
     def get_motion(self, motion_id):
         return self.state.motions[motion_id]
 
-    def sample_motions(self, n):
+    def sample_motions(self, n, generator=None):
         motion_ids = torch.multinomial(
-            self.state.motion_weights, num_samples=n, replacement=True
+            self.state.motion_weights, num_samples=n, replacement=True, generator=generator
         )#sample n times in the current motion weights (replacement=True means motion_weights could be samples more than one times)
         # weights are hyper-parameters
         return motion_ids
 
-    def sample_time(self, motion_ids, truncate_time=None):
-        phase = torch.rand(motion_ids.shape, device=self._device)
+    def sample_time(self, motion_ids, truncate_time=None, generator=None):
+        phase = torch.rand(motion_ids.shape, device=self._device, generator=generator)
 
         motion_len = self.state.motion_lengths[motion_ids]
         if truncate_time is not None:
@@ -306,12 +306,12 @@ class MotionLib(DeviceDtypeModuleMixin):
 
         root_pos = (1.0 - blend) * root_pos0 + blend * root_pos1
 
-        root_rot = torch_utils.slerp(root_rot0, root_rot1, blend)
+        root_rot = quat_kernels.slerp(root_rot0, root_rot1, blend)
 
         blend_exp = blend.unsqueeze(-1)
         key_pos = (1.0 - blend_exp) * key_pos0 + blend_exp * key_pos1
 
-        local_rot = torch_utils.slerp(local_rot0, local_rot1, torch.unsqueeze(blend, axis=-1))
+        local_rot = quat_kernels.slerp(local_rot0, local_rot1, torch.unsqueeze(blend, axis=-1))
         dof_pos = self._local_rotation_to_dof(local_rot)
 
         return root_pos, root_rot, dof_pos, root_vel, root_ang_vel, dof_vel, key_pos
@@ -465,11 +465,11 @@ class MotionLib(DeviceDtypeModuleMixin):
 
             if (joint_size == 3):
                 joint_q = local_rot[:, body_id]
-                joint_exp_map = torch_utils.quat_to_exp_map(joint_q)
+                joint_exp_map = quat_kernels.quat_to_exp_map(joint_q)
                 dof_pos[:, joint_offset:(joint_offset + joint_size)] = joint_exp_map
             elif (joint_size == 1):
                 joint_q = local_rot[:, body_id]
-                joint_theta, joint_axis = torch_utils.quat_to_angle_axis(joint_q)
+                joint_theta, joint_axis = quat_kernels.quat_to_angle_axis(joint_q)
                 joint_theta = joint_theta * joint_axis[..., 1] # assume joint is always along y axis
 
                 joint_theta = normalize_angle(joint_theta)
@@ -0,0 +1,235 @@
+# Copyright (c) 2018-2022, NVIDIA Corporation
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# Quaternion kernels shared by the motion library and the observation builders. Quaternions are
+# in (x, y, z, w) order, same as isaacgym.torch_utils. All kernels are branch-free (no boolean
+# mask writes) and broadcast over leading dimensions, so e.g. a root rotation of shape [N, 1, 4]
+# can be applied directly to body positions of shape [N, K, 3] without a repeat.
+# The TorchScript versions are exported by name.
+
+import torch
+
+
+def _quat_mul(a, b):
+    # type: (Tensor, Tensor) -> Tensor
+    x1, y1, z1, w1 = a[..., 0], a[..., 1], a[..., 2], a[..., 3]
+    x2, y2, z2, w2 = b[..., 0], b[..., 1], b[..., 2], b[..., 3]
+
+    x = w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2
+    y = w1 * y2 + y1 * w2 + z1 * x2 - x1 * z2
+    z = w1 * z2 + z1 * w2 + x1 * y2 - y1 * x2
+    w = w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2
+    return torch.stack([x, y, z, w], dim=-1)
+
+
+def _quat_conjugate(q):
+    # type: (Tensor) -> Tensor
+    return torch.cat([-q[..., 0:3], q[..., 3:4]], dim=-1)
+
+
+def _quat_rotate(q, v):
+    # type: (Tensor, Tensor) -> Tensor
+    # v + 2w (q_xyz x v) + 2 q_xyz x (q_xyz x v)
+    qx, qy, qz, qw = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    vx, vy, vz = v[..., 0], v[..., 1], v[..., 2]
+
+    tx = 2.0 * (qy * vz - qz * vy)
+    ty = 2.0 * (qz * vx - qx * vz)
+    tz = 2.0 * (qx * vy - qy * vx)
+
+    x = vx + qw * tx + (qy * tz - qz * ty)
+    y = vy + qw * ty + (qz * tx - qx * tz)
+    z = vz + qw * tz + (qx * ty - qy * tx)
+    return torch.stack([x, y, z], dim=-1)
+
+
+def _quat_rotate_inverse(q, v):
+    # type: (Tensor, Tensor) -> Tensor
+    return _quat_rotate(_quat_conjugate(q), v)
+
+
+def _quat_from_angle_axis(angle, axis):
+    # type: (Tensor, Tensor) -> Tensor
+    # axis must be normalized
+    half_angle = 0.5 * angle.unsqueeze(-1)
+    return torch.cat([axis * torch.sin(half_angle), torch.cos(half_angle)], dim=-1)
+
+
+def _quat_unit(q):
+    # type: (Tensor) -> Tensor
+    return q / torch.norm(q, dim=-1, keepdim=True).clamp(min=1e-9)
+
+
+def _slerp(q0, q1, t):
+    # type: (Tensor, Tensor, Tensor) -> Tensor
+    # t must be broadcastable to q0[..., 0:1]
+    cos_half_theta = torch.sum(q0 * q1, dim=-1, keepdim=True)
+    sign = torch.where(cos_half_theta < 0, -torch.ones_like(cos_half_theta), torch.ones_like(cos_half_theta))
+    q1 = sign * q1
+    cos_half_theta = (sign * cos_half_theta).clamp(max=1.0)
+
+    half_theta = torch.acos(cos_half_theta)
+    sin_half_theta = torch.sqrt(1.0 - cos_half_theta * cos_half_theta)
+    small = sin_half_theta < 0.001
+    inv_sin = 1.0 / torch.where(small, torch.ones_like(sin_half_theta), sin_half_theta)
+
+    ratio_a = torch.where(small, 1.0 - t, torch.sin((1.0 - t) * half_theta) * inv_sin)
+    ratio_b = torch.where(small, t, torch.sin(t * half_theta) * inv_sin)
+    return ratio_a * q0 + ratio_b * q1
+
+
+def _nlerp(q0, q1, t):
+    # type: (Tensor, Tensor, Tensor) -> Tensor
+    # cheaper approximation of slerp, accurate for the small angles between adjacent frames
+    cos_half_theta = torch.sum(q0 * q1, dim=-1, keepdim=True)
+    sign = torch.where(cos_half_theta < 0, -torch.ones_like(cos_half_theta), torch.ones_like(cos_half_theta))
+    q = (1.0 - t) * q0 + (t * sign) * q1
+    return _quat_unit(q)
+
+
+def _quat_to_angle_axis(q):
+    # type: (Tensor) -> Tuple[Tensor, Tensor]
+    # q must be normalized, the returned angle is in [0, pi]
+    w = q[..., 3]
+    w_abs = torch.abs(w).clamp(max=1.0)
+    sin_theta = torch.sqrt(1.0 - w_abs * w_abs)
+    angle = 2.0 * torch.acos(w_abs)
+
+    small = sin_theta < 1e-5
+    inv_sin = 1.0 / torch.where(small, torch.ones_like(sin_theta), sin_theta)
+    inv_sin = torch.where(w < 0, -inv_sin, inv_sin)
+    default_axis = torch.zeros_like(q[..., 0:3])
+    default_axis[..., 2] = 1.0
+    axis = torch.where(small.unsqueeze(-1), default_axis, q[..., 0:3] * inv_sin.unsqueeze(-1))
+    angle = torch.where(small, torch.zeros_like(angle), angle)
+    return angle, axis
+
+
+def _quat_to_exp_map(q):
+    # type: (Tensor) -> Tensor
+    # q must be normalized
+    w = q[..., 3:4]
+    w_abs = torch.abs(w).clamp(max=1.0)
+    sin_theta = torch.sqrt(1.0 - w_abs * w_abs)
+    angle = 2.0 * torch.acos(w_abs)
+
+    # angle / sin_theta -> 2 as the angle goes to 0
+    small = sin_theta < 1e-5
+    scale = angle / torch.where(small, torch.ones_like(sin_theta), sin_theta)
+    scale = torch.where(small, 2.0 * torch.ones_like(scale), scale)
+    scale = torch.where(w < 0, -scale, scale)
+    return q[..., 0:3] * scale
+
+
+def _exp_map_to_quat(exp_map):
+    # type: (Tensor) -> Tensor
+    angle = torch.norm(exp_map, dim=-1, keepdim=True)
+    half_angle = 0.5 * angle
+
+    # sin(angle / 2) / angle -> 1/2 as the angle goes to 0
+    small = angle < 1e-5
+    scale = torch.sin(half_angle) / torch.where(small, torch.ones_like(angle), angle)
+    scale = torch.where(small, 0.5 - angle * angle / 48.0, scale)
+    return torch.cat([exp_map * scale, torch.cos(half_angle)], dim=-1)
+
+
+def _quat_to_tan_norm(q):
+    # type: (Tensor) -> Tensor
+    # first and last column of the rotation matrix, i.e. the rotated x and z axes
+    x, y, z, w = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    tan = torch.stack([1.0 - 2.0 * (y * y + z * z),
+                       2.0 * (x * y + w * z),
+                       2.0 * (x * z - w * y)], dim=-1)
+    norm = torch.stack([2.0 * (x * z + w * y),
+                        2.0 * (y * z - w * x),
+                        1.0 - 2.0 * (x * x + y * y)], dim=-1)
+    return torch.cat([tan, norm], dim=-1)
+
+
+def _calc_heading_dir(q):
+    # type: (Tensor) -> Tuple[Tensor, Tensor]
+    # cos and sin of the heading, i.e. the direction of the rotated x axis on the xy plane
+    x, y, z, w = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    dir_x = 1.0 - 2.0 * (y * y + z * z)
+    dir_y = 2.0 * (x * y + w * z)
+    dir_len = torch.sqrt(dir_x * dir_x + dir_y * dir_y)
+
+    # atan2(0, 0) = 0, keep the same convention when the x axis points straight up or down
+    degenerate = dir_len < 1e-9
+    inv_len = 1.0 / torch.where(degenerate, torch.ones_like(dir_len), dir_len)
+    cos_h = torch.where(degenerate, torch.ones_like(dir_x), dir_x * inv_len)
+    sin_h = torch.where(degenerate, torch.zeros_like(dir_y), dir_y * inv_len)
+    return cos_h, sin_h
+
+
+def _calc_heading(q):
+    # type: (Tensor) -> Tensor
+    x, y, z, w = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    return torch.atan2(2.0 * (x * y + w * z), 1.0 - 2.0 * (y * y + z * z))
+
+
+def _calc_heading_quat(q):
+    # type: (Tensor) -> Tensor
+    half_heading = 0.5 * _calc_heading(q).unsqueeze(-1)
+    zeros = torch.zeros_like(half_heading)
+    return torch.cat([zeros, zeros, torch.sin(half_heading), torch.cos(half_heading)], dim=-1)
+
+
+def _calc_heading_quat_inv(q):
+    # type: (Tensor) -> Tensor
+    half_heading = 0.5 * _calc_heading(q).unsqueeze(-1)
+    zeros = torch.zeros_like(half_heading)
+    return torch.cat([zeros, zeros, -torch.sin(half_heading), torch.cos(half_heading)], dim=-1)
+
+
+def _heading_rotate_inv(q, v):
+    # type: (Tensor, Tensor) -> Tensor
+    # equivalent to quat_rotate(calc_heading_quat_inv(q), v), q must be broadcastable to v
+    cos_h, sin_h = _calc_heading_dir(q)
+    x = cos_h * v[..., 0] + sin_h * v[..., 1]
+    y = cos_h * v[..., 1] - sin_h * v[..., 0]
+    return torch.stack([x, y, v[..., 2]], dim=-1)
+
+
+quat_mul = torch.jit.script(_quat_mul)
+quat_conjugate = torch.jit.script(_quat_conjugate)
+quat_rotate = torch.jit.script(_quat_rotate)
+quat_rotate_inverse = torch.jit.script(_quat_rotate_inverse)
+quat_from_angle_axis = torch.jit.script(_quat_from_angle_axis)
+quat_unit = torch.jit.script(_quat_unit)
+slerp = torch.jit.script(_slerp)
+nlerp = torch.jit.script(_nlerp)
+quat_to_angle_axis = torch.jit.script(_quat_to_angle_axis)
+quat_to_exp_map = torch.jit.script(_quat_to_exp_map)
+exp_map_to_quat = torch.jit.script(_exp_map_to_quat)
+quat_to_tan_norm = torch.jit.script(_quat_to_tan_norm)
+calc_heading_dir = torch.jit.script(_calc_heading_dir)
+calc_heading = torch.jit.script(_calc_heading)
+calc_heading_quat = torch.jit.script(_calc_heading_quat)
+calc_heading_quat_inv = torch.jit.script(_calc_heading_quat_inv)
+heading_rotate_inv = torch.jit.script(_heading_rotate_inv)